@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Patient, IndividualTest, TestGroup, TestRequest, IndividualTestResult, TestGroupResult,DeviceResult
+from .models import Patient, IndividualTest, TestGroup, TestRequest, IndividualTestResult, TestGroupResult,DeviceResult, ReferenceInterval
 
 @admin.register(Patient)
 class PatientAdmin(admin.ModelAdmin):
@@ -20,6 +20,11 @@ class PatientAdmin(admin.ModelAdmin):
         })
     )
 
+class ReferenceIntervalInline(admin.TabularInline):
+    model = ReferenceInterval
+    extra = 0
+    fields = ['sex', 'age_from', 'age_to', 'low', 'high', 'critical_low', 'critical_high']
+
 @admin.register(IndividualTest)
 class IndividualTestAdmin(admin.ModelAdmin):
     list_display = ['name', 'app_name','subclass','unit','display_order', 'price', 'is_active']
@@ -28,6 +33,7 @@ class IndividualTestAdmin(admin.ModelAdmin):
     readonly_fields = ['id', 'created_at', 'updated_at']
     list_editable = ("display_order",'subclass','is_active')
     ordering = ("display_order",)
+    inlines = [ReferenceIntervalInline]
     fieldsets = (
         ('معلومات التحليل', {
             'fields': ('name','app_name', 'display_order', 'description','subclass', 'unit')
@@ -46,10 +52,17 @@ class IndividualTestAdmin(admin.ModelAdmin):
 
 @admin.register(TestGroup)
 class TestGroupAdmin(admin.ModelAdmin):
-    list_display = ['name', 'app_name', 'total_price', 'is_active', 'created_at']
+    list_display = ['name', 'app_name', 'total_price', 'individual_price_sum', 'is_active', 'created_at']
     list_filter = ['is_active', 'created_at']
     search_fields = ['name', 'description']
     filter_horizontal = ['tests']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_individual_price_sum()
+
+    @admin.display(description='مجموع الأسعار منفردة', ordering='individual_price_sum')
+    def individual_price_sum(self, obj):
+        return obj.individual_price_sum
     readonly_fields = ['id', 'created_at', 'updated_at']
     fieldsets = (
         ('معلومات المجموعة', {
@@ -79,11 +92,12 @@ class TestGroupResultInline(admin.TabularInline):
 
 @admin.register(TestRequest)
 class TestRequestAdmin(admin.ModelAdmin):
-    list_display = ['patient', 'status', 'request_date', 'get_total_price']
+    list_display = ['patient', 'status', 'completion_percentage', 'request_date', 'total_price', 'current_price']
+    list_select_related = ['patient']
     list_filter = ['status', 'request_date']
     search_fields = ['patient__full_name']
     filter_horizontal = ['individual_tests', 'test_groups']
-    readonly_fields = ['id', 'request_date', 'get_total_price']
+    readonly_fields = ['id', 'request_date', 'total_price']
     inlines = [IndividualTestResultInline, TestGroupResultInline]
     
     fieldsets = (
@@ -94,10 +108,18 @@ class TestRequestAdmin(admin.ModelAdmin):
             'fields': ('individual_tests', 'test_groups')
         }),
         ('معلومات النظام', {
-            'fields': ('id', 'request_date', 'get_total_price', 'created_by'),
+            'fields': ('id', 'request_date', 'total_price', 'created_by'),
             'classes': ('collapse',)
         })
     )
+
+    def get_queryset(self, request):
+        # ⚡️ السعر بالأسعار الحالية في نفس الاستعلام بدلاً من get_total_price لكل صف
+        return super().get_queryset(request).with_totals()
+
+    @admin.display(description='بالأسعار الحالية', ordering='tests_total')
+    def current_price(self, obj):
+        return obj.tests_total
     
     def save_model(self, request, obj, form, change):
         if not change:  # إذا كان طلب جديد
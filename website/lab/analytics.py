@@ -0,0 +1,149 @@
+"""تحليلات الإيراد وحجم العمل من جداول الملخص اليومي (lab/rollups.py)
+
+كل الأرقام SUM ... GROUP BY على جداول الملخص (صف لكل يوم × حالة/قسم/مستخدم)،
+فسنة كاملة لا تتجاوز بضعة آلاف صف بدل ملايين النتائج.
+
+- الإيراد: TestRequest.total_price (سعر الطلب وقت إنشائه) حسب يوم الطلب.
+- قيمة النتائج لكل قسم: مجموع سعر التحليل المسجل في كل نتيجة وقت إدخالها.
+- المستخدمون: الطلبات التي أنشأها (created_by) والنتائج التي أدخلها (entered_by).
+
+الأشهر المنتهية تُحفظ في الكاش ANALYTICS_CLOSED_PERIOD_TTL ثانية، ويُحذف الشهر
+من الكاش إذا تغيرت أرقام أحد أيامه (نتيجة متأخرة لطلب قديم مثلاً). الشهر الحالي
+وأجزاء الأشهر على أطراف الفترة تُحسب في كل مرة.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from .models import DailyDepartmentStat, DailyStatusStat, DailyUserStat, IndividualTest
+
+CACHE_PREFIX = 'lab:analytics:month:'
+
+ZERO = Decimal('0')
+
+
+def _ttl():
+    return getattr(settings, 'ANALYTICS_CLOSED_PERIOD_TTL', 7 * 24 * 3600)
+
+
+def _month_start(day):
+    return day.replace(day=1)
+
+
+def _next_month(day):
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def _cache_key(month):
+    return f'{CACHE_PREFIX}{month:%Y-%m}'
+
+
+def _empty_day(day):
+    return {'day': day, 'requests': 0, 'revenue': ZERO, 'results': 0, 'results_value': ZERO}
+
+
+def compute(start, end):
+    """ملخص الأيام من start إلى end (شاملة) مباشرة من جداول الملخص"""
+    days = Q(day__gte=start, day__lte=end)
+    daily = {}
+    for row in (
+        DailyStatusStat.objects.filter(days).order_by().values('day')
+        .annotate(requests=Sum('requests'), revenue=Sum('revenue'))
+    ):
+        entry = daily.setdefault(row['day'], _empty_day(row['day']))
+        entry['requests'], entry['revenue'] = row['requests'], row['revenue']
+    for row in (
+        DailyDepartmentStat.objects.filter(days).order_by().values('day')
+        .annotate(results=Sum('results'), value=Sum('revenue'))
+    ):
+        entry = daily.setdefault(row['day'], _empty_day(row['day']))
+        entry['results'], entry['results_value'] = row['results'], row['value']
+
+    departments = {
+        row['department']: {'results': row['results'], 'results_value': row['value']}
+        for row in DailyDepartmentStat.objects.filter(days).order_by().values('department')
+        .annotate(results=Sum('results'), value=Sum('revenue'))
+    }
+    users = {
+        row['user']: {
+            'username': row['user__username'], 'requests': row['requests'],
+            'revenue': row['revenue'], 'results': row['results'],
+        }
+        for row in DailyUserStat.objects.filter(days).order_by().values('user', 'user__username')
+        .annotate(requests=Sum('requests'), revenue=Sum('revenue'), results=Sum('results'))
+    }
+    return {'days': [daily[day] for day in sorted(daily)], 'departments': departments, 'users': users}
+
+
+def _closed_month(month):
+    key = _cache_key(month)
+    data = cache.get(key)
+    if data is None:
+        data = compute(month, _next_month(month) - timedelta(days=1))
+        cache.set(key, data, _ttl())
+    return data
+
+
+def _merge(parts):
+    days, departments, users = [], {}, {}
+    for part in parts:
+        days.extend(part['days'])
+        for department, row in part['departments'].items():
+            total = departments.setdefault(department, {'results': 0, 'results_value': ZERO})
+            total['results'] += row['results']
+            total['results_value'] += row['results_value']
+        for user_id, row in part['users'].items():
+            total = users.setdefault(user_id, {'username': row['username'], 'requests': 0, 'revenue': ZERO, 'results': 0})
+            for field in ('requests', 'revenue', 'results'):
+                total[field] += row[field]
+    return days, departments, users
+
+
+def summary(start, end):
+    """الإيراد وحجم العمل للفترة: المجاميع، ولكل يوم، ولكل قسم، ولكل مستخدم"""
+    current_month = _month_start(timezone.localdate())
+    parts = []
+    cursor = start
+    while cursor <= end:
+        month_end = _next_month(cursor) - timedelta(days=1)
+        segment_end = min(month_end, end)
+        if cursor.day == 1 and segment_end == month_end and cursor < current_month:
+            parts.append(_closed_month(cursor))
+        else:
+            parts.append(compute(cursor, segment_end))
+        cursor = segment_end + timedelta(days=1)
+
+    days, departments, users = _merge(parts)
+    department_names = dict(IndividualTest.DEPARTMENT)
+    return {
+        'start': start,
+        'end': end,
+        'totals': {
+            'requests': sum(day['requests'] for day in days),
+            'revenue': sum((day['revenue'] for day in days), ZERO),
+            'results': sum(day['results'] for day in days),
+            'results_value': sum((day['results_value'] for day in days), ZERO),
+        },
+        'days': days,
+        'departments': sorted(
+            ({'department': department, 'name': department_names.get(department, department), **row}
+             for department, row in departments.items()),
+            key=lambda row: row['results_value'], reverse=True,
+        ),
+        'users': sorted(
+            ({'user_id': user_id, **row} for user_id, row in users.items()),
+            key=lambda row: (row['revenue'], row['results']), reverse=True,
+        ),
+    }
+
+
+def invalidate_days(days):
+    """حذف الأشهر المنتهية التي تغيرت أرقام أحد أيامها من الكاش"""
+    current_month = _month_start(timezone.localdate())
+    months = {_month_start(day) for day in days if day < current_month}
+    if months:
+        cache.delete_many([_cache_key(month) for month in months])
@@ -4,4 +4,7 @@ from django.apps import AppConfig
 class LabConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'lab'
+
+    def ready(self):
+        from . import signals  # noqa: F401
     
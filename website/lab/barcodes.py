@@ -0,0 +1,301 @@
+"""توليد صور الباركود (Code128) و QR للملصقات مع كاش في الذاكرة وعلى القرص
+
+كل صورة مفتاحها (payload, scale, writer): باركود المريض لا يتغير، و QR يتغير
+فقط عند تعديل اسم المريض أو رقم هاتفه (فيتغير الـ payload والمفتاح، وتُحذف
+النسخة القديمة عن طريق signals). صفحات الملصقات تعرض الصور كروابط <img>
+بدلاً من base64 داخل الصفحة، فيخزنها المتصفح أيضاً.
+
+نص Code128 يأتي من الرابط، فيُقبل فقط نص ASCII قصير، وعدد ملفات الكاش على القرص
+محدود بـ BARCODE_CACHE_MAX_FILES (تُحذف الأقدم عند تجاوزه).
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+
+# writer -> (الامتداد، نوع المحتوى)
+WRITERS = {
+    'png': ('png', 'image/png'),
+    'svg': ('svg', 'image/svg+xml'),
+}
+
+MEMORY_CACHE_SIZE = 512
+
+# أقصى طول لنص Code128 (باركود المريض yymmdd + رقم تسلسلي أقصر بكثير)
+CODE128_MAX_LENGTH = 32
+
+# فحص عدد ملفات الكاش مرة كل هذا العدد من الصور الجديدة
+PRUNE_EVERY = 100
+
+# عدد الخيوط لتوليد باركودات ورقة الملصقات
+LABEL_SHEET_WORKERS = 8
+
+logger = logging.getLogger(__name__)
+
+_memory = OrderedDict()
+_memory_lock = threading.Lock()
+_stored = 0
+
+
+def cache_dir():
+    return Path(settings.BARCODE_CACHE_DIR)
+
+
+def _max_files():
+    return getattr(settings, 'BARCODE_CACHE_MAX_FILES', 20000)
+
+
+def symbol_key(payload, scale, writer):
+    return hashlib.sha256(f'{writer}|{scale}|{payload}'.encode('utf-8')).hexdigest()[:24]
+
+
+def _render_qr(payload, scale):
+    import qrcode
+
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10 * scale,
+        border=4,
+    )
+    qr.add_data(payload)
+    qr.make(fit=True)
+
+    buffer = BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def _render_code128(payload, scale):
+    """باركود Code128 بصيغة SVG عالية الوضوح بدون نص أسفل"""
+    import barcode
+    from barcode.writer import SVGWriter
+
+    code128 = barcode.get("code128", payload, writer=SVGWriter())
+    options = {
+        "module_width": 0.3 * scale,    # عرض كل خط
+        "module_height": 13 * scale,    # ارتفاع الباركود
+        "font_size": 14 * scale,        # حجم النص أسفل الباركود
+        "text_distance": 3 * scale,     # المسافة بين الباركود والنص
+        "quiet_zone": 2 * scale,        # الهامش حول الباركود
+        "write_text": False  # أهم شيء: إزالة النص أسفل الباركود
+    }
+    buffer = BytesIO()
+    code128.write(buffer, options)
+    return buffer.getvalue()
+
+
+def _file_path(prefix, key, writer):
+    return cache_dir() / f'{prefix}-{key}.{WRITERS[writer][0]}'
+
+
+def _remember(key, data):
+    with _memory_lock:
+        _memory[key] = data
+        _memory.move_to_end(key)
+        while len(_memory) > MEMORY_CACHE_SIZE:
+            _memory.popitem(last=False)
+
+
+def _store(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            output.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def prune_cache(max_files=None):
+    """حذف أقدم ملفات الكاش على القرص حتى لا يتجاوز عددها max_files"""
+    max_files = _max_files() if max_files is None else max_files
+    files = []
+    for path in cache_dir().glob('*'):
+        if path.suffix == '.tmp':
+            continue
+        try:
+            files.append((path.stat().st_mtime, path))
+        except FileNotFoundError:
+            continue
+    if len(files) <= max_files:
+        return 0
+    files.sort()
+    for _, path in files[:len(files) - max_files]:
+        path.unlink(missing_ok=True)
+    return len(files) - max_files
+
+
+def get_symbol(payload, scale, writer, prefix, render):
+    """الصورة من الذاكرة، ثم من القرص، وإلا تُولَّد وتُحفظ في الاثنين"""
+    key = symbol_key(payload, scale, writer)
+    with _memory_lock:
+        data = _memory.get(key)
+        if data is not None:
+            _memory.move_to_end(key)
+            return data
+
+    path = _file_path(prefix, key, writer)
+    try:
+        data = path.read_bytes()
+    except FileNotFoundError:
+        data = render(payload, scale)
+        _store(path, data)
+        _count_store()
+    _remember(key, data)
+    return data
+
+
+def _count_store():
+    global _stored
+    with _memory_lock:
+        _stored += 1
+        due = _stored % PRUNE_EVERY == 0
+    if due:
+        prune_cache()
+
+
+# ------------------------------------------------------------------ QR
+
+
+def patient_qr_payload(patient):
+    """محتوى QR للمريض (يتغير عند تعديل الاسم أو الهاتف)"""
+    return json.dumps({
+        'patient_id': str(patient.id),
+        'name': patient.full_name,
+        'barcode': patient.barcode,
+        'phone': patient.phone_number,
+        'type': 'PATIENT'
+    }, ensure_ascii=False)
+
+
+def _qr_prefix(patient_id):
+    return f'qr-p{patient_id}'
+
+
+def patient_qr_png(patient, scale=1):
+    return get_symbol(patient_qr_payload(patient), scale, 'png', _qr_prefix(patient.id), _render_qr)
+
+
+def patient_qr_url(patient, scale=1):
+    key = symbol_key(patient_qr_payload(patient), scale, 'png')
+    return f"{reverse('patient_qr_image', args=[patient.id])}?scale={scale}&v={key}"
+
+
+def invalidate_patient(patient):
+    """حذف صور QR القديمة للمريض (بعد تعديل الاسم أو الهاتف)"""
+    current = {symbol_key(patient_qr_payload(patient), scale, 'png') for scale in (1, 2)}
+    for path in cache_dir().glob(f'{_qr_prefix(patient.id)}-*'):
+        key = path.stem.rsplit('-', 1)[-1]
+        if key not in current:
+            path.unlink(missing_ok=True)
+            with _memory_lock:
+                _memory.pop(key, None)
+
+
+# ------------------------------------------------------------------ Code128
+
+
+def is_code128_text(text):
+    """نص قصير من حروف ASCII القابلة للطباعة (ما يقبله Code128 بدون أحرف تحكم)"""
+    return 0 < len(text) <= CODE128_MAX_LENGTH and all(' ' <= char <= '~' for char in text)
+
+
+def code128_svg(text, scale=2):
+    if not is_code128_text(text):
+        raise ValueError(f'نص باركود غير صالح: {text!r}')
+    return get_symbol(text, scale, 'svg', 'code128', _render_code128)
+
+
+def code128_url(text, scale=2):
+    return f"{reverse('code128_image', args=[text])}?scale={scale}"
+
+
+def generate_barcode_128(text, scale=2):
+    """توليد باركود خطي Code128 بدون نص أسفل (SVG كنص)"""
+    try:
+        return code128_svg(text, scale).decode("utf-8")
+    except Exception:
+        logger.warning('code128 generation failed for %r', text, exc_info=True)
+        return None
+
+
+# ------------------------------------------------------------------ بيانات الملصق
+
+
+def generate_patient_barcode_label_data(patient, test_request=None):
+    """تحضير بيانات ملصق الباركود (روابط صور QR و Code128 من الكاش)"""
+    patient_data = {
+        'id': patient.id,
+        'full_name': patient.full_name,
+        'barcode': patient.barcode,
+        'phone_number': patient.phone_number,
+        'age': patient.age,
+        'gender_display': patient.get_gender_display(),
+        'created_at': patient.created_at.strftime('%Y-%m-%d')
+    }
+
+    test_info = None
+    if test_request:
+        individual_tests = list(test_request.individual_tests.values_list('app_name', flat=True))
+        test_groups = list(test_request.test_groups.values_list('app_name', flat=True))
+        test_info = {
+            'request_id': str(test_request.id),
+            'request_date': test_request.request_date.strftime('%Y-%m-%d %H:%M'),
+            'status': test_request.get_status_display(),
+            'individual_tests': individual_tests,
+            'test_groups': test_groups,
+            'notes': test_request.notes or ''
+        }
+
+    return {
+        'patient': patient_data,
+        'qr_code_url': patient_qr_url(patient),
+        'linear_barcode_url': code128_url(patient.barcode) if patient.barcode else None,
+        'test_info': test_info,
+        'generated_at': timezone.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+
+def build_label_sheet(test_requests, scale=2):
+    """ملصق لكل أنبوب عينة: (طلب التحليل، app_name) من التحاليل الفردية والمجموعات
+
+    test_requests يجب أن تكون مع select_related('patient') و prefetch_related
+    للتحاليل والمجموعات. الباركودات غير الموجودة في الكاش تُولد بالتوازي.
+    """
+    labels = []
+    for test_request in test_requests:
+        patient = test_request.patient
+        app_names = dict.fromkeys(
+            [test.app_name for test in test_request.individual_tests.all()]
+            + [group.app_name for group in test_request.test_groups.all()]
+        )
+        for app_name in app_names:
+            labels.append({
+                'request_id': test_request.id,
+                'app_name': app_name,
+                'patient_name': patient.full_name,
+                'barcode': patient.barcode,
+                'request_date': test_request.request_date,
+            })
+
+    # ⚡️ كل مريض له باركود واحد لكل أنابيبه، فنولد كل نص مرة واحدة فقط
+    texts = list(dict.fromkeys(label['barcode'] for label in labels if label['barcode']))
+    with ThreadPoolExecutor(max_workers=LABEL_SHEET_WORKERS) as pool:
+        symbols = dict(zip(texts, pool.map(lambda text: generate_barcode_128(text, scale), texts)))
+
+    for label in labels:
+        label['barcode_svg'] = symbols.get(label['barcode'])
+    return labels
@@ -0,0 +1,155 @@
+"""عدادات اكتمال طلبات التحاليل (النتائج المطلوبة / المدخلة / النسبة)
+
+يوفر أيضاً deferred_completion: وحدة عمل تؤجل إعادة حساب حالة الطلبات
+أثناء الحفظ الجماعي للنتائج، ثم تعيد حساب كل طلب متأثر مرة واحدة بعد الـ commit،
+و create_results: bulk_create للنتائج الجديدة يتحمل إدخال نفس النتيجة من مسار آخر.
+"""
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count
+
+from .models import IndividualTestResult, TestGroupResult, TestRequest
+
+_local = threading.local()
+
+
+class CompletionUnitOfWork:
+    """تجميع الطلبات المتأثرة وفروقات عدد النتائج المدخلة حتى نهاية وحدة العمل"""
+
+    def __init__(self):
+        self.request_ids = set()
+        self.entered_deltas = Counter()
+
+    def touch(self, request_id):
+        self.request_ids.add(request_id)
+
+    def add_entered(self, request_id, delta):
+        self.request_ids.add(request_id)
+        self.entered_deltas[request_id] += delta
+
+    def flush_counters(self):
+        """تطبيق فروقات العدادات (UPDATE واحد لكل طلب) داخل نفس المعاملة"""
+        for request_id, delta in self.entered_deltas.items():
+            if delta:
+                TestRequest(pk=request_id).adjust_entered_results(delta)
+        self.entered_deltas.clear()
+
+    def recompute_statuses(self):
+        """إعادة حساب حالة كل طلب متأثر مرة واحدة"""
+        for test_request in TestRequest.objects.filter(pk__in=self.request_ids):
+            test_request.check_completion_status()
+
+
+def create_results(results):
+    """bulk_create لنتائج IndividualTestResult جديدة وإرجاع (ما أُنشئ، ما كان موجوداً)
+
+    إذا أُدخلت نتيجة لنفس (الطلب، التحليل) من مسار آخر بعد قراءة النتائج الموجودة
+    (unique_together)، تُقرأ الصفوف الموجودة ويُعاد كائن النتيجة الجديد برقمها
+    (pk) ضمن القائمة الثانية ليحدّثها المستدعي بـ bulk_update بدل فشل الحفظ كاملاً.
+    """
+    results = list(results)
+    try:
+        with transaction.atomic():
+            IndividualTestResult.objects.bulk_create(results)
+        return results, []
+    except IntegrityError:
+        pass
+
+    existing = {
+        (request_id, test_id): result_id
+        for request_id, test_id, result_id in IndividualTestResult.objects.filter(
+            test_request_id__in={result.test_request_id for result in results},
+            individual_test_id__in={result.individual_test_id for result in results},
+        ).values_list('test_request_id', 'individual_test_id', 'id')
+    }
+    created, conflicts = [], []
+    for result in results:
+        result_id = existing.get((result.test_request_id, result.individual_test_id))
+        if result_id is None:
+            created.append(result)
+            continue
+        result.pk = result_id
+        result._state.adding = False
+        conflicts.append(result)
+    IndividualTestResult.objects.bulk_create(created)
+    return created, conflicts
+
+
+def current_unit_of_work():
+    return getattr(_local, 'unit_of_work', None)
+
+
+@contextmanager
+def deferred_completion():
+    """تأجيل إعادة حساب حالة الطلبات حتى الـ commit (مرة واحدة لكل طلب)
+
+        with deferred_completion():
+            for ...:
+                result.save()   # لا يعيد حساب حالة الطلب هنا
+    """
+    if current_unit_of_work() is not None:
+        # وحدة عمل خارجية قائمة: نستخدمها نفسها
+        with transaction.atomic():
+            yield current_unit_of_work()
+        return
+
+    work = CompletionUnitOfWork()
+    _local.unit_of_work = work
+    try:
+        with transaction.atomic():
+            yield work
+            work.flush_counters()
+            transaction.on_commit(work.recompute_statuses)
+    finally:
+        _local.unit_of_work = None
+
+
+def schedule_completion_check(test_request):
+    """إعادة حساب حالة الطلب فوراً، أو تأجيلها إذا كنا داخل deferred_completion"""
+    work = current_unit_of_work()
+    if work is None:
+        test_request.check_completion_status()
+    else:
+        work.touch(test_request.pk)
+
+
+def record_entered_results(request_id, delta):
+    """تعديل عدد النتائج المدخلة للطلب، فوراً أو مجمّعاً داخل deferred_completion"""
+    work = current_unit_of_work()
+    if work is None:
+        TestRequest(pk=request_id).adjust_entered_results(delta)
+    else:
+        work.add_entered(request_id, delta)
+
+
+def _counts_by_request(queryset, request_field, count_field='pk'):
+    return dict(
+        queryset.order_by().values_list(request_field).annotate(c=Count(count_field)).values_list(request_field, 'c')
+    )
+
+
+def rebuild_completion_counters(batch_size=1000):
+    """إعادة بناء عدادات الاكتمال لكل الطلبات بعدد ثابت من الاستعلامات المجمعة"""
+    individual_tests = _counts_by_request(TestRequest.individual_tests.through.objects, 'testrequest_id')
+    group_tests = _counts_by_request(TestRequest.test_groups.through.objects, 'testrequest_id', 'testgroup__tests')
+    individual_results = _counts_by_request(IndividualTestResult.objects, 'test_request_id')
+    group_results = _counts_by_request(TestGroupResult.objects, 'test_request_id')
+
+    changed = []
+    updated = 0
+    fields = ['expected_results_count', 'entered_results_count', 'completion_percentage']
+    for test_request in TestRequest.objects.only('id', *fields).iterator(chunk_size=batch_size):
+        test_request.expected_results_count = individual_tests.get(test_request.id, 0) + group_tests.get(test_request.id, 0)
+        test_request.entered_results_count = individual_results.get(test_request.id, 0) + group_results.get(test_request.id, 0)
+        test_request.completion_percentage = test_request.get_completion_percentage()
+        changed.append(test_request)
+        if len(changed) >= batch_size:
+            TestRequest.objects.bulk_update(changed, fields)
+            updated += len(changed)
+            changed = []
+
+    TestRequest.objects.bulk_update(changed, fields)
+    return updated + len(changed)
@@ -0,0 +1,75 @@
+"""إحصائيات الصفحة الرئيسية (عدد المرضى والطلبات حسب الحالة) مع كاش قصير
+
+الأرقام تُحسب باستعلام واحد (الطلبات مجمعة حسب الحالة مع عدد المرضى كـ
+subquery) وتُحفظ في الكاش DASHBOARD_STATS_TTL ثانية. إضافة أو حذف مريض أو طلب
+تعدل الأرقام المحفوظة مباشرة، وتغيير حالة طلب يحذفها لتُحسب من جديد.
+التعديلات عن طريق update() لا ترسل signals، فتظهر بعد انتهاء مدة الكاش.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, IntegerField, Subquery, Value
+from django.utils import timezone
+
+from .models import Patient, TestRequest
+
+CACHE_KEY = 'lab:dashboard:stats'
+
+
+def _ttl():
+    return getattr(settings, 'DASHBOARD_STATS_TTL', 30)
+
+
+def compute_stats():
+    patients = (
+        Patient.objects.order_by().annotate(one=Value(1)).values('one')
+        .annotate(total=Count('id')).values('total')
+    )
+    rows = (
+        TestRequest.objects.order_by().values('status')
+        .annotate(requests=Count('id'), patients=Subquery(patients, output_field=IntegerField()))
+    )
+    by_status = {status: 0 for status, _ in TestRequest.STATUS_CHOICES}
+    total_patients = None
+    for row in rows:
+        by_status[row['status']] = row['requests']
+        total_patients = row['patients']
+    if total_patients is None:
+        # لا توجد طلبات بعد
+        total_patients = Patient.objects.count()
+
+    return {
+        'total_patients': total_patients or 0,
+        'total_requests': sum(by_status.values()),
+        'by_status': by_status,
+        'generated_at': timezone.now().isoformat(),
+    }
+
+
+def get_stats():
+    stats = cache.get(CACHE_KEY)
+    if stats is None:
+        stats = compute_stats()
+        stats['expires_at'] = timezone.now().timestamp() + _ttl()
+        cache.set(CACHE_KEY, stats, _ttl())
+    return stats
+
+
+def invalidate():
+    cache.delete(CACHE_KEY)
+
+
+def adjust(patients=0, status=None, requests=0):
+    """تعديل الأرقام المحفوظة بدون إعادة الحساب (إن وُجدت في الكاش)"""
+    stats = cache.get(CACHE_KEY)
+    if stats is None:
+        return
+    # نفس وقت الانتهاء الأصلي، حتى لا يمنع التعديل المستمر إعادة الحساب
+    remaining = stats['expires_at'] - timezone.now().timestamp()
+    if remaining <= 0:
+        invalidate()
+        return
+    stats['total_patients'] = max(stats['total_patients'] + patients, 0)
+    if status is not None:
+        stats['by_status'][status] = max(stats['by_status'].get(status, 0) + requests, 0)
+        stats['total_requests'] = sum(stats['by_status'].values())
+    cache.set(CACHE_KEY, stats, remaining)
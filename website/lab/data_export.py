@@ -0,0 +1,169 @@
+"""تصدير النتائج والطلبات إلى CSV (أو Excel) لصفحة التقارير
+
+الصفوف تُقرأ كـ values_list على دفعات حسب رقم الصف (id > آخر رقم LIMIT n)
+بدلاً من QuerySet.iterator: مشغل MySQL يحمّل نتيجة الاستعلام كاملة في الذاكرة
+حتى مع iterator، أما الدفعات فتبقي الذاكرة ثابتة مهما كان عدد الصفوف.
+
+- CSV يُرسل أثناء القراءة (StreamingHttpResponse) مع BOM حتى يفتحه Excel بالعربي.
+- XLSX اختياري (openpyxl): يُكتب بوضع write_only إلى ملف مؤقت ثم يُرسل.
+"""
+import csv
+import tempfile
+
+from django.utils import timezone
+
+from .models import IndividualTest, IndividualTestResult, TestRequest
+from .rollups import day_bounds
+
+EXPORT_BATCH_SIZE = 2000
+
+# حد Excel لعدد الصفوف في الورقة (مع صف العناوين)
+XLSX_MAX_ROWS = 1048576
+
+_DEPARTMENTS = dict(IndividualTest.DEPARTMENT)
+
+
+class ExportUnavailable(Exception):
+    """صيغة التصدير تحتاج مكتبة غير مثبتة"""
+
+
+def _format_datetime(value):
+    return timezone.localtime(value).strftime('%Y-%m-%d %H:%M') if value else ''
+
+
+class ResultExport:
+    """نتائج التحاليل الفردية مع المريض والتحليل"""
+    name = 'results'
+    model = IndividualTestResult
+    headers = [
+        'رقم النتيجة', 'رقم الطلب', 'تاريخ الطلب', 'الباركود', 'اسم المريض', 'التحليل', 'القسم',
+        'القيمة', 'الوحدة', 'الحالة', 'تاريخ النتيجة', 'أدخل بواسطة',
+    ]
+    fields = [
+        'id', 'test_request_id', 'test_request__request_date', 'test_request__patient_id',
+        'test_request__patient__full_name', 'individual_test__name', 'individual_test__description',
+        'value', 'individual_test__unit', 'status', 'result_date', 'entered_by__username',
+    ]
+    statuses = dict(IndividualTestResult.STATUS_CHOICES)
+    date_field = 'test_request__request_date'
+
+    def filter(self, queryset, department=None, status=None):
+        if department:
+            queryset = queryset.filter(individual_test__description=department)
+        if status:
+            queryset = queryset.filter(status=status)
+        return queryset
+
+    def format_row(self, row):
+        row = list(row)
+        row[2] = _format_datetime(row[2])
+        row[6] = _DEPARTMENTS.get(row[6], row[6])
+        row[9] = self.statuses.get(row[9], row[9])
+        row[10] = _format_datetime(row[10])
+        return row
+
+
+class RequestExport:
+    """طلبات التحاليل مع المريض والسعر ونسبة الاكتمال"""
+    name = 'requests'
+    model = TestRequest
+    headers = [
+        'رقم الطلب', 'تاريخ الطلب', 'الباركود', 'اسم المريض', 'الحالة', 'نسبة الاكتمال', 'السعر الإجمالي',
+        'أنشئ بواسطة',
+    ]
+    fields = [
+        'id', 'request_date', 'patient_id', 'patient__full_name', 'status', 'completion_percentage',
+        'total_price', 'created_by__username',
+    ]
+    statuses = dict(TestRequest.STATUS_CHOICES)
+    date_field = 'request_date'
+
+    def filter(self, queryset, department=None, status=None):
+        if department:
+            # طلبات فيها تحليل فردي من القسم
+            queryset = queryset.filter(individual_tests__description=department).distinct()
+        if status:
+            queryset = queryset.filter(status=status)
+        return queryset
+
+    def format_row(self, row):
+        row = list(row)
+        row[1] = _format_datetime(row[1])
+        row[4] = self.statuses.get(row[4], row[4])
+        return row
+
+
+EXPORTS = {export.name: export for export in (ResultExport(), RequestExport())}
+
+
+def export_queryset(export, date_from=None, date_to=None, department=None, status=None):
+    queryset = export.model.objects.all()
+    # حدود الفترة كـ datetime (فهرس request_date)
+    if date_from:
+        queryset = queryset.filter(**{f'{export.date_field}__gte': day_bounds(date_from)[0]})
+    if date_to:
+        queryset = queryset.filter(**{f'{export.date_field}__lt': day_bounds(date_to)[1]})
+    return export.filter(queryset, department, status)
+
+
+def iter_rows(export, queryset, batch_size=EXPORT_BATCH_SIZE):
+    """صفوف منسقة على دفعات بترتيب id"""
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id).order_by('id').values_list(*export.fields)[:batch_size])
+        if not batch:
+            return
+        for row in batch:
+            yield export.format_row(row)
+        last_id = batch[-1][0]
+
+
+class _Echo:
+    """ملف وهمي: csv.writer يكتب فيه فيعيد السطر بدل تخزينه"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(export, queryset, batch_size=EXPORT_BATCH_SIZE):
+    """أجزاء CSV (BOM + العناوين ثم دفعة أسطر في كل جزء)"""
+    writer = csv.writer(_Echo())
+    yield '\ufeff' + writer.writerow(export.headers)
+    lines = []
+    for row in iter_rows(export, queryset, batch_size):
+        lines.append(writer.writerow(row))
+        if len(lines) >= batch_size:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+def write_xlsx(export, queryset, batch_size=EXPORT_BATCH_SIZE):
+    """ملف Excel مؤقت (مفتوح للقراءة من البداية) يُحذف تلقائياً عند إغلاقه"""
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise ExportUnavailable('تصدير Excel يحتاج مكتبة openpyxl')
+
+    workbook = Workbook(write_only=True)
+    sheet, rows = None, XLSX_MAX_ROWS
+    for row in iter_rows(export, queryset, batch_size):
+        if rows >= XLSX_MAX_ROWS:
+            # ورقة جديدة كل مليون صف تقريباً
+            sheet = workbook.create_sheet(f'{export.name}_{len(workbook.worksheets) + 1}')
+            sheet.append(export.headers)
+            rows = 1
+        sheet.append(row)
+        rows += 1
+    if sheet is None:
+        workbook.create_sheet(export.name).append(export.headers)
+
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+
+def export_filename(export, extension):
+    return f"{export.name}_{timezone.localtime():%Y%m%d_%H%M}.{extension}"
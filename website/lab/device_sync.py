@@ -0,0 +1,171 @@
+"""دمج نتائج الأجهزة (DeviceResult) في نتائج التحاليل (IndividualTestResult)
+
+هذا الدمج لا يعمل ضمن طلبات الصفحات، بل يتولاه عامل الاستيراد
+(python manage.py run_device_ingest) أو زر "تحديث النتائج" يدوياً.
+"""
+import logging
+import time
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .completion import create_results, deferred_completion
+from .models import DeviceResult, IndividualTest, IndividualTestResult, Patient, TestRequest
+from .reference_ranges import patient_age, prime as prime_reference_ranges
+from .rollups import record_results
+
+logger = logging.getLogger(__name__)
+
+# مفتاح آخر قياسات لدورة الاستيراد (عمق الطابور وزمن الدمج)
+METRICS_CACHE_KEY = 'lab:device_ingest:metrics'
+
+
+def pending_device_results_count():
+    """عدد نتائج الأجهزة النشطة التي تنتظر الدمج (عمق الطابور)"""
+    return DeviceResult.objects.filter(is_active=True).count()
+
+
+def _latest_requests(rows):
+    """ربط كل (باركود المريض، التحليل) بأحدث طلب تحليل يحتويه، مباشرة أو ضمن مجموعة"""
+    barcodes = {row.barcode_id for row in rows}
+    test_ids = {row.test_id for row in rows}
+    latest = {}
+
+    # ✅ الطلبات التي تحتوي التحليل ضمن individual_tests
+    direct = TestRequest.objects.filter(
+        patient_id__in=barcodes, individual_tests__in=test_ids
+    ).values_list('patient_id', 'individual_tests', 'id').order_by('-request_date', '-id')
+    for barcode, test_id, request_id in direct:
+        latest.setdefault((barcode, test_id), request_id)
+
+    # ✅ إذا لم يوجد في individual_tests، نبحث في test_groups
+    missing = {(row.barcode_id, row.test_id) for row in rows} - latest.keys()
+    if missing:
+        via_groups = TestRequest.objects.filter(
+            patient_id__in={barcode for barcode, _ in missing},
+            test_groups__tests__in={test_id for _, test_id in missing},
+        ).values_list('patient_id', 'test_groups__tests', 'id').order_by('-request_date', '-id')
+        for barcode, test_id, request_id in via_groups:
+            if (barcode, test_id) in missing:
+                latest.setdefault((barcode, test_id), request_id)
+
+    return latest
+
+
+def merge_device_results(user=None):
+    """نقل نتائج الأجهزة النشطة إلى IndividualTestResult دفعة واحدة وإرجاع عدد النتائج المحدثة"""
+    with deferred_completion() as work:
+        rows = list(
+            DeviceResult.objects.select_for_update()
+            .filter(is_active=True)
+            .only('id', 'barcode_id', 'test_id', 'result', 'insert_datetime')
+            .order_by('insert_datetime')
+        )
+        if not rows:
+            return 0
+
+        latest = _latest_requests(rows)
+        request_ids = set(latest.values())
+        test_ids = {row.test_id for row in rows}
+
+        tests = IndividualTest.objects.in_bulk(test_ids)
+        patients = {
+            patient.barcode: (patient.gender, patient_age(patient))
+            for patient in Patient.objects.filter(barcode__in={row.barcode_id for row in rows})
+            .only('barcode', 'gender', 'age', 'date_of_birth')
+        }
+        prime_reference_ranges(tests.values())
+        existing = {
+            (result.test_request_id, result.individual_test_id): result
+            for result in IndividualTestResult.objects.filter(
+                test_request_id__in=request_ids, individual_test_id__in=test_ids
+            )
+        }
+
+        now = timezone.now()
+        to_create, to_update = {}, {}
+        processed_ids = []
+        patients_by_key = {}
+
+        for row in rows:
+            request_id = latest.get((row.barcode_id, row.test_id))
+            if request_id is None:
+                continue  # إذا لا يوجد طلب تحليل، تخطي (تبقى النتيجة نشطة)
+
+            key = (request_id, row.test_id)
+            patients_by_key[key] = patients.get(row.barcode_id, (None, None))
+            result = to_create.get(key) or existing.get(key)
+
+            if result is None:
+                # إدخال نتيجة جديدة
+                to_create[key] = IndividualTestResult(
+                    test_request_id=request_id, individual_test_id=row.test_id, price=tests[row.test_id].price,
+                    value=str(row.result), result_date=row.insert_datetime, entered_by=user,
+                )
+            elif key in to_create or result.result_date <= row.insert_datetime:
+                # تحديث فقط إذا كانت النتيجة الجديدة أحدث
+                result.value = str(row.result)
+                result.result_date = row.insert_datetime
+                result.entered_by = user
+                result.updated_at = now
+                if key not in to_create:
+                    to_update[key] = result
+
+            processed_ids.append(row.id)
+
+        # تحديد حالة كل نتيجة في الذاكرة قبل الكتابة
+        for key, result in list(to_create.items()) + list(to_update.items()):
+            result.individual_test = tests[key[1]]
+            result.evaluate_status(*patients_by_key[key])
+
+        # نتيجة أُدخلت يدوياً لنفس (الطلب، التحليل) بعد قراءة existing تُحدَّث بقيمة الجهاز
+        created, conflicts = create_results(to_create.values())
+        for result in conflicts:
+            result.updated_at = now
+            key = (result.test_request_id, result.individual_test_id)
+            to_update[key] = result
+            del to_create[key]
+        IndividualTestResult.objects.bulk_update(
+            to_update.values(), ['value', 'result_date', 'entered_by', 'status', 'updated_at']
+        )
+
+        # ✅ تعطيل النتائج المعالجة في DeviceResult
+        DeviceResult.objects.filter(id__in=processed_ids).update(is_active=False)
+
+        # bulk_create لا يرسل post_save، لذا نسجل النتائج الجديدة في وحدة العمل
+        # (حالة كل طلب متأثر تُحسب مرة واحدة بعد الـ commit)
+        for request_id, _ in to_create:
+            work.add_entered(request_id, 1)
+        record_results(created)
+        for request_id, _ in to_update:
+            work.touch(request_id)
+
+    return len(to_create) + len(to_update)
+
+
+def run_ingest_cycle(user=None):
+    """تنفيذ دورة دمج واحدة وتسجيل عمق الطابور وزمن الدمج"""
+    started = time.monotonic()
+    queue_depth = pending_device_results_count()
+    merged_count = merge_device_results(user) if queue_depth else 0
+    latency_ms = round((time.monotonic() - started) * 1000, 1)
+
+    metrics = {
+        'queue_depth': queue_depth,
+        'merged_count': merged_count,
+        'merge_latency_ms': latency_ms,
+        'finished_at': timezone.now().isoformat(),
+    }
+    cache.set(METRICS_CACHE_KEY, metrics, None)
+
+    if queue_depth:
+        logger.info(
+            'device ingest: queue_depth=%s merged=%s latency_ms=%s',
+            queue_depth, merged_count, latency_ms,
+        )
+    return metrics
+
+
+def get_ingest_metrics():
+    """آخر قياسات مسجلة لعامل الاستيراد"""
+    return cache.get(METRICS_CACHE_KEY)
@@ -1,6 +1,11 @@
 from django import forms
+from django.db.models import Prefetch
 from django.forms import formset_factory
+from django.utils import timezone
 from .models import Patient, TestRequest, IndividualTest, TestGroup, IndividualTestResult, TestGroupResult
+from .completion import create_results, deferred_completion
+from .reference_ranges import patient_age, prime as prime_reference_ranges
+from .rollups import record_results
 
 class PatientForm(forms.ModelForm):
     class Meta:
@@ -172,6 +177,61 @@ class IndividualTestResultForm(forms.ModelForm):
         
 #         return saved_results
 
+
+def _bulk_save_results(test_request, entries, user):
+    """حفظ نتائج عدة تحاليل لطلب واحد بعدد ثابت من الاستعلامات
+
+    entries: قائمة (test, value, notes, existing_result) للقيم المُدخلة فقط
+    """
+    patient = test_request.patient
+    gender, age = patient.gender, patient_age(patient)
+    # تحميل القيم الطبيعية (والفئات العمرية) لكل تحاليل اللوحة دفعة واحدة
+    prime_reference_ranges(test for test, _, _, _ in entries)
+    now = timezone.now()
+    to_create, to_update, saved_results = [], [], []
+
+    for test, value, notes, result in entries:
+        if result is None:
+            result = IndividualTestResult(
+                test_request=test_request, individual_test=test, price=test.price,
+                value=value, notes=notes, entered_by=user,   # يحفظ المستخدم أول مرة
+            )
+            to_create.append(result)
+        elif result.value != value or result.notes != notes:
+            # تحديث القيم والملاحظات
+            result.value = value
+            result.notes = notes
+            # ✅ تسجيل آخر من عدّل
+            result.last_modified_by = user
+            result.updated_at = now
+            to_update.append(result)
+        else:
+            saved_results.append(result)
+            continue
+
+        # ⚡️ تحديد الحالة في الذاكرة قبل الكتابة
+        result.individual_test = test
+        result.evaluate_status(gender, age)
+        saved_results.append(result)
+
+    # حالة الطلب تُحسب مرة واحدة بعد حفظ كل النتائج
+    with deferred_completion() as work:
+        # نتائج أدخلها مستخدم آخر بعد فتح النموذج تُحدَّث بالقيم الجديدة
+        created, conflicts = create_results(to_create)
+        for result in conflicts:
+            result.last_modified_by = user
+            result.updated_at = now
+        to_update.extend(conflicts)
+        IndividualTestResult.objects.bulk_update(
+            to_update, ['value', 'notes', 'status', 'last_modified_by', 'updated_at']
+        )
+        # bulk_create لا يرسل post_save
+        work.add_entered(test_request.pk, len(created))
+        record_results(created)
+
+    return saved_results
+
+
 class BulkIndividualTestResultForm(forms.Form):
     """نموذج لإدخال نتائج التحاليل الفردية دفعة واحدة"""
     
@@ -180,17 +240,18 @@ class BulkIndividualTestResultForm(forms.Form):
         self.test_request = test_request
         
         # جلب جميع التحاليل الفردية المرتبطة بطلب التحليل
-        individual_tests = test_request.individual_tests.all()
+        self.individual_tests = list(test_request.individual_tests.all())
         
-        # جلب النتائج الموجودة مسبقاً
-        existing_results = {
-            result.individual_test.id: result 
+        # جلب النتائج الموجودة مسبقاً (استعلام واحد مفهرس حسب رقم التحليل)
+        self.existing_results = {
+            result.individual_test_id: result 
             for result in IndividualTestResult.objects.filter(test_request=test_request)
+            .select_related('entered_by', 'last_modified_by')
         }
         
         # إنشاء حقول لكل تحليل فردي
-        for test in individual_tests:
-            existing_result = existing_results.get(test.id)
+        for test in self.individual_tests:
+            existing_result = self.existing_results.get(test.id)
             
             # ✅ حقل القيمة أصبح CharField
             value_field_name = f'test_{test.id}_value'
@@ -230,7 +291,7 @@ class BulkIndividualTestResultForm(forms.Form):
     def get_test_fields(self):
         """إرجاع قائمة بمعلومات التحاليل والحقول المرتبطة بها"""
         test_fields = []
-        for test in self.test_request.individual_tests.all():
+        for test in self.individual_tests:
             test_info = getattr(self, f'test_{test.id}_info', None)
             if test_info:
                 test_fields.append({
@@ -242,43 +303,18 @@ class BulkIndividualTestResultForm(forms.Form):
         return test_fields
     
     def save(self, user):
-        """حفظ نتائج التحاليل"""
-        saved_results = []
-
-        for test in self.test_request.individual_tests.all():
-            value_field_name = f'test_{test.id}_value'
-            notes_field_name = f'test_{test.id}_notes'
-
-            value = self.cleaned_data.get(value_field_name)
-            notes = self.cleaned_data.get(notes_field_name, '')
+        """حفظ نتائج التحاليل (bulk_create للجديدة و bulk_update للمعدلة)"""
+        entries = []
+        for test in self.individual_tests:
+            value = self.cleaned_data.get(f'test_{test.id}_value')
+            notes = self.cleaned_data.get(f'test_{test.id}_notes', '')
 
             if not value:
                 continue
 
-            result, created = IndividualTestResult.objects.get_or_create(
-                test_request=self.test_request,
-                individual_test=test,
-                defaults={
-                    'value': value,
-                    'notes': notes,
-                    'entered_by': user   # يحفظ المستخدم أول مرة
-                }
-            )
-
-            if created:
-                # أول مرة → already saved entered_by
-                pass
-            else:
-                # تحديث القيم والملاحظات
-                result.value = value
-                result.notes = notes
-                # ✅ تسجيل آخر من عدّل
-                result.last_modified_by = user
-                result.save(update_fields=["value", "notes", "last_modified_by", "updated_at"])
+            entries.append((test, value, notes, self.existing_results.get(test.id)))
 
-            saved_results.append(result)
-
-        return saved_results
+        return _bulk_save_results(self.test_request, entries, user)
 
 
 
@@ -540,19 +576,22 @@ class BulkTestGroupResultForm(forms.Form):
         super().__init__(*args, **kwargs)
         self.test_request = test_request
 
-        # جلب جميع المجموعات المرتبطة بالطلب
-        test_groups = test_request.test_groups.all()
+        # جلب جميع المجموعات المرتبطة بالطلب مع تحاليلها (استعلامان فقط)
+        self.test_groups = list(test_request.test_groups.prefetch_related(
+            Prefetch('tests', queryset=IndividualTest.objects.order_by('display_order'))
+        ))
 
         # جلب النتائج الموجودة مسبقاً
-        existing_individual_results = {
-            result.individual_test.id: result
+        self.existing_results = {
+            result.individual_test_id: result
             for result in IndividualTestResult.objects.filter(test_request=test_request)
+            .select_related('entered_by', 'last_modified_by')
         }
 
         # إنشاء الحقول
-        for group in test_groups:
-            for test in group.tests.all().order_by("display_order"):
-                existing_result = existing_individual_results.get(test.id)
+        for group in self.test_groups:
+            for test in group.tests.all():
+                existing_result = self.existing_results.get(test.id)
 
                 # ⚡️ CharField بدل DecimalField
                 value_field_name = f'group_{group.id}_test_{test.id}_value'
@@ -591,9 +630,9 @@ class BulkTestGroupResultForm(forms.Form):
     def get_group_fields(self):
         """إرجاع قائمة بمعلومات المجموعات"""
         group_fields = []
-        for group in self.test_request.test_groups.all():
+        for group in self.test_groups:
             tests_in_group = []
-            for test in group.tests.all().order_by("display_order"):
+            for test in group.tests.all():
                 test_info = getattr(self, f'group_{group.id}_test_{test.id}_info', None)
                 if test_info:
                     tests_in_group.append({
@@ -610,64 +649,17 @@ class BulkTestGroupResultForm(forms.Form):
         return group_fields
 
     def save(self, user):
-        """حفظ نتائج المجموعات"""
-        from decimal import Decimal, InvalidOperation
-        saved_results = []
-
-        patient_gender = self.test_request.patient.gender  # 'M' or 'F'
-
-        for group in self.test_request.test_groups.all():
-            for test in group.tests.all().order_by("display_order"):
-                value_field_name = f'group_{group.id}_test_{test.id}_value'
-                notes_field_name = f'group_{group.id}_test_{test.id}_notes'
-
-                value = self.cleaned_data.get(value_field_name)
-                notes = self.cleaned_data.get(notes_field_name, '')
+        """حفظ نتائج المجموعات (bulk_create للجديدة و bulk_update للمعدلة)"""
+        entries = {}
+        for group in self.test_groups:
+            for test in group.tests.all():
+                value = self.cleaned_data.get(f'group_{group.id}_test_{test.id}_value')
+                notes = self.cleaned_data.get(f'group_{group.id}_test_{test.id}_notes', '')
 
                 if not value:  # فارغ
                     continue
 
-                result, created = IndividualTestResult.objects.get_or_create(
-                    test_request=self.test_request,
-                    individual_test=test,
-                    defaults={
-                        'value': value,
-                        'notes': notes,
-                        'entered_by': user   # أول إدخال فقط
-                    }
-                )
+                # التحليل المشترك بين مجموعتين له نتيجة واحدة في الطلب
+                entries[test.id] = (test, value, notes, self.existing_results.get(test.id))
 
-                if not created:
-                    # تعديل
-                    result.value = value
-                    result.notes = notes
-                    result.last_modified_by = user
-
-                # ⚡️ تحديد القيم الطبيعية حسب الجنس
-                if patient_gender == "M":
-                    min_val = test.normal_value_min_m
-                    max_val = test.normal_value_max_m
-                else:
-                    min_val = test.normal_value_min_f
-                    max_val = test.normal_value_max_f
-
-                # ⚡️ محاولة تحويل النص إلى رقم ومقارنته
-                try:
-                    num_value = Decimal(value)
-                    if min_val is not None and max_val is not None:
-                        if num_value < Decimal(min_val):
-                            result.status = 'low'
-                        elif num_value > Decimal(max_val):
-                            result.status = 'high'
-                        else:
-                            result.status = 'normal'
-                    else:
-                        # ماكو min/max عددية، نعتبره "abnormal" إلا إذا عندك parsing من النصوص
-                        result.status = 'abnormal'
-                except (InvalidOperation, TypeError, ValueError):
-                    result.status = 'abnormal'
-
-                result.save()
-                saved_results.append(result)
-
-        return saved_results
+        return _bulk_save_results(self.test_request, list(entries.values()), user)
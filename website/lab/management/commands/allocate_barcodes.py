@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lab.sequences import preallocate_range
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f'تاريخ غير صحيح: {value} (الصيغة YYYY-MM-DD)')
+
+
+class Command(BaseCommand):
+    help = 'حجز مجال من باركودات المرضى لملصقات الأنابيب المطبوعة مسبقاً'
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int, help='عدد الباركودات المطلوبة')
+        parser.add_argument('--date', type=_parse_date, help='يوم الباركود YYYY-MM-DD (افتراضياً اليوم)')
+        parser.add_argument('--output', help='حفظ الباركودات في ملف (سطر لكل باركود)')
+
+    def handle(self, *args, **options):
+        if options['count'] < 1:
+            raise CommandError('العدد يجب أن يكون أكبر من صفر')
+
+        codes = preallocate_range(options['count'], options['date'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                output.write('\n'.join(codes) + '\n')
+        else:
+            self.stdout.write('\n'.join(codes))
+
+        self.stdout.write(self.style.SUCCESS(f'تم حجز {len(codes)} باركود: {codes[0]} - {codes[-1]}'))
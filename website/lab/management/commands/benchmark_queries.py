@@ -0,0 +1,89 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from lab.models import DeviceResult, IndividualTest, IndividualTestResult, Patient, TestRequest
+from lab.sequences import preallocate_range
+
+
+class Command(BaseCommand):
+    help = (
+        'عرض خطة التنفيذ (EXPLAIN) وزمن استعلامات الصفحات الأكثر استخداماً. '
+        'للمقارنة: شغله بعد "migrate lab 0017" ثم بعد "migrate lab 0018" (الفهارس المركبة)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='إنشاء عدد من المرضى التجريبيين مع طلباتهم ونتائجهم قبل القياس')
+        parser.add_argument('--results', type=int, default=10, help='عدد النتائج لكل طلب عند --seed')
+        parser.add_argument('--repeat', type=int, default=5, help='عدد مرات التكرار لقياس الزمن')
+        parser.add_argument('--no-explain', action='store_true', help='قياس الزمن فقط بدون خطة التنفيذ')
+
+    def _seed(self, count, results_per_request):
+        tests = list(IndividualTest.objects.filter(name__startswith='BENCH'))
+        if not tests:
+            IndividualTest.objects.bulk_create([
+                IndividualTest(name=f'BENCH {i}', unit='mg/dL', price=1000) for i in range(20)
+            ])
+            tests = list(IndividualTest.objects.filter(name__startswith='BENCH'))
+
+        barcodes = preallocate_range(count)
+        with transaction.atomic():
+            Patient.objects.bulk_create([
+                Patient(barcode=barcode, full_name=f'مريض تجريبي {barcode}', gender=random.choice('MF'), age=random.randint(1, 90))
+                for barcode in barcodes
+            ], batch_size=1000)
+            TestRequest.objects.bulk_create([
+                TestRequest(patient_id=barcode, status=random.choice(['pending', 'in_progress', 'completed']))
+                for barcode in barcodes
+            ], batch_size=1000)
+            # MySQL لا يعيد أرقام الصفوف من bulk_create
+            request_ids = TestRequest.objects.filter(patient_id__in=barcodes).values_list('id', flat=True)
+            IndividualTestResult.objects.bulk_create([
+                IndividualTestResult(
+                    test_request_id=request_id, individual_test=test, price=test.price, value=str(random.randint(1, 200)),
+                )
+                for request_id in request_ids
+                for test in random.sample(tests, min(results_per_request, len(tests)))
+            ], batch_size=1000)
+        self.stdout.write(self.style.SUCCESS(f'تم إنشاء {count} مريض تجريبي'))
+
+    def _shapes(self):
+        """الاستعلامات كما تنفذها الصفحات (home, patient_list, patient_detail, test_request_list, التقارير، الأجهزة)"""
+        patient = Patient.objects.order_by('-id').first()
+        barcode = patient.barcode if patient else ''
+        request = TestRequest.objects.order_by('-id').first()
+        return [
+            ('home: pending count', TestRequest.objects.filter(status='pending')),
+            ('home: recent requests', TestRequest.objects.select_related('patient').order_by('-request_date')[:5]),
+            ('patient_list', Patient.objects.all()[:20]),
+            ('patient_list: search', Patient.objects.filter(Q(full_name__icontains='مريض') | Q(barcode__icontains=barcode[:6]))[:20]),
+            ('patient_list: name prefix', Patient.objects.filter(full_name__startswith='مريض')[:20]),
+            ('patient_detail: requests', TestRequest.objects.filter(patient_id=barcode).order_by('-request_date')),
+            ('test_request_list', TestRequest.objects.select_related('patient').order_by('-request_date')[:20]),
+            ('test_request_list: status', TestRequest.objects.filter(status='pending').order_by('-request_date')[:20]),
+            ('report: results', IndividualTestResult.objects.filter(test_request__patient_id=barcode).order_by('-result_date')),
+            ('bulk form: existing results', IndividualTestResult.objects.filter(test_request=request)),
+            ('device ingest: queue', DeviceResult.objects.filter(is_active=True).order_by('insert_datetime')[:500]),
+        ]
+
+    def _measure(self, queryset, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(queryset.all())
+            timings.append((time.perf_counter() - started) * 1000)
+        return min(timings)
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self._seed(options['seed'], options['results'])
+
+        repeat = max(options['repeat'], 1)
+        for name, queryset in self._shapes():
+            best = self._measure(queryset, repeat)
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{name}  best_ms={best:.2f}'))
+            if not options['no_explain']:
+                self.stdout.write(queryset.explain())
@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+
+from lab.models import Patient
+from lab.report_builder import ReportBuilder
+
+
+class Command(BaseCommand):
+    help = 'قياس زمن وعدد استعلامات بناء التقارير (ReportBuilder) للمرضى ذوي النتائج الكثيرة'
+
+    def add_arguments(self, parser):
+        parser.add_argument('patient_ids', nargs='*', type=int, help='أرقام المرضى (افتراضياً المرضى الأكثر نتائج)')
+        parser.add_argument('--top', type=int, default=5, help='عدد المرضى الأكثر نتائج عند عدم تحديد أرقام')
+        parser.add_argument('--repeat', type=int, default=5, help='عدد مرات التكرار لكل قياس')
+        parser.add_argument(
+            '--group-by', choices=[ReportBuilder.GROUP_BY_SECTION, ReportBuilder.GROUP_BY_DESCRIPTION],
+            default=ReportBuilder.GROUP_BY_SECTION,
+        )
+
+    def _measure(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                func()
+                timings.append((time.perf_counter() - started) * 1000)
+        return min(timings), sum(timings) / len(timings), len(queries)
+
+    def handle(self, *args, **options):
+        if options['patient_ids']:
+            patients = list(Patient.objects.filter(id__in=options['patient_ids']))
+        else:
+            patients = list(
+                Patient.objects.annotate(results=Count('testrequest__individualtestresult'))
+                .order_by('-results')[:options['top']]
+            )
+        if not patients:
+            self.stdout.write('لا يوجد مرضى للقياس')
+            return
+
+        builder = ReportBuilder(group_by=options['group_by'])
+        repeat = max(options['repeat'], 1)
+
+        for patient in patients:
+            report = builder.build(patient)
+            best, average, queries = self._measure(lambda: builder.build(patient), repeat)
+            self.stdout.write(
+                f"patient={patient.pk} results={report['results_count']} groups={len(report['groups'])} "
+                f"queries={queries} best_ms={best:.1f} avg_ms={average:.1f}"
+            )
+
+        best, average, queries = self._measure(lambda: builder.build_many(patients), repeat)
+        self.stdout.write(self.style.SUCCESS(
+            f"build_many patients={len(patients)} queries={queries} best_ms={best:.1f} avg_ms={average:.1f}"
+        ))
@@ -0,0 +1,45 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from lab.search import typeahead
+from lab.typeahead import PatientIndex
+
+
+class Command(BaseCommand):
+    help = 'بناء فهرس الإكمال التلقائي في الذاكرة وقياس حجمه وزمن البحث مقارنة بقاعدة البيانات'
+
+    def add_arguments(self, parser):
+        parser.add_argument('queries', nargs='*', default=['محمد', 'علي', 'حسن', '077', '26'], help='كلمات البحث')
+        parser.add_argument('--max-patients', type=int, help='حد عدد المرضى في الفهرس')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def _measure(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return timings[len(timings) // 2], timings[-1]
+
+    def handle(self, *args, **options):
+        tracemalloc.start()
+        started = time.perf_counter()
+        index = PatientIndex.build(options['max_patients'])
+        build_seconds = time.perf_counter() - started
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"patients={len(index)} complete={index.complete} build_s={build_seconds:.2f} memory_mb={memory / 1024 / 1024:.1f}"
+        ))
+        repeat = max(options['repeat'], 1)
+        for query in options['queries']:
+            index_p50, index_max = self._measure(lambda: index.search(query), repeat)
+            db_p50, db_max = self._measure(lambda: typeahead(query), repeat)
+            self.stdout.write(
+                f"{query!r}: results={len(index.search(query))} index_ms p50={index_p50:.3f} max={index_max:.3f} "
+                f"| db_ms p50={db_p50:.2f} max={db_max:.2f}"
+            )
@@ -0,0 +1,43 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lab.report_export import merged_pdf, select_patients, select_requests, stream_zip
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f'تاريخ غير صحيح: {value} (الصيغة YYYY-MM-DD)')
+
+
+class Command(BaseCommand):
+    help = 'تصدير تقارير المرضى لفترة زمنية أو لأرقام طلبات محددة إلى ملف ZIP أو PDF مدمج'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='مسار الملف الناتج (.zip أو .pdf)')
+        parser.add_argument('--from', dest='date_from', type=_parse_date, help='من تاريخ YYYY-MM-DD')
+        parser.add_argument('--to', dest='date_to', type=_parse_date, help='إلى تاريخ YYYY-MM-DD')
+        parser.add_argument('--requests', type=int, nargs='+', default=[], help='أرقام طلبات التحاليل')
+        parser.add_argument('--format', choices=['zip', 'pdf'], help='افتراضياً حسب امتداد الملف')
+
+    def handle(self, *args, **options):
+        if not (options['date_from'] or options['date_to'] or options['requests']):
+            raise CommandError('حدد فترة زمنية (--from/--to) أو أرقام طلبات (--requests)')
+
+        requests = select_requests(options['date_from'], options['date_to'], options['requests'])
+        patients = list(select_patients(requests))
+        if not patients:
+            self.stdout.write('لا يوجد طلبات فحص ضمن التحديد')
+            return
+
+        output_format = options['format'] or ('pdf' if options['output'].lower().endswith('.pdf') else 'zip')
+        with open(options['output'], 'wb') as output:
+            if output_format == 'pdf':
+                output.write(merged_pdf(patients, requests=requests))
+            else:
+                for chunk in stream_zip(patients, requests=requests):
+                    output.write(chunk)
+
+        self.stdout.write(self.style.SUCCESS(f"تم تصدير {len(patients)} تقرير إلى {options['output']}"))
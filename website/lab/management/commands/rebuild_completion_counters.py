@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from lab.completion import rebuild_completion_counters
+
+
+class Command(BaseCommand):
+    help = 'إعادة بناء عدادات اكتمال طلبات التحاليل (المطلوبة / المدخلة / النسبة)'
+
+    def handle(self, *args, **options):
+        count = rebuild_completion_counters()
+        self.stdout.write(self.style.SUCCESS(f'تم تحديث عدادات {count} طلب'))
@@ -0,0 +1,33 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from lab.rollups import rebuild
+
+
+def _parse_day(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'تاريخ غير صالح: {value} (YYYY-MM-DD)')
+
+
+class Command(BaseCommand):
+    help = 'إعادة بناء جداول الملخص اليومي لصفحة التقارير (كل الأيام، أو آخر أيام فقط للتشغيل الليلي)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', type=_parse_day, help='أول يوم (افتراضياً يوم أول طلب)')
+        parser.add_argument('--to', dest='end', type=_parse_day, help='آخر يوم (افتراضياً اليوم)')
+        parser.add_argument('--days', type=int, help='آخر N يوم فقط، مثلاً --days 2 كل ليلة')
+
+    def handle(self, *args, **options):
+        start, end = options['start'], options['end']
+        if options['days']:
+            end = timezone.localdate()
+            start = end - timedelta(days=options['days'] - 1)
+        if start and end and start > end:
+            raise CommandError('--from يجب أن يكون قبل --to')
+
+        count = rebuild(start, end, progress=lambda day: self.stdout.write(f'{day} ...') if day.day == 1 else None)
+        self.stdout.write(self.style.SUCCESS(f'تم بناء الملخص اليومي لـ {count} يوم'))
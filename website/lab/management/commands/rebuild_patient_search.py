@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from lab.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'إعادة بناء أعمدة بحث المرضى (الاسم الموحد، الهاتف) وجدول المقاطع الثلاثية'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='عدد المرضى في كل دفعة')
+
+    def handle(self, *args, **options):
+        count = rebuild_index(
+            batch_size=options['batch_size'],
+            progress=lambda done: self.stdout.write(f'{done} ...'),
+        )
+        self.stdout.write(self.style.SUCCESS(f'تم بناء فهرس البحث لـ {count} مريض'))
@@ -0,0 +1,56 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from lab.device_sync import run_ingest_cycle
+
+logger = logging.getLogger(__name__)
+
+# أقصى انتظار بين المحاولات بعد أخطاء متتالية (ثواني)
+MAX_BACKOFF = 60
+
+
+class Command(BaseCommand):
+    help = 'عامل استيراد نتائج الأجهزة: يدمج DeviceResult في IndividualTestResult بشكل دوري'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float,
+            default=getattr(settings, 'DEVICE_INGEST_POLL_INTERVAL', 5),
+            help='الفترة بين كل دورة دمج بالثواني',
+        )
+        parser.add_argument('--once', action='store_true', help='تنفيذ دورة واحدة فقط ثم الخروج')
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        failures = 0
+
+        try:
+            while True:
+                close_old_connections()
+                try:
+                    metrics = run_ingest_cycle()
+                except Exception:
+                    # انقطاع الاتصال أو انتهاء مهلة قفل...: الدورة تتراجع كاملة وتُعاد لاحقاً
+                    if options['once']:
+                        raise
+                    failures += 1
+                    logger.exception('device ingest cycle failed (%s in a row)', failures)
+                    close_old_connections()
+                    time.sleep(min(interval * 2 ** failures, MAX_BACKOFF))
+                    continue
+
+                failures = 0
+                if metrics['queue_depth'] or options['once']:
+                    self.stdout.write(
+                        f"queue_depth={metrics['queue_depth']} merged={metrics['merged_count']} "
+                        f"latency_ms={metrics['merge_latency_ms']}"
+                    )
+                if options['once']:
+                    break
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            self.stdout.write('تم إيقاف عامل الاستيراد')
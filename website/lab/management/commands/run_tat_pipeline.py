@@ -0,0 +1,42 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from lab.turnaround import process, rebuild
+
+
+class Command(BaseCommand):
+    help = 'حساب أزمنة الإنجاز (TAT) للنتائج الجديدة ونسبها اليومية بشكل دوري'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float,
+            default=getattr(settings, 'TAT_PIPELINE_INTERVAL', 60),
+            help='الفترة بين كل دورة بالثواني',
+        )
+        parser.add_argument('--once', action='store_true', help='تنفيذ دورة واحدة فقط ثم الخروج')
+        parser.add_argument('--rebuild', action='store_true', help='إعادة بناء العينات والنسب لآخر --days يوم ثم الخروج')
+        parser.add_argument('--days', type=int, default=2, help='عدد الأيام لإعادة البناء')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            end = timezone.localdate()
+            count = rebuild(end - timedelta(days=max(options['days'], 1) - 1), end)
+            self.stdout.write(self.style.SUCCESS(f'تم بناء أزمنة الإنجاز لـ {count} يوم'))
+            return
+
+        try:
+            while True:
+                close_old_connections()
+                stats = process()
+                if stats['days'] or options['once']:
+                    self.stdout.write(f"days={stats['days']} new={stats['new_days']} reported={stats['report_days']}")
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('تم إيقاف حساب أزمنة الإنجاز')
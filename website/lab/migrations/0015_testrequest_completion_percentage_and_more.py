@@ -0,0 +1,55 @@
+# Generated by Django 4.2 on 2026-10-18 00:25
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_completion_counters(apps, schema_editor):
+    TestRequest = apps.get_model('lab', 'TestRequest')
+    IndividualTestResult = apps.get_model('lab', 'IndividualTestResult')
+    TestGroupResult = apps.get_model('lab', 'TestGroupResult')
+
+    def counts(queryset, request_field, count_field='pk'):
+        return dict(queryset.order_by().values_list(request_field).annotate(c=Count(count_field)).values_list(request_field, 'c'))
+
+    individual_tests = counts(TestRequest.individual_tests.through.objects, 'testrequest_id')
+    group_tests = counts(TestRequest.test_groups.through.objects, 'testrequest_id', 'testgroup__tests')
+    individual_results = counts(IndividualTestResult.objects, 'test_request_id')
+    group_results = counts(TestGroupResult.objects, 'test_request_id')
+
+    requests = list(TestRequest.objects.only('id'))
+    for test_request in requests:
+        expected = individual_tests.get(test_request.id, 0) + group_tests.get(test_request.id, 0)
+        entered = individual_results.get(test_request.id, 0) + group_results.get(test_request.id, 0)
+        test_request.expected_results_count = expected
+        test_request.entered_results_count = entered
+        test_request.completion_percentage = round(entered / expected * 100, 1) if expected else 0
+    TestRequest.objects.bulk_update(
+        requests, ['expected_results_count', 'entered_results_count', 'completion_percentage'], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lab', '0014_alter_individualtestresult_last_modified_by_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testrequest',
+            name='completion_percentage',
+            field=models.FloatField(default=0, verbose_name='نسبة الاكتمال'),
+        ),
+        migrations.AddField(
+            model_name='testrequest',
+            name='entered_results_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='عدد النتائج المدخلة'),
+        ),
+        migrations.AddField(
+            model_name='testrequest',
+            name='expected_results_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='عدد النتائج المطلوبة'),
+        ),
+        migrations.RunPython(backfill_completion_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2 on 2026-10-18 00:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lab', '0015_testrequest_completion_percentage_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='individualtestresult',
+            name='status',
+            field=models.CharField(blank=True, choices=[('normal', 'طبيعي'), ('high', 'مرتفع'), ('low', 'منخفض'), ('critical_high', 'مرتفع حرج'), ('critical_low', 'منخفض حرج'), ('abnormal', 'غير طبيعي'), ('n/a', 'غير محدد')], max_length=20, verbose_name='الحالة'),
+        ),
+        migrations.CreateModel(
+            name='ReferenceInterval',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('sex', models.CharField(choices=[('A', 'الكل'), ('M', 'ذكر'), ('F', 'أنثى')], default='A', max_length=1, verbose_name='الجنس')),
+                ('age_from', models.PositiveIntegerField(default=0, verbose_name='من عمر (سنة)')),
+                ('age_to', models.PositiveIntegerField(blank=True, null=True, verbose_name='إلى عمر (سنة)')),
+                ('low', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='الحد الأدنى')),
+                ('high', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='الحد الأعلى')),
+                ('critical_low', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='الحد الحرج الأدنى')),
+                ('critical_high', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='الحد الحرج الأعلى')),
+                ('test', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reference_intervals', to='lab.individualtest', verbose_name='التحليل')),
+            ],
+            options={
+                'verbose_name': 'قيمة طبيعية حسب العمر',
+                'verbose_name_plural': 'القيم الطبيعية حسب العمر',
+                'ordering': ['test', 'sex', 'age_from'],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2 on 2026-10-18 00:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lab', '0016_alter_individualtestresult_status_referenceinterval'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BarcodeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True, verbose_name='اليوم')),
+                ('last_value', models.PositiveIntegerField(default=0, verbose_name='آخر رقم محجوز')),
+            ],
+            options={
+                'verbose_name': 'تسلسل الباركود',
+                'verbose_name_plural': 'تسلسلات الباركود',
+            },
+        ),
+    ]
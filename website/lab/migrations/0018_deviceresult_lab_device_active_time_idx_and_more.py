@@ -0,0 +1,41 @@
+# Generated by Django 4.2 on 2026-10-18 00:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lab', '0017_barcodesequence'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='deviceresult',
+            index=models.Index(fields=['is_active', 'insert_datetime'], name='lab_device_active_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='individualtestresult',
+            index=models.Index(fields=['test_request', '-result_date'], name='lab_result_request_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['-created_at'], name='lab_patient_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['full_name'], name='lab_patient_full_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testrequest',
+            index=models.Index(fields=['patient', '-request_date'], name='lab_request_patient_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testrequest',
+            index=models.Index(fields=['status', '-request_date'], name='lab_request_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testrequest',
+            index=models.Index(fields=['-request_date'], name='lab_request_date_idx'),
+        ),
+    ]
@@ -0,0 +1,105 @@
+# Generated by Django 4.2 on 2026-10-18 00:42
+
+import re
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# نسخة ثابتة من التوحيد والمقاطع في lab.search وقت هذا الـ migration
+# (تعديل lab.search لاحقاً لا يغير ما يكتبه الـ migration). أي تغيير في التوحيد
+# يحتاج migration جديداً أو python manage.py rebuild_patient_search.
+_DIACRITICS = re.compile('[\u064b-\u065f\u0670\u0640]')
+_FOLD = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ئ': 'ي',
+    'ؤ': 'و',
+    'ة': 'ه',
+    **{chr(0x0660 + i): str(i) for i in range(10)},  # ٠-٩
+    **{chr(0x06F0 + i): str(i) for i in range(10)},  # ۰-۹ (فارسي)
+})
+_NON_DIGITS = re.compile(r'\D')
+
+
+def _normalize_text(value):
+    if not value:
+        return ''
+    value = _DIACRITICS.sub('', value).translate(_FOLD).lower()
+    return ' '.join(value.split())
+
+
+def _normalize_phone(value):
+    if not value:
+        return ''
+    return _NON_DIGITS.sub('', value.translate(_FOLD))
+
+
+def _trigrams(normalized):
+    grams = set()
+    for word in normalized.split():
+        grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+def build_search_index(apps, schema_editor):
+    Patient = apps.get_model('lab', 'Patient')
+    PatientSearchGram = apps.get_model('lab', 'PatientSearchGram')
+
+    PatientSearchGram.objects.all().delete()
+    last_id = 0
+    while True:
+        batch = list(Patient.objects.filter(id__gt=last_id).order_by('id').only('id', 'full_name', 'phone_number')[:1000])
+        if not batch:
+            break
+        grams = []
+        for patient in batch:
+            patient.search_name = _normalize_text(patient.full_name)
+            patient.search_phone = _normalize_phone(patient.phone_number)
+            grams.extend(PatientSearchGram(patient_id=patient.id, gram=gram) for gram in _trigrams(patient.search_name))
+        Patient.objects.bulk_update(batch, ['search_name', 'search_phone'])
+        PatientSearchGram.objects.bulk_create(grams, batch_size=5000)
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lab', '0018_deviceresult_lab_device_active_time_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientSearchGram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gram', models.CharField(max_length=3)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='search_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='search_phone',
+            field=models.CharField(blank=True, default='', editable=False, max_length=15),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['search_name'], name='lab_patient_search_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['search_phone'], name='lab_patient_search_phone_idx'),
+        ),
+        migrations.AddField(
+            model_name='patientsearchgram',
+            name='patient',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_grams', to='lab.patient'),
+        ),
+        migrations.AddConstraint(
+            model_name='patientsearchgram',
+            constraint=models.UniqueConstraint(fields=('gram', 'patient'), name='unique_patient_search_gram'),
+        ),
+        migrations.RunPython(build_search_index, migrations.RunPython.noop),
+    ]
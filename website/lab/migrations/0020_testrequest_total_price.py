@@ -0,0 +1,38 @@
+# Generated by Django 4.2 on 2026-10-18 00:51
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_total_price(apps, schema_editor):
+    # الطلبات القديمة: أفضل تقدير هو الأسعار الحالية
+    TestRequest = apps.get_model('lab', 'TestRequest')
+    individual = TestRequest.individual_tests.through.objects
+    groups = TestRequest.test_groups.through.objects
+
+    def sums(through, price_field):
+        return dict(through.order_by().values_list('testrequest_id').annotate(s=Sum(price_field)).values_list('testrequest_id', 's'))
+
+    individual_totals = sums(individual, 'individualtest__price')
+    group_totals = sums(groups, 'testgroup__total_price')
+
+    requests = list(TestRequest.objects.only('id'))
+    for test_request in requests:
+        test_request.total_price = (individual_totals.get(test_request.id) or 0) + (group_totals.get(test_request.id) or 0)
+    TestRequest.objects.bulk_update(requests, ['total_price'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lab', '0019_patientsearchgram_patient_search_name_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testrequest',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='السعر الإجمالي'),
+        ),
+        migrations.RunPython(backfill_total_price, migrations.RunPython.noop),
+    ]
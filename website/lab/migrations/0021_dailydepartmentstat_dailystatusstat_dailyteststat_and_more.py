@@ -0,0 +1,65 @@
+# Generated by Django 4.2 on 2026-10-18 00:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lab', '0020_testrequest_total_price'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyDepartmentStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='اليوم')),
+                ('department', models.CharField(choices=[('hematology', 'hematology'), ('chemistry', 'chemistry'), ('bactrology', 'bactrology'), ('imunity', 'imunity'), ('histology', 'histology'), ('parasitology', 'parasitology')], max_length=20, verbose_name='القسم')),
+                ('results', models.PositiveIntegerField(default=0, verbose_name='عدد النتائج')),
+            ],
+            options={
+                'verbose_name': 'ملخص يومي للأقسام',
+                'verbose_name_plural': 'الملخص اليومي للأقسام',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyStatusStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='اليوم')),
+                ('status', models.CharField(choices=[('pending', 'قيد الانتظار'), ('in_progress', 'قيد التنفيذ'), ('completed', 'مكتمل'), ('cancelled', 'تم حذف احد النتائج')], max_length=20, verbose_name='الحالة')),
+                ('requests', models.PositiveIntegerField(default=0, verbose_name='عدد الطلبات')),
+            ],
+            options={
+                'verbose_name': 'ملخص يومي للحالات',
+                'verbose_name_plural': 'الملخص اليومي للحالات',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyTestStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='اليوم')),
+                ('results', models.PositiveIntegerField(default=0, verbose_name='عدد النتائج')),
+                ('test', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='lab.individualtest', verbose_name='التحليل')),
+            ],
+            options={
+                'verbose_name': 'ملخص يومي للتحاليل',
+                'verbose_name_plural': 'الملخص اليومي للتحاليل',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailystatusstat',
+            constraint=models.UniqueConstraint(fields=('day', 'status'), name='unique_daily_status_stat'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailydepartmentstat',
+            constraint=models.UniqueConstraint(fields=('day', 'department'), name='unique_daily_department_stat'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyteststat',
+            constraint=models.UniqueConstraint(fields=('day', 'test'), name='unique_daily_test_stat'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2 on 2026-10-18 01:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('lab', '0021_dailydepartmentstat_dailystatusstat_dailyteststat_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailydepartmentstat',
+            name='revenue',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='قيمة النتائج'),
+        ),
+        migrations.AddField(
+            model_name='dailystatusstat',
+            name='revenue',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='الإيراد'),
+        ),
+        migrations.AddField(
+            model_name='dailyteststat',
+            name='revenue',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='قيمة النتائج'),
+        ),
+        migrations.CreateModel(
+            name='DailyUserStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='اليوم')),
+                ('requests', models.PositiveIntegerField(default=0, verbose_name='عدد الطلبات')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='إيراد الطلبات')),
+                ('results', models.PositiveIntegerField(default=0, verbose_name='عدد النتائج')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to=settings.AUTH_USER_MODEL, verbose_name='المستخدم')),
+            ],
+            options={
+                'verbose_name': 'ملخص يومي للمستخدمين',
+                'verbose_name_plural': 'الملخص اليومي للمستخدمين',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailyuserstat',
+            constraint=models.UniqueConstraint(fields=('day', 'user'), name='unique_daily_user_stat'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 4.2 on 2026-10-18 01:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lab', '0022_dailydepartmentstat_revenue_dailystatusstat_revenue_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TurnaroundSample',
+            fields=[
+                ('result', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='turnaround', serialize=False, to='lab.individualtestresult', verbose_name='النتيجة')),
+                ('department', models.CharField(choices=[('hematology', 'hematology'), ('chemistry', 'chemistry'), ('bactrology', 'bactrology'), ('imunity', 'imunity'), ('histology', 'histology'), ('parasitology', 'parasitology')], max_length=20, verbose_name='القسم')),
+                ('day', models.DateField(verbose_name='يوم الطلب')),
+                ('ordered_at', models.DateTimeField(verbose_name='وقت الطلب')),
+                ('analyzed_at', models.DateTimeField(blank=True, null=True, verbose_name='وقت الجهاز')),
+                ('verified_at', models.DateTimeField(verbose_name='وقت اعتماد النتيجة')),
+                ('reported_at', models.DateTimeField(blank=True, null=True, verbose_name='وقت طباعة التقرير')),
+                ('order_to_analyzer', models.PositiveIntegerField(blank=True, null=True, verbose_name='الطلب ← الجهاز')),
+                ('analyzer_to_verified', models.PositiveIntegerField(blank=True, null=True, verbose_name='الجهاز ← الاعتماد')),
+                ('order_to_verified', models.PositiveIntegerField(verbose_name='الطلب ← الاعتماد')),
+                ('order_to_report', models.PositiveIntegerField(blank=True, null=True, verbose_name='الطلب ← التقرير')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='lab.patient', verbose_name='المريض')),
+                ('test', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='lab.individualtest', verbose_name='التحليل')),
+                ('test_request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='turnaround_samples', to='lab.testrequest', verbose_name='الطلب')),
+            ],
+            options={
+                'verbose_name': 'زمن إنجاز نتيجة',
+                'verbose_name_plural': 'أزمنة إنجاز النتائج',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyTurnaround',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='اليوم')),
+                ('metric', models.CharField(choices=[('order_to_analyzer', 'الطلب ← الجهاز'), ('analyzer_to_verified', 'الجهاز ← الاعتماد'), ('order_to_verified', 'الطلب ← الاعتماد'), ('order_to_report', 'الطلب ← التقرير')], max_length=30, verbose_name='المقياس')),
+                ('department', models.CharField(blank=True, choices=[('hematology', 'hematology'), ('chemistry', 'chemistry'), ('bactrology', 'bactrology'), ('imunity', 'imunity'), ('histology', 'histology'), ('parasitology', 'parasitology')], max_length=20, verbose_name='القسم')),
+                ('samples', models.PositiveIntegerField(default=0, verbose_name='عدد النتائج')),
+                ('p50', models.PositiveIntegerField(verbose_name='p50 (ثانية)')),
+                ('p90', models.PositiveIntegerField(verbose_name='p90 (ثانية)')),
+                ('p99', models.PositiveIntegerField(verbose_name='p99 (ثانية)')),
+                ('test', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='lab.individualtest', verbose_name='التحليل')),
+            ],
+            options={
+                'verbose_name': 'زمن الإنجاز اليومي',
+                'verbose_name_plural': 'أزمنة الإنجاز اليومية',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='turnaroundsample',
+            index=models.Index(fields=['day'], name='lab_tat_sample_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='turnaroundsample',
+            index=models.Index(fields=['reported_at', 'verified_at'], name='lab_tat_sample_report_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailyturnaround',
+            index=models.Index(fields=['day', 'metric'], name='lab_tat_daily_idx'),
+        ),
+    ]
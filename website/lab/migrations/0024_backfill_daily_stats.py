@@ -0,0 +1,79 @@
+# Generated by Django 4.2 on 2026-10-18 03:10
+
+from collections import Counter, defaultdict
+from decimal import Decimal
+
+from django.db import migrations
+from django.utils import timezone
+
+
+def backfill_daily_stats(apps, schema_editor):
+    # نسخة ثابتة من lab.rollups.rebuild على نماذج الـ migration (الكود الحالي يتبع النماذج الحالية)
+    TestRequest = apps.get_model('lab', 'TestRequest')
+    IndividualTest = apps.get_model('lab', 'IndividualTest')
+    IndividualTestResult = apps.get_model('lab', 'IndividualTestResult')
+    DailyTestStat = apps.get_model('lab', 'DailyTestStat')
+    DailyStatusStat = apps.get_model('lab', 'DailyStatusStat')
+    DailyDepartmentStat = apps.get_model('lab', 'DailyDepartmentStat')
+    DailyUserStat = apps.get_model('lab', 'DailyUserStat')
+    zero = Decimal('0')
+
+    tests = {test_id: (department, price or zero) for test_id, department, price in IndividualTest.objects.values_list('id', 'description', 'price')}
+    by_test, by_department = Counter(), Counter()
+    test_revenue, department_revenue = Counter(), Counter()
+    users = defaultdict(lambda: {'requests': 0, 'revenue': zero, 'results': 0})
+
+    results = IndividualTestResult.objects.order_by().values_list('test_request__request_date', 'individual_test_id', 'entered_by_id')
+    for request_date, test_id, user_id in results.iterator(chunk_size=2000):
+        day = timezone.localdate(request_date)
+        department, price = tests.get(test_id, (None, zero))
+        by_test[day, test_id] += 1
+        test_revenue[day, test_id] += price
+        if department:
+            by_department[day, department] += 1
+            department_revenue[day, department] += price
+        if user_id:
+            users[day, user_id]['results'] += 1
+
+    by_status, status_revenue = Counter(), Counter()
+    requests = TestRequest.objects.order_by().values_list('request_date', 'status', 'created_by_id', 'total_price')
+    for request_date, status, user_id, price in requests.iterator(chunk_size=2000):
+        day = timezone.localdate(request_date)
+        by_status[day, status] += 1
+        status_revenue[day, status] += price or zero
+        if user_id:
+            users[day, user_id]['requests'] += 1
+            users[day, user_id]['revenue'] += price or zero
+
+    for model in (DailyTestStat, DailyStatusStat, DailyDepartmentStat, DailyUserStat):
+        model.objects.all().delete()
+    DailyTestStat.objects.bulk_create(
+        [DailyTestStat(day=day, test_id=test_id, results=count, revenue=test_revenue[day, test_id])
+         for (day, test_id), count in by_test.items()],
+        batch_size=1000,
+    )
+    DailyDepartmentStat.objects.bulk_create(
+        [DailyDepartmentStat(day=day, department=department, results=count, revenue=department_revenue[day, department])
+         for (day, department), count in by_department.items()],
+        batch_size=1000,
+    )
+    DailyStatusStat.objects.bulk_create(
+        [DailyStatusStat(day=day, status=status, requests=count, revenue=status_revenue[day, status])
+         for (day, status), count in by_status.items()],
+        batch_size=1000,
+    )
+    DailyUserStat.objects.bulk_create(
+        [DailyUserStat(day=day, user_id=user_id, **totals) for (day, user_id), totals in users.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lab', '0023_turnaroundsample_dailyturnaround_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_daily_stats, migrations.RunPython.noop),
+    ]
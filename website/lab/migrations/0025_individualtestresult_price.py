@@ -0,0 +1,29 @@
+# Generated by Django 4.2 on 2026-10-18 03:25
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_result_price(apps, schema_editor):
+    # النتائج القديمة: أفضل تقدير هو الأسعار الحالية (مثل total_price للطلبات)
+    IndividualTest = apps.get_model('lab', 'IndividualTest')
+    IndividualTestResult = apps.get_model('lab', 'IndividualTestResult')
+    IndividualTestResult.objects.update(
+        price=Subquery(IndividualTest.objects.filter(pk=OuterRef('individual_test_id')).values('price')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lab', '0024_backfill_daily_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='individualtestresult',
+            name='price',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=10, null=True, verbose_name='السعر'),
+        ),
+        migrations.RunPython(backfill_result_price, migrations.RunPython.noop),
+    ]
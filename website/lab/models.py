@@ -2,6 +2,8 @@ from django.db import models
 
 # Create your models here.
 from django.db import models
+from django.db.models import Case, DecimalField, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 import uuid
@@ -24,11 +26,22 @@ class Patient(models.Model):
     address = models.TextField(verbose_name='العنوان', null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='تاريخ التسجيل')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='تاريخ التحديث')
+    # أعمدة البحث (تُحسب في save، انظر lab/search.py)
+    search_name = models.CharField(max_length=200, blank=True, default='', editable=False)
+    search_phone = models.CharField(max_length=15, blank=True, default='', editable=False)
 
     class Meta:
         verbose_name = 'مريض'
         verbose_name_plural = 'المرضى'
         ordering = ['-created_at']
+        indexes = [
+            # ترتيب قائمة المرضى
+            models.Index(fields=['-created_at'], name='lab_patient_created_idx'),
+            models.Index(fields=['full_name'], name='lab_patient_full_name_idx'),
+            # البحث ببداية الاسم أو الهاتف
+            models.Index(fields=['search_name'], name='lab_patient_search_name_idx'),
+            models.Index(fields=['search_phone'], name='lab_patient_search_phone_idx'),
+        ]
 
     def __str__(self):
         return self.full_name
@@ -56,11 +69,10 @@ class Patient(models.Model):
             raise ValidationError("يجب إدخال العمر أو تاريخ الميلاد على الأقل.")
 
     def save(self, *args, **kwargs):
-        # توليد الباركود إذا لم يكن موجود
+        # توليد الباركود إذا لم يكن موجود (تسلسل يومي بدون تكرار)
         if not self.barcode:
-            date_part = datetime.now().strftime('%y%m%d')
-            random_part = str(random.randint(1000, 9999))
-            self.barcode = f"{date_part}{random_part}"
+            from .sequences import allocate_barcode
+            self.barcode = allocate_barcode()
 
         # حساب العمر أو تاريخ الميلاد اعتمادًا على ما تم إدخاله
         if self.date_of_birth and not self.age:
@@ -71,9 +83,43 @@ class Patient(models.Model):
             # تحديث العمر إذا تم تعديل تاريخ الميلاد
             self.age = self.calculate_age()
 
+        from .search import normalize_phone, normalize_text
+        self.search_name = normalize_text(self.full_name)
+        self.search_phone = normalize_phone(self.phone_number)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'full_name', 'phone_number'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'search_name', 'search_phone'}
+
         super().save(*args, **kwargs)
 
 
+class PatientSearchGram(models.Model):
+    """المقاطع الثلاثية لاسم المريض للبحث بجزء من الاسم (يُحدَّث عن طريق signals)"""
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='search_grams')
+    gram = models.CharField(max_length=3)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['gram', 'patient'], name='unique_patient_search_gram'),
+        ]
+
+    def __str__(self):
+        return f"{self.gram} - {self.patient_id}"
+
+
+
+
+class BarcodeSequence(models.Model):
+    """عداد يومي لباركود المرضى: الباركود = yymmdd + رقم تسلسلي"""
+    day = models.DateField(unique=True, verbose_name='اليوم')
+    last_value = models.PositiveIntegerField(default=0, verbose_name='آخر رقم محجوز')
+
+    class Meta:
+        verbose_name = 'تسلسل الباركود'
+        verbose_name_plural = 'تسلسلات الباركود'
+
+    def __str__(self):
+        return f"{self.day:%y%m%d} - {self.last_value}"
 
 
 class IndividualTest(models.Model):
@@ -113,6 +159,46 @@ class IndividualTest(models.Model):
         return self.name
 
 
+class ReferenceInterval(models.Model):
+    """قيم طبيعية حسب الجنس والفئة العمرية (أطفال، بالغين، كبار السن) مع القيم الحرجة"""
+    SEX_CHOICES = [('A', 'الكل'), ('M', 'ذكر'), ('F', 'أنثى')]
+
+    id = models.AutoField(primary_key=True)
+    test = models.ForeignKey(IndividualTest, on_delete=models.CASCADE, related_name='reference_intervals', verbose_name='التحليل')
+    sex = models.CharField(max_length=1, choices=SEX_CHOICES, default='A', verbose_name='الجنس')
+    age_from = models.PositiveIntegerField(default=0, verbose_name='من عمر (سنة)')
+    age_to = models.PositiveIntegerField(null=True, blank=True, verbose_name='إلى عمر (سنة)')  # غير شامل، فارغ = بدون حد
+    low = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name='الحد الأدنى')
+    high = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name='الحد الأعلى')
+    critical_low = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name='الحد الحرج الأدنى')
+    critical_high = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name='الحد الحرج الأعلى')
+
+    class Meta:
+        verbose_name = 'قيمة طبيعية حسب العمر'
+        verbose_name_plural = 'القيم الطبيعية حسب العمر'
+        ordering = ['test', 'sex', 'age_from']
+
+    def __str__(self):
+        age_to = self.age_to if self.age_to is not None else '+'
+        return f"{self.test.name} ({self.get_sex_display()}، {self.age_from}-{age_to})"
+
+    def clean(self):
+        super().clean()
+        if self.age_to is not None and self.age_to <= self.age_from:
+            raise ValidationError("يجب أن يكون عمر النهاية أكبر من عمر البداية.")
+        if self.low is not None and self.high is not None and self.low > self.high:
+            raise ValidationError("الحد الأدنى أكبر من الحد الأعلى.")
+
+
+class TestGroupQuerySet(models.QuerySet):
+    def with_individual_price_sum(self):
+        """مجموع أسعار تحاليل المجموعة منفردة (individual_price_sum) في نفس الاستعلام"""
+        money = DecimalField(max_digits=12, decimal_places=2)
+        return self.annotate(
+            individual_price_sum=Coalesce(Sum('tests__price'), Value(0), output_field=money),
+        )
+
+
 class TestGroup(models.Model):
     """نموذج مجموعة التحاليل"""
     id = models.AutoField(primary_key=True)
@@ -124,6 +210,8 @@ class TestGroup(models.Model):
     is_active = models.BooleanField(default=True, verbose_name='نشط')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='تاريخ الإنشاء')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='تاريخ التحديث')
+
+    objects = TestGroupQuerySet.as_manager()
     
     class Meta:
         verbose_name = 'مجموعة تحاليل'
@@ -134,10 +222,32 @@ class TestGroup(models.Model):
         return self.name
     
     def get_individual_price_sum(self):
-        """حساب مجموع أسعار التحاليل الفردية"""
+        """حساب مجموع أسعار التحاليل الفردية (من with_individual_price_sum إن وُجد)"""
+        if hasattr(self, 'individual_price_sum'):
+            return self.individual_price_sum
         return sum(test.price for test in self.tests.all())
 
 
+class TestRequestQuerySet(models.QuerySet):
+    def with_totals(self):
+        """أسعار الطلب محسوبة في SQL (individual_total, groups_total, tests_total)
+        بدلاً من get_total_price الذي يحمّل كل التحاليل والمجموعات لكل طلب"""
+        money = DecimalField(max_digits=12, decimal_places=2)
+
+        def price_sum(through, request_field, price_field):
+            total = (
+                through.objects.filter(**{request_field: OuterRef('pk')})
+                .order_by().values(request_field)
+                .annotate(total=Sum(price_field)).values('total')
+            )
+            return Coalesce(Subquery(total, output_field=money), Value(0), output_field=money)
+
+        return self.annotate(
+            individual_total=price_sum(TestRequest.individual_tests.through, 'testrequest_id', 'individualtest__price'),
+            groups_total=price_sum(TestRequest.test_groups.through, 'testrequest_id', 'testgroup__total_price'),
+        ).annotate(tests_total=F('individual_total') + F('groups_total'))
+
+
 class TestRequest(models.Model):
     """نموذج طلب التحليل"""
     STATUS_CHOICES = [
@@ -155,82 +265,105 @@ class TestRequest(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name='الحالة')
     notes = models.TextField(blank=True, verbose_name='ملاحظات')
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, verbose_name='أنشئ بواسطة')
+    # عدادات الاكتمال (تُحدَّث تزايدياً عبر signals، وتُعاد بناؤها بـ rebuild_completion_counters)
+    expected_results_count = models.PositiveIntegerField(default=0, verbose_name='عدد النتائج المطلوبة')
+    entered_results_count = models.PositiveIntegerField(default=0, verbose_name='عدد النتائج المدخلة')
+    completion_percentage = models.FloatField(default=0, verbose_name='نسبة الاكتمال')
+    # سعر الطلب وقت الطلب (لا يتغير بتغيير أسعار التحاليل لاحقاً، يُحدَّث فقط عند تعديل تحاليل الطلب)
+    total_price = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name='السعر الإجمالي')
+
+    objects = TestRequestQuerySet.as_manager()
     
     class Meta:
         verbose_name = 'طلب تحليل'
         verbose_name_plural = 'طلبات التحاليل'
         ordering = ['-request_date']
+        indexes = [
+            # طلبات المريض (تفاصيل المريض، التقارير، دمج الأجهزة)
+            models.Index(fields=['patient', '-request_date'], name='lab_request_patient_date_idx'),
+            # قائمة الطلبات والإحصائيات حسب الحالة
+            models.Index(fields=['status', '-request_date'], name='lab_request_status_date_idx'),
+            models.Index(fields=['-request_date'], name='lab_request_date_idx'),
+        ]
     
     def __str__(self):
         return f"طلب {self.patient.full_name} - {self.request_date.strftime('%Y-%m-%d')}"
     
     def get_total_price(self):
-        """حساب السعر الإجمالي للطلب"""
+        """حساب السعر الإجمالي للطلب بالأسعار الحالية (للقوائم استخدم with_totals أو total_price المخزن)"""
         individual_price = sum(test.price for test in self.individual_tests.all())
         group_price = sum(group.total_price for group in self.test_groups.all())
         return individual_price + group_price
     
-    def check_completion_status(self):
-        """ معالجة الحالات اذا طلب تحليل مجموعة و تحاليل مفرد موجود ضمن المجموعة!!!"""
-        """التحقق من اكتمال جميع النتائج وتحديث الحالة"""
-        # التحقق من النتائج الفردية
+    def count_expected_results(self):
+        """عدد النتائج المطلوبة: التحاليل الفردية + تحاليل كل مجموعة"""
         individual_tests_count = self.individual_tests.count()
+        group_tests_count = TestGroup.tests.through.objects.filter(testgroup__testrequest=self).count()
+        return individual_tests_count + group_tests_count
+
+    def count_entered_results(self):
+        """عدد النتائج المدخلة (الفردية + المجموعات)"""
         individual_results_count = IndividualTestResult.objects.filter(test_request=self).count()
-        
-        # التحقق من نتائج المجموعات
-        group_tests_count = 0
-        for group in self.test_groups.all():
-            group_tests_count += group.tests.count()
-        
         group_results_count = TestGroupResult.objects.filter(test_request=self).count()
-        print('individual_tests_count:',individual_tests_count)
-        print('group_tests_count:',group_tests_count)
-        print('individual_results_count:',individual_results_count)
-        print('group_results_count:',group_results_count)
+        return individual_results_count + group_results_count
+
+    def _calculate_completion_percentage(self):
+        if self.expected_results_count == 0:
+            return 0
+        return round((self.entered_results_count / self.expected_results_count) * 100, 1)
+
+    def refresh_total_price(self):
+        """تسجيل سعر الطلب بالأسعار الحالية (عند إنشاء الطلب أو تعديل تحاليله)"""
+        self.total_price = TestRequest.objects.with_totals().values_list('tests_total', flat=True).get(pk=self.pk)
+        TestRequest.objects.filter(pk=self.pk).update(total_price=self.total_price)
+
+    def refresh_completion_counters(self):
+        """إعادة حساب عدادات الاكتمال من قاعدة البيانات وحفظها"""
+        self.expected_results_count = self.count_expected_results()
+        self.entered_results_count = self.count_entered_results()
+        self.completion_percentage = self._calculate_completion_percentage()
+        self.save(update_fields=['expected_results_count', 'entered_results_count', 'completion_percentage'])
+
+    def adjust_entered_results(self, delta):
+        """زيادة أو إنقاص عدد النتائج المدخلة بدون إعادة العد"""
+        TestRequest.objects.filter(pk=self.pk).update(entered_results_count=Case(
+            When(entered_results_count__lt=-delta, then=Value(0)),
+            default=F('entered_results_count') + delta,
+        ))
+
+    def check_completion_status(self):
+        """ معالجة الحالات اذا طلب تحليل مجموعة و تحاليل مفرد موجود ضمن المجموعة!!!"""
+        """التحقق من اكتمال جميع النتائج وتحديث الحالة (من العدادات المخزنة بدون إعادة العد)"""
+        self.refresh_from_db(fields=['expected_results_count', 'entered_results_count'])
+
         # إجمالي التحاليل المطلوبة والنتائج المدخلة
-        total_tests = individual_tests_count + group_tests_count
-        total_results = individual_results_count + group_results_count
-        
-        print('total_tests',total_tests)
-        print('total_results',total_results)
+        total_tests = self.expected_results_count
+        total_results = self.entered_results_count
+
         # تحديث الحالة إذا تم إدخال جميع النتائج
         if total_tests > 0 and total_results >= total_tests:
-            if self.status != 'completed':
-                self.status = 'completed'
-                print('-------:completed')
-                self.save(update_fields=['status'])
-                return True
-        elif total_results > 0 and self.status == 'pending':
-            # تحديث إلى "قيد التنفيذ" إذا تم إدخال بعض النتائج
-            self.status = 'in_progress'
-            print('-------:in_progress')
-            self.save(update_fields=['status'])
-            return True
+            status = 'completed'
+        elif total_results > 0 and self.status in ('pending', 'in_progress'):
+            # "قيد التنفيذ" إذا تم إدخال بعض النتائج
+            status = 'in_progress'
+        elif total_results == 0 and self.status == 'pending':
+            status = 'pending'
         else:
-            self.status = 'cancelled'
-            print('-------:cancelled')
-            self.save(update_fields=['status'])
-            return True
-        return False
+            # تم حذف احد النتائج
+            status = 'cancelled'
+
+        percentage = self._calculate_completion_percentage()
+        if status == self.status and percentage == self.completion_percentage:
+            return False
+
+        self.status = status
+        self.completion_percentage = percentage
+        self.save(update_fields=['status', 'completion_percentage'])
+        return True
     
     def get_completion_percentage(self):
         """حساب نسبة اكتمال النتائج"""
-        individual_tests_count = self.individual_tests.count()
-        individual_results_count = IndividualTestResult.objects.filter(test_request=self).count()
-        
-        group_tests_count = 0
-        for group in self.test_groups.all():
-            group_tests_count += group.tests.count()
-        
-        group_results_count = TestGroupResult.objects.filter(test_request=self).count()
-        
-        total_tests = individual_tests_count + group_tests_count
-        total_results = individual_results_count + group_results_count
-        
-        if total_tests == 0:
-            return 0
-        
-        return round((total_results / total_tests) * 100, 1)
+        return self._calculate_completion_percentage()
     
 
 
@@ -248,6 +381,8 @@ class IndividualTestResult(models.Model):
         ('normal', 'طبيعي'),
         ('high', 'مرتفع'),
         ('low', 'منخفض'),
+        ('critical_high', 'مرتفع حرج'),
+        ('critical_low', 'منخفض حرج'),
         ('abnormal', 'غير طبيعي'),
         ('n/a', 'غير محدد'),
     ]
@@ -259,6 +394,8 @@ class IndividualTestResult(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, blank=True, verbose_name='الحالة')
     result_date = models.DateTimeField(auto_now_add=True, verbose_name='تاريخ النتيجة')
     notes = models.TextField(blank=True, verbose_name='ملاحظات')
+    # سعر التحليل وقت إدخال النتيجة (قيمة النتائج في الملخص اليومي لا تتغير مع تعديل الأسعار)
+    price = models.DecimalField(max_digits=10, decimal_places=2, null=True, editable=False, verbose_name='السعر')
 
     entered_by = models.ForeignKey(User,related_name="results_entered",on_delete=models.SET_NULL,null=True, blank=True,
         verbose_name='أدخل بواسطة')
@@ -274,57 +411,41 @@ class IndividualTestResult(models.Model):
         verbose_name_plural = 'نتائج التحاليل الفردية'
         ordering = ['-result_date']
         unique_together = ['test_request', 'individual_test']
+        indexes = [
+            # نتائج الطلب بترتيب التاريخ (التقارير)، unique_together يغطي البحث بـ (test_request, individual_test)
+            models.Index(fields=['test_request', '-result_date'], name='lab_result_request_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.individual_test.name} - {self.value} {self.individual_test.unit}"
 
+    def evaluate_status(self, gender=None, age=None):
+        """تحديد حالة النتيجة بناءً على القيم الطبيعية وجنس المريض ('M' أو 'F') وعمره"""
+        from .reference_ranges import classify, patient_age
+
+        if gender is None:
+            patient = self.test_request.patient
+            gender, age = patient.gender, patient_age(patient)
+        status = classify(self.individual_test, gender, self.value, age)
+        if status:
+            self.status = status
+        elif not self.status:
+            # إذا القيمة ليست رقمية (مثلاً "Positive") ولا توجد قيمة نصية طبيعية للمقارنة
+            self.status = 'n/a'
+        return self.status
+
     def save(self, *args, **kwargs):
         """تحديد حالة النتيجة تلقائياً بناءً على القيم الطبيعية وجنس المريض"""
-        try:
-            numeric_value = Decimal(self.value)
-            gender = self.test_request.patient.get_gender_display()
-
-            if gender == 'ذكر':
-                min_val = self.individual_test.normal_value_min_m
-                max_val = self.individual_test.normal_value_max_m
-                # إذا كانت القيم الفارغة، استخدم النص العام
-                if min_val is None or max_val is None:
-                    try:
-                        vals = self.individual_test.normal_value_m.split('-')
-                        min_val = Decimal(vals[0].strip())
-                        max_val = Decimal(vals[1].strip()) if len(vals) > 1 else None
-                    except Exception:
-                        min_val, max_val = None, None
-
-            else:  # أنثى
-                min_val = self.individual_test.normal_value_min_f
-                max_val = self.individual_test.normal_value_max_f
-                if min_val is None or max_val is None:
-                    try:
-                        vals = self.individual_test.normal_value_f.split('-')
-                        min_val = Decimal(vals[0].strip())
-                        max_val = Decimal(vals[1].strip()) if len(vals) > 1 else None
-                    except Exception:
-                        min_val, max_val = None, None
-
-            # تحديد الحالة
-            if min_val is not None and numeric_value < min_val:
-                self.status = 'low'
-            elif max_val is not None and numeric_value > max_val:
-                self.status = 'high'
-            else:
-                self.status = 'normal'
-
-        except (InvalidOperation, TypeError, AttributeError):
-            # إذا القيمة ليست رقمية (مثلاً "Positive") أو لا يمكن استخراج القيم
-            if not self.status:
-                self.status = 'n/a'
+        self.evaluate_status()
+        if self.price is None:
+            self.price = self.individual_test.price
 
         super().save(*args, **kwargs)
 
-        # تحديث حالة طلب التحليل بعد حفظ النتيجة
+        # تحديث حالة طلب التحليل بعد حفظ النتيجة (أو تأجيله داخل deferred_completion)
         if self.test_request:
-            self.test_request.check_completion_status()
+            from .completion import schedule_completion_check
+            schedule_completion_check(self.test_request)
 
 
 class TestGroupResult(models.Model):
@@ -357,9 +478,10 @@ class TestGroupResult(models.Model):
         """تحديث حالة طلب التحليل بعد حفظ نتيجة المجموعة"""
         super().save(*args, **kwargs)
         
-        # تحديث حالة طلب التحليل بعد حفظ النتيجة
+        # تحديث حالة طلب التحليل بعد حفظ النتيجة (أو تأجيله داخل deferred_completion)
         if self.test_request:
-            self.test_request.check_completion_status()
+            from .completion import schedule_completion_check
+            schedule_completion_check(self.test_request)
 
 
 class PrintedReport(models.Model):
@@ -405,6 +527,10 @@ class DeviceResult(models.Model):
                 name='unique_device_barcode_test_time'
             )
         ]
+        indexes = [
+            # قائمة انتظار دمج نتائج الأجهزة (is_active=True بترتيب الإدخال)
+            models.Index(fields=['is_active', 'insert_datetime'], name='lab_device_active_time_idx'),
+        ]
 
     def __str__(self):
         return f"{self.device_name} - {self.barcode.barcode} - {self.test.name} - {self.result} - {'نشط' if self.is_active else 'غير نشط'}"
@@ -433,3 +559,141 @@ class DeviceOrder(models.Model):
         return f"{self.accession_number.barcode} - {self.online_test.name} - {self.accession_number.name} - {'نشط' if self.is_order_sent else 'غير نشط'}"
 
 
+class DailyTestStat(models.Model):
+    """ملخص يومي لصفحة التقارير: عدد نتائج كل تحليل حسب يوم الطلب (lab/rollups.py)"""
+    day = models.DateField(verbose_name='اليوم')
+    test = models.ForeignKey(IndividualTest, on_delete=models.CASCADE, related_name='daily_stats', verbose_name='التحليل')
+    results = models.PositiveIntegerField(default=0, verbose_name='عدد النتائج')
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='قيمة النتائج')
+
+    class Meta:
+        verbose_name = 'ملخص يومي للتحاليل'
+        verbose_name_plural = 'الملخص اليومي للتحاليل'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'test'], name='unique_daily_test_stat'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} - {self.test_id} - {self.results}"
+
+
+class DailyStatusStat(models.Model):
+    """ملخص يومي: عدد الطلبات حسب الحالة ويوم الطلب"""
+    day = models.DateField(verbose_name='اليوم')
+    status = models.CharField(max_length=20, choices=TestRequest.STATUS_CHOICES, verbose_name='الحالة')
+    requests = models.PositiveIntegerField(default=0, verbose_name='عدد الطلبات')
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='الإيراد')
+
+    class Meta:
+        verbose_name = 'ملخص يومي للحالات'
+        verbose_name_plural = 'الملخص اليومي للحالات'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'status'], name='unique_daily_status_stat'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} - {self.status} - {self.requests}"
+
+
+class DailyDepartmentStat(models.Model):
+    """ملخص يومي: عدد النتائج حسب القسم (IndividualTest.description) ويوم الطلب"""
+    day = models.DateField(verbose_name='اليوم')
+    department = models.CharField(max_length=20, choices=IndividualTest.DEPARTMENT, verbose_name='القسم')
+    results = models.PositiveIntegerField(default=0, verbose_name='عدد النتائج')
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='قيمة النتائج')
+
+    class Meta:
+        verbose_name = 'ملخص يومي للأقسام'
+        verbose_name_plural = 'الملخص اليومي للأقسام'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'department'], name='unique_daily_department_stat'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} - {self.department} - {self.results}"
+
+
+class DailyUserStat(models.Model):
+    """ملخص يومي لكل مستخدم: الطلبات التي أنشأها (created_by) والنتائج التي أدخلها (entered_by)"""
+    day = models.DateField(verbose_name='اليوم')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_stats', verbose_name='المستخدم')
+    requests = models.PositiveIntegerField(default=0, verbose_name='عدد الطلبات')
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='إيراد الطلبات')
+    results = models.PositiveIntegerField(default=0, verbose_name='عدد النتائج')
+
+    class Meta:
+        verbose_name = 'ملخص يومي للمستخدمين'
+        verbose_name_plural = 'الملخص اليومي للمستخدمين'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'user'], name='unique_daily_user_stat'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} - {self.user_id} - {self.requests}/{self.results}"
+
+
+class TurnaroundSample(models.Model):
+    """أزمنة نتيجة واحدة من الطلب حتى التقرير (lab/turnaround.py)، والمدد بالثواني"""
+    result = models.OneToOneField(
+        IndividualTestResult, on_delete=models.CASCADE, primary_key=True, related_name='turnaround', verbose_name='النتيجة',
+    )
+    test_request = models.ForeignKey(TestRequest, on_delete=models.CASCADE, related_name='turnaround_samples', verbose_name='الطلب')
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, verbose_name='المريض')
+    test = models.ForeignKey(IndividualTest, on_delete=models.CASCADE, verbose_name='التحليل')
+    department = models.CharField(max_length=20, choices=IndividualTest.DEPARTMENT, verbose_name='القسم')
+    day = models.DateField(verbose_name='يوم الطلب')
+
+    ordered_at = models.DateTimeField(verbose_name='وقت الطلب')
+    analyzed_at = models.DateTimeField(null=True, blank=True, verbose_name='وقت الجهاز')
+    verified_at = models.DateTimeField(verbose_name='وقت اعتماد النتيجة')
+    reported_at = models.DateTimeField(null=True, blank=True, verbose_name='وقت طباعة التقرير')
+
+    order_to_analyzer = models.PositiveIntegerField(null=True, blank=True, verbose_name='الطلب ← الجهاز')
+    analyzer_to_verified = models.PositiveIntegerField(null=True, blank=True, verbose_name='الجهاز ← الاعتماد')
+    order_to_verified = models.PositiveIntegerField(verbose_name='الطلب ← الاعتماد')
+    order_to_report = models.PositiveIntegerField(null=True, blank=True, verbose_name='الطلب ← التقرير')
+
+    class Meta:
+        verbose_name = 'زمن إنجاز نتيجة'
+        verbose_name_plural = 'أزمنة إنجاز النتائج'
+        indexes = [
+            models.Index(fields=['day'], name='lab_tat_sample_day_idx'),
+            # النتائج التي تنتظر طباعة التقرير
+            models.Index(fields=['reported_at', 'verified_at'], name='lab_tat_sample_report_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.result_id} - {self.order_to_verified}s"
+
+
+class DailyTurnaround(models.Model):
+    """النسب المئوية (p50/p90/p99) لأزمنة الإنجاز لكل يوم
+
+    صف لكل (يوم، مقياس) للكل (بدون قسم وتحليل)، ولكل قسم، ولكل تحليل.
+    """
+    METRIC_CHOICES = [
+        ('order_to_analyzer', 'الطلب ← الجهاز'),
+        ('analyzer_to_verified', 'الجهاز ← الاعتماد'),
+        ('order_to_verified', 'الطلب ← الاعتماد'),
+        ('order_to_report', 'الطلب ← التقرير'),
+    ]
+
+    day = models.DateField(verbose_name='اليوم')
+    metric = models.CharField(max_length=30, choices=METRIC_CHOICES, verbose_name='المقياس')
+    department = models.CharField(max_length=20, blank=True, choices=IndividualTest.DEPARTMENT, verbose_name='القسم')
+    test = models.ForeignKey(IndividualTest, on_delete=models.CASCADE, null=True, blank=True, verbose_name='التحليل')
+    samples = models.PositiveIntegerField(default=0, verbose_name='عدد النتائج')
+    p50 = models.PositiveIntegerField(verbose_name='p50 (ثانية)')
+    p90 = models.PositiveIntegerField(verbose_name='p90 (ثانية)')
+    p99 = models.PositiveIntegerField(verbose_name='p99 (ثانية)')
+
+    class Meta:
+        verbose_name = 'زمن الإنجاز اليومي'
+        verbose_name_plural = 'أزمنة الإنجاز اليومية'
+        indexes = [
+            models.Index(fields=['day', 'metric'], name='lab_tat_daily_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} - {self.metric} - {self.department or 'all'} - p90={self.p90}s"
+
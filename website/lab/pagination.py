@@ -0,0 +1,186 @@
+"""تقسيم الصفحات بالمؤشر (keyset) بدلاً من OFFSET
+
+الصفحة التالية تبدأ بعد آخر صف في الصفحة الحالية حسب أعمدة الترتيب
+(مثلاً created_at ثم id)، فيكون الاستعلام WHERE + ORDER BY + LIMIT على فهرس
+بنفس التكلفة للصفحة الأولى والصفحة الألف، وبدون COUNT(*) لكل طلب.
+المؤشر في الرابط (?after= أو ?before=) هو قيم أعمدة الترتيب لصف الحد.
+
+العدد الإجمالي اختياري وتقريبي: في MySQL بدون فلتر يُقرأ من
+information_schema، ومع الفلتر يُعد حتى حد أعلى فقط (مثل "1000+").
+"""
+import base64
+import json
+from collections.abc import Sequence
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+# أقصى عدد يُحسب بدقة عند وجود فلتر (بعده يظهر "1000+")
+COUNT_LIMIT = 1000
+
+MIN_PAGE_SIZE = 5
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _cursor_value(value):
+    # isoformat كامل: DjangoJSONEncoder يقطع الأجزاء من الثانية إلى ميلي ثانية فيضيع ترتيب الصفوف
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def encode_cursor(values):
+    data = json.dumps([_cursor_value(value) for value in values], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(cursor, fields):
+    """قيم المؤشر محولة لأنواع الحقول (datetime، رقم...)"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+    if not isinstance(values, list) or len(values) != len(fields):
+        raise InvalidCursor(cursor)
+    try:
+        return [field.to_python(value) for field, value in zip(fields, values)]
+    except Exception:
+        raise InvalidCursor(cursor)
+
+
+def _keyset_filter(ordering, values, forward):
+    """(a, b, c) بعد (va, vb, vc) حسب اتجاه كل عمود:
+    a >= va AND (a > va  OR  (a = va AND b > vb)  OR  (a = va AND b = vb AND c > vc))
+
+    الشرط الأول (a >= va) زائد منطقياً لكنه يجعل قاعدة البيانات تقرأ الفهرس
+    كمجال واحد بالترتيب وتتوقف عند LIMIT، بدلاً من دمج عدة مجالات ثم ترتيبها.
+    """
+    condition = Q()
+    equal = Q()
+    for name, value in zip(ordering, values):
+        descending = name.startswith('-')
+        name = name.lstrip('-')
+        lookup = 'lt' if descending == forward else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    first = ordering[0]
+    first_lookup = 'lte' if first.startswith('-') == forward else 'gte'
+    return Q(**{f"{first.lstrip('-')}__{first_lookup}": values[0]}) & condition
+
+
+class KeysetPage(Sequence):
+    def __init__(self, object_list, ordering, has_next, has_previous, page_size, params, count=None, count_exact=True):
+        self.object_list = object_list
+        self.ordering = ordering
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.page_size = page_size
+        self.count = count
+        self.count_exact = count_exact
+        self._params = params
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def _cursor(self, obj):
+        return encode_cursor([getattr(obj, name.lstrip('-')) for name in self.ordering])
+
+    def _query(self, **cursor):
+        params = self._params.copy()
+        for key in ('after', 'before', 'page'):
+            params.pop(key, None)
+        params.update(cursor)
+        return params.urlencode()
+
+    @property
+    def first_query(self):
+        return self._query()
+
+    @property
+    def next_query(self):
+        return self._query(after=self._cursor(self.object_list[-1])) if self.has_next else ''
+
+    @property
+    def previous_query(self):
+        return self._query(before=self._cursor(self.object_list[0])) if self.has_previous else ''
+
+    @property
+    def count_display(self):
+        if self.count is None:
+            return ''
+        return f'{self.count}' if self.count_exact else f'{self.count}+'
+
+
+def page_size_from(request, default):
+    """حجم الصفحة من ?per_page= ضمن الحدود، وإلا القيمة الافتراضية من الإعدادات"""
+    try:
+        size = int(request.GET.get('per_page', default))
+    except (TypeError, ValueError):
+        size = default
+    return max(MIN_PAGE_SIZE, min(size, MAX_PAGE_SIZE))
+
+
+def approximate_count(queryset):
+    """(العدد، دقيق؟) بدون عد كل الجدول"""
+    if not queryset.query.where and connection.vendor == 'mysql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row and row[0] is not None:
+            return row[0], False
+    count = queryset.order_by()[:COUNT_LIMIT + 1].count()
+    if count > COUNT_LIMIT:
+        return COUNT_LIMIT, False
+    return count, True
+
+
+def keyset_paginate(request, queryset, ordering, page_size, with_count=None):
+    """صفحة من queryset حسب ?after= / ?before=
+
+    ordering: أعمدة الترتيب ويجب أن يكون آخرها فريداً (id) حتى لا تتكرر الصفوف.
+    مؤشر غير صالح يعيد الصفحة الأولى.
+    """
+    if with_count is None:
+        with_count = getattr(settings, 'LIST_APPROXIMATE_COUNT', True)
+    model = queryset.model
+    fields = [model._meta.get_field(name.lstrip('-')) for name in ordering]
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+
+    count = count_exact = None
+    if with_count:
+        count, count_exact = approximate_count(queryset)
+
+    try:
+        if before:
+            values = decode_cursor(before, fields)
+            reverse = [name[1:] if name.startswith('-') else f'-{name}' for name in ordering]
+            rows = list(queryset.filter(_keyset_filter(ordering, values, forward=False)).order_by(*reverse)[:page_size + 1])
+            has_previous = len(rows) > page_size
+            object_list = rows[:page_size][::-1]
+            return KeysetPage(object_list, ordering, True, has_previous, page_size, request.GET, count, count_exact)
+        if after:
+            queryset = queryset.filter(_keyset_filter(ordering, decode_cursor(after, fields), forward=True))
+    except InvalidCursor:
+        after = None
+
+    rows = list(queryset.order_by(*ordering)[:page_size + 1])
+    return KeysetPage(rows[:page_size], ordering, len(rows) > page_size, bool(after), page_size, request.GET, count, count_exact)
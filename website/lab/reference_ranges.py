@@ -0,0 +1,196 @@
+"""محرك القيم الطبيعية: تصنيف النتائج (طبيعي / مرتفع / منخفض / حرج / غير طبيعي)
+
+تُحوَّل القيم الطبيعية لكل تحليل (الحقول الرقمية أو النص مثل "4-11" أو "Negative")
+وجدول القيم حسب الجنس والعمر (ReferenceInterval) مرة واحدة إلى بنية ثابتة محفوظة
+في الذاكرة، وتُلغى عند حفظ التحليل أو قيمه (signals).
+كل مسارات الحفظ (النموذج، النماذج الجماعية، دمج الأجهزة) والتقارير تستخدم classify،
+ومن يصنف لوحة تحاليل كاملة يستدعي prime أولاً لتحميل الفئات العمرية باستعلام واحد.
+"""
+from collections import defaultdict, namedtuple
+from decimal import Decimal, InvalidOperation
+
+# low/high: حدود رقمية (Decimal أو None)، text: قيمة نصية طبيعية مثل "negative"، display: للعرض في التقارير
+ReferenceRange = namedtuple(
+    'ReferenceRange', ['low', 'high', 'text', 'display', 'critical_low', 'critical_high'],
+    defaults=(None, None),
+)
+# male/female: القيم من حقول التحليل، *_intervals: (age_from, age_to, ReferenceRange) مرتبة حسب الأولوية
+CompiledTest = namedtuple('CompiledTest', ['male', 'female', 'male_intervals', 'female_intervals'])
+
+_EMPTY_RANGE = ReferenceRange(None, None, '', '')
+
+# رقم التحليل -> (updated_at, CompiledTest)
+_cache = {}
+
+_INTERVAL_FIELDS = ('test_id', 'sex', 'age_from', 'age_to', 'low', 'high', 'critical_low', 'critical_high')
+
+
+def _to_decimal(text):
+    try:
+        number = Decimal(str(text).strip())
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+    return number if number.is_finite() else None
+
+
+def _parse_text(text):
+    """تحويل نص القيم الطبيعية إلى (low, high, text)"""
+    text = (text or '').strip()
+    if not text:
+        return None, None, ''
+
+    for prefix in ('<=', '≤', '<'):
+        if text.startswith(prefix):
+            return None, _to_decimal(text[len(prefix):]), ''
+    for prefix in ('>=', '≥', '>'):
+        if text.startswith(prefix):
+            return _to_decimal(text[len(prefix):]), None, ''
+
+    parts = text.split('-')
+    low = _to_decimal(parts[0])
+    if low is not None:
+        high = _to_decimal(parts[1]) if len(parts) > 1 else None
+        if len(parts) > 1 and high is None:
+            return None, None, ''
+        return low, high, ''
+
+    # قيمة نصية (مثلاً "Negative")
+    return None, None, text.casefold()
+
+
+def _compile_range(min_value, max_value, text):
+    display = (text or '').strip()
+    if min_value is not None and max_value is not None:
+        return ReferenceRange(Decimal(min_value), Decimal(max_value), '', f'{min_value} - {max_value}')
+    low, high, text_value = _parse_text(text)
+    if not display and (min_value is not None or max_value is not None):
+        display = str(min_value if min_value is not None else max_value)
+    return ReferenceRange(low, high, text_value, display)
+
+
+def _compile_interval(interval, fallback):
+    """تحويل صف ReferenceInterval إلى ReferenceRange (القيمة النصية تبقى من حقول التحليل)"""
+    low, high = interval['low'], interval['high']
+    if low is not None and high is not None:
+        display = f'{low} - {high}'
+    elif high is not None:
+        display = f'< {high}'
+    elif low is not None:
+        display = f'> {low}'
+    else:
+        low, high, display = fallback.low, fallback.high, fallback.display
+    return ReferenceRange(low, high, fallback.text, display, interval['critical_low'], interval['critical_high'])
+
+
+def _intervals_for(sex, intervals, fallback):
+    # الفئات الخاصة بالجنس أولاً ثم الفئات العامة ('A')، وداخل كل منها حسب بداية العمر
+    matching = sorted(
+        (interval for interval in intervals if interval['sex'] in (sex, 'A')),
+        key=lambda interval: (interval['sex'] == 'A', interval['age_from']),
+    )
+    return tuple(
+        (interval['age_from'], interval['age_to'], _compile_interval(interval, fallback))
+        for interval in matching
+    )
+
+
+def compile_test(test, intervals=None):
+    """تحويل القيم الطبيعية للتحليل إلى بنية ثابتة (ذكر / أنثى + الفئات العمرية)"""
+    if intervals is None:
+        intervals = list(test.reference_intervals.values(*_INTERVAL_FIELDS)) if test.pk else []
+    male = _compile_range(test.normal_value_min_m, test.normal_value_max_m, test.normal_value_m)
+    female = _compile_range(test.normal_value_min_f, test.normal_value_max_f, test.normal_value_f)
+    return CompiledTest(
+        male=male,
+        female=female,
+        male_intervals=_intervals_for('M', intervals, male),
+        female_intervals=_intervals_for('F', intervals, female),
+    )
+
+
+def _is_fresh(test):
+    entry = _cache.get(test.pk)
+    return entry is not None and entry[0] == test.updated_at
+
+
+def prime(tests):
+    """تحميل القيم الطبيعية لعدة تحاليل (لوحة كاملة) باستعلام واحد للفئات العمرية"""
+    from .models import ReferenceInterval
+
+    stale = {test.pk: test for test in tests if test is not None and test.pk is not None and not _is_fresh(test)}
+    if not stale:
+        return
+
+    intervals = defaultdict(list)
+    for interval in ReferenceInterval.objects.filter(test_id__in=stale).values(*_INTERVAL_FIELDS):
+        intervals[interval['test_id']].append(interval)
+    for pk, test in stale.items():
+        _cache[pk] = (test.updated_at, compile_test(test, intervals[pk]))
+
+
+def _compiled(test):
+    if not _is_fresh(test):
+        entry = (test.updated_at, compile_test(test))
+        if test.pk is not None:
+            _cache[test.pk] = entry
+        return entry[1]
+    return _cache[test.pk][1]
+
+
+def patient_age(patient):
+    """عمر المريض بالسنوات (من تاريخ الميلاد إن وجد)"""
+    return patient.calculate_age() if patient.date_of_birth else patient.age
+
+
+def get_reference_range(test, gender, age=None):
+    """القيم الطبيعية للتحليل حسب الجنس ('M' أو 'F') والعمر بالسنوات"""
+    if test is None:
+        return _EMPTY_RANGE
+    compiled = _compiled(test)
+    if gender == 'M':
+        reference, intervals = compiled.male, compiled.male_intervals
+    else:
+        reference, intervals = compiled.female, compiled.female_intervals
+
+    for age_from, age_to, interval_range in intervals:
+        if age is None:
+            # بدون عمر معروف: فقط الفئات التي تغطي كل الأعمار
+            if age_from == 0 and age_to is None:
+                return interval_range
+        elif age_from <= age and (age_to is None or age < age_to):
+            return interval_range
+    return reference
+
+
+def invalidate(test_id=None):
+    """حذف التحليل من الذاكرة (أو كل التحاليل)"""
+    if test_id is None:
+        _cache.clear()
+    else:
+        _cache.pop(test_id, None)
+
+
+def classify(test, gender, value, age=None):
+    """تصنيف النتيجة: 'critical_low' / 'low' / 'high' / 'critical_high' / 'normal' / 'abnormal'، أو None إذا تعذر التصنيف"""
+    reference = get_reference_range(test, gender, age)
+    numeric_value = _to_decimal(value)
+
+    if numeric_value is not None:
+        if reference.critical_low is not None and numeric_value < reference.critical_low:
+            return 'critical_low'
+        if reference.critical_high is not None and numeric_value > reference.critical_high:
+            return 'critical_high'
+        if reference.low is not None and numeric_value < reference.low:
+            return 'low'
+        if reference.high is not None and numeric_value > reference.high:
+            return 'high'
+        return 'normal'
+
+    if reference.text and value is not None:
+        return 'normal' if str(value).strip().casefold() == reference.text else 'abnormal'
+    return None
+
+
+def format_range(test, gender, age=None):
+    """نص القيم الطبيعية للعرض في التقارير"""
+    return get_reference_range(test, gender, age).display
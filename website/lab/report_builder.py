@@ -0,0 +1,140 @@
+"""تجميع نتائج المريض للتقارير (العرض، الطباعة، PDF، واتساب)
+
+ReportBuilder يجلب نتائج مريض واحد أو عدة مرضى بعدد ثابت من الاستعلامات
+(لا يعتمد على عدد النتائج أو المرضى)، ويجمعها ويرتبها مرة واحدة، ويعيد
+بنية بسيطة (dict/list/قيم) لا تحتوي على كائنات ORM، فيمكن تخزينها في الكاش.
+"""
+from django.db.models import Count
+
+from .models import IndividualTestResult, TestGroupResult, TestRequest
+from .reference_ranges import format_range, patient_age, prime as prime_reference_ranges
+
+# نتائج المجموعات تظهر دائماً في آخر القسم
+GROUP_RESULT_ORDER = 9999
+
+_RESULT_FIELDS = (
+    'value', 'status', 'result_date', 'test_request_id', 'test_request__patient_id',
+    'individual_test__id', 'individual_test__name', 'individual_test__unit',
+    'individual_test__description', 'individual_test__subclass', 'individual_test__display_order',
+    'individual_test__normal_value_min_m', 'individual_test__normal_value_max_m',
+    'individual_test__normal_value_min_f', 'individual_test__normal_value_max_f',
+    'individual_test__normal_value_m', 'individual_test__normal_value_f',
+    'individual_test__updated_at',
+)
+
+
+class ReportBuilder:
+    """بناء بيانات تقرير النتائج
+
+    group_by:
+        'section'     -> subclass ثم description ثم اسم التحليل، مرتبة حسب display_order (الطباعة و PDF)
+        'description' -> description أو اسم التحليل، بترتيب تاريخ النتيجة (صفحة التقرير)
+    include_group_results: إضافة سطر لكل نتيجة مجموعة تحاليل
+    """
+    GROUP_BY_SECTION = 'section'
+    GROUP_BY_DESCRIPTION = 'description'
+
+    def __init__(self, group_by=GROUP_BY_SECTION, include_group_results=True):
+        if group_by not in (self.GROUP_BY_SECTION, self.GROUP_BY_DESCRIPTION):
+            raise ValueError(f'group_by غير معروف: {group_by}')
+        self.group_by = group_by
+        self.include_group_results = include_group_results
+
+    def _group_key(self, test):
+        description = (test.description or '').strip()
+        if self.group_by == self.GROUP_BY_SECTION:
+            subclass = (test.subclass or '').strip()
+            return subclass or description or test.name
+        return description or test.name
+
+    @staticmethod
+    def _empty_report(patient):
+        return {
+            'patient_id': patient.pk,
+            'gender': patient.gender,
+            'age': patient_age(patient),
+            'requests_count': 0,
+            'results_count': 0,
+            'groups': {},
+        }
+
+    def build(self, patient):
+        """بيانات تقرير مريض واحد"""
+        return self.build_many([patient])[patient.pk]
+
+    def build_many(self, patients, requests=None):
+        """بيانات تقارير عدة مرضى: {patient_id: report} بنفس عدد الاستعلامات لمريض واحد
+
+        requests: أرقام طلبات (أو queryset طلبات) لتقييد التقارير بها، افتراضياً كل طلبات المريض
+        """
+        reports = {patient.pk: self._empty_report(patient) for patient in patients}
+        # طلب التحليل يرتبط بالمريض عن طريق الباركود (to_field='barcode')
+        by_barcode = {patient.barcode: reports[patient.pk] for patient in patients}
+        if not by_barcode:
+            return reports
+
+        # عدد الطلبات لكل مريض (استعلام 1)
+        scope = {} if requests is None else {'pk__in': requests}
+        result_scope = {} if requests is None else {'test_request__in': requests}
+        requests_count = (
+            TestRequest.objects.filter(patient_id__in=by_barcode, **scope)
+            .values_list('patient_id').annotate(count=Count('id')).order_by()
+        )
+        for barcode, count in requests_count:
+            by_barcode[barcode]['requests_count'] = count
+
+        # النتائج الفردية مع الأعمدة المطلوبة فقط (استعلام 2)
+        individual_results = list(
+            IndividualTestResult.objects.filter(test_request__patient_id__in=by_barcode, **result_scope)
+            .select_related('individual_test', 'test_request')
+            .only(*_RESULT_FIELDS)
+            .order_by('-result_date')
+        )
+        # القيم الطبيعية لكل التحاليل دفعة واحدة (استعلام 3 عند الحاجة فقط)
+        prime_reference_ranges(result.individual_test for result in individual_results)
+
+        for result in individual_results:
+            test = result.individual_test
+            report = by_barcode[result.test_request.patient_id]
+            report['results_count'] += 1
+            report['groups'].setdefault(self._group_key(test), []).append({
+                'test_name': test.name,
+                'result_value': result.value,
+                'unit': test.unit,
+                'normal_range': format_range(test, report['gender'], report['age']),
+                'status': result.status,
+                'result_date': result.result_date,
+                'test_request_id': result.test_request_id,
+                'display_order': test.display_order,
+            })
+
+        # نتائج المجموعات (استعلام 4)
+        if self.include_group_results:
+            group_results = (
+                TestGroupResult.objects.filter(test_request__patient_id__in=by_barcode, **result_scope)
+                .values_list(
+                    'test_request__patient_id', 'test_request_id', 'test_group__name',
+                    'test_group__description', 'status', 'result_date',
+                )
+                .order_by('-result_date')
+            )
+            for barcode, request_id, name, description, status, result_date in group_results:
+                group_key = (description or '').strip() or name
+                by_barcode[barcode]['groups'].setdefault(group_key, []).append({
+                    'test_name': name,
+                    'result_value': 'مجموعة تحاليل',
+                    'unit': '',
+                    'normal_range': '',
+                    'status': status,
+                    'result_date': result_date,
+                    'test_request_id': request_id,
+                    'display_order': GROUP_RESULT_ORDER,
+                })
+
+        # ترتيب كل قسم حسب display_order (sorted ثابت: يحافظ على ترتيب التاريخ داخل نفس الترتيب)
+        if self.group_by == self.GROUP_BY_SECTION:
+            for report in reports.values():
+                for rows in report['groups'].values():
+                    rows.sort(key=lambda row: row['display_order'])
+
+        return reports
@@ -0,0 +1,186 @@
+"""تصدير تقارير عدة مرضى دفعة واحدة (فترة زمنية أو قائمة طلبات)
+
+بيانات كل التقارير تُجلب عن طريق ReportBuilder.build_many بعدد ثابت من
+الاستعلامات، ومقيدة بالطلبات المحددة فقط (لا كل طلبات المريض)، والتوليد يتم
+في مجمع عمليات report_jobs (تقرير لكل مريض بالتوازي) مع إعادة استخدام كاش
+PDF. النتيجة إما ملف PDF واحد مدمج (pypdf) أو ZIP يُرسل للعميل أثناء التوليد
+(كل تقرير يُضاف للأرشيف فور انتهائه).
+"""
+import io
+import logging
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .models import Patient, TestRequest
+from .report_builder import ReportBuilder
+from .report_jobs import submit
+from .report_pdf import read_cached_pdf, render_pdf, render_report_html, report_digest, store_pdf
+
+logger = logging.getLogger(__name__)
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min), timezone.get_current_timezone())
+
+
+def select_requests(date_from=None, date_to=None, request_ids=None):
+    """الطلبات ضمن الفترة (تاريخ الطلب) أو ضمن أرقام الطلبات المحددة"""
+    requests = TestRequest.objects.all()
+    if request_ids:
+        requests = requests.filter(id__in=request_ids)
+    # حدود الفترة كـ datetime (يستخدم فهرس request_date بدل تحويل كل صف إلى تاريخ)
+    if date_from:
+        requests = requests.filter(request_date__gte=_day_start(date_from))
+    if date_to:
+        requests = requests.filter(request_date__lt=_day_start(date_to + timedelta(days=1)))
+    return requests
+
+
+def select_patients(requests):
+    """المرضى أصحاب الطلبات المحددة (select_requests)"""
+    return Patient.objects.filter(barcode__in=requests.values('patient_id')).order_by('full_name')
+
+
+def report_filename(patient):
+    return f"report_{patient.pk}_{slugify(patient.full_name, allow_unicode=True)}.pdf"
+
+
+class ReportRenderError(Exception):
+    """تعذر توليد تقرير أو أكثر (أو تشغيل عمليات التوليد)"""
+
+
+def iter_report_pdfs(patients, base_url=None, requests=None):
+    """توليد (patient, pdf_data) لكل مريض حسب ترتيب الانتهاء
+
+    التقارير الموجودة في الكاش تُعاد فوراً، والباقي يُرسل لمجمع العمليات عند
+    الاستدعاء نفسه (لا عند أول قراءة من المولّد)، فتعطل المجمع يظهر كـ
+    ReportRenderError قبل إرسال أي بايت للعميل. تقرير فشل توليده يُسجل ويُعاد
+    بـ pdf_data = None بدل إيقاف بقية التقارير.
+    تقارير الطلبات المحددة (requests) لا تُحفظ في الكاش حتى لا تحذف التقرير الكامل
+    المحفوظ لنفس المريض.
+    """
+    patients = list(patients)
+    reports = ReportBuilder().build_many(patients, requests)
+
+    cached, pending = [], {}
+    for patient in patients:
+        report = reports[patient.pk]
+        digest = report_digest(patient, report)
+        pdf_data = read_cached_pdf(patient.pk, digest)
+        if pdf_data is not None:
+            cached.append((patient, pdf_data))
+            continue
+        html_string = render_report_html(patient, report)
+        try:
+            future = submit(render_pdf, html_string, base_url)
+        except BrokenProcessPool as exc:
+            logger.exception('batch report export could not be submitted')
+            raise ReportRenderError('تعذر تشغيل عمليات توليد PDF.') from exc
+        pending[future] = (patient, digest, html_string)
+
+    return _collect_pdfs(cached, pending, base_url, store=requests is None)
+
+
+def _collect_pdfs(cached, pending, base_url, store):
+    yield from cached
+
+    retried = set()
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            patient, digest, html_string = pending.pop(future)
+            try:
+                pdf_data = future.result()
+            except BrokenProcessPool:
+                # توقفت إحدى عمليات المجمع: submit يعيد إنشاءه، ونعيد كل تقرير مرة واحدة فقط
+                if patient.pk not in retried:
+                    retried.add(patient.pk)
+                    logger.warning('report render pool broke while rendering patient %s, retrying', patient.pk)
+                    try:
+                        pending[submit(render_pdf, html_string, base_url)] = (patient, digest, html_string)
+                        continue
+                    except BrokenProcessPool:
+                        pass
+                logger.exception('report for patient %s could not be rendered', patient.pk)
+                yield patient, None
+                continue
+            except Exception:  # noqa: BLE001
+                logger.exception('report for patient %s could not be rendered', patient.pk)
+                yield patient, None
+                continue
+            if store:
+                store_pdf(patient.pk, digest, pdf_data)
+            yield patient, pdf_data
+
+
+class _StreamBuffer:
+    """ملف للكتابة فقط يجمع ما يكتبه zipfile حتى نرسله للعميل"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(patients, base_url=None, requests=None):
+    """أرشيف ZIP لتقارير المرضى يُرسل على دفعات (تقرير واحد في كل دفعة)
+
+    التوليد يبدأ هنا (قد يرفع ReportRenderError قبل بدء الاستجابة)، وتقرير فشل
+    توليده يُستبدل بملف نصي يذكر الخطأ حتى لا يصل أرشيف ناقص بدون تنبيه.
+    """
+    return _zip_chunks(iter_report_pdfs(patients, base_url, requests))
+
+
+def _zip_chunks(reports):
+    buffer = _StreamBuffer()
+    # zipfile يكتب بدون seek عندما لا يدعم الملف ذلك (data descriptors)
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for patient, pdf_data in reports:
+            if pdf_data is None:
+                archive.writestr(
+                    f'report_{patient.pk}_error.txt',
+                    f'تعذر توليد تقرير المريض {patient.full_name} ({patient.pk}).',
+                )
+            else:
+                archive.writestr(report_filename(patient), pdf_data)
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+def merged_pdf(patients, base_url=None, requests=None):
+    """ملف PDF واحد يحتوي تقارير كل المرضى بالترتيب (أو None إذا لا يوجد مرضى)
+
+    كل تقرير يُولَّد بالتوازي (أو يُقرأ من الكاش) ثم تُضم الصفحات بالترتيب.
+    فشل أي تقرير يرفع ReportRenderError (الملف المدمج لا يُرسل ناقصاً).
+    """
+    from pypdf import PdfWriter
+
+    patients = list(patients)
+    if not patients:
+        return None
+    pdfs = {patient.pk: pdf_data for patient, pdf_data in iter_report_pdfs(patients, base_url, requests)}
+    failed = [pk for pk, pdf_data in pdfs.items() if pdf_data is None]
+    if failed:
+        raise ReportRenderError(f"تعذر توليد تقارير المرضى: {', '.join(map(str, failed))}")
+
+    writer = PdfWriter()
+    for patient in patients:
+        writer.append(io.BytesIO(pdfs[patient.pk]))
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
@@ -0,0 +1,159 @@
+"""طابور توليد تقارير PDF في الخلفية
+
+الطلب يُجهَّز في عملية الويب (بيانات التقرير + HTML)، أما WeasyPrint فيعمل في
+ProcessPoolExecutor بعدد أنوية المعالج، فلا تنتظر عملية الويب انتهاء التوليد.
+حالة كل مهمة محفوظة في الكاش المشترك، فيمكن الاستعلام عنها من أي عملية ويب،
+والملف الناتج يُحفظ في كاش PDF (report_pdf) ويُحمَّل عن طريق digest.
+
+مهمة بقيت pending أكثر من REPORT_RENDER_TIMEOUT ثانية (توقفت العملية التي
+أضافتها مثلاً) تُعتبر فاشلة، وطلب نفس التقرير بعدها يضيف مهمة جديدة.
+"""
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .report_builder import ReportBuilder
+from .report_pdf import read_cached_pdf, render_pdf, render_report_html, report_digest, store_pdf
+
+logger = logging.getLogger(__name__)
+
+JOB_CACHE_PREFIX = 'lab:report_job:'
+DIGEST_CACHE_PREFIX = 'lab:report_job:digest:'
+JOB_TTL = 60 * 60 * 24  # يوم
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """مجمع العمليات (يُنشأ عند أول استخدام) بعدد REPORT_RENDER_WORKERS أو عدد الأنوية"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = getattr(settings, 'REPORT_RENDER_WORKERS', None) or os.cpu_count() or 1
+            # django.setup ضروري عند تشغيل العمليات بطريقة spawn (ويندوز)
+            _executor = ProcessPoolExecutor(max_workers=workers, initializer=django.setup)
+        return _executor
+
+
+def _reset_executor(broken):
+    """إزالة مجمع عمليات معطل (توقفت إحدى عملياته) ليُنشأ من جديد عند الطلب التالي"""
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False)
+
+
+def submit(fn, *args):
+    """إرسال مهمة للمجمع، مع إعادة إنشائه مرة واحدة إذا كان معطلاً"""
+    executor = get_executor()
+    try:
+        return executor.submit(fn, *args)
+    except BrokenProcessPool:
+        logger.warning('report render pool is broken, recreating it')
+        _reset_executor(executor)
+        return get_executor().submit(fn, *args)
+
+
+def _render_timeout():
+    return getattr(settings, 'REPORT_RENDER_TIMEOUT', 300)
+
+
+def _job_key(job_id):
+    return f'{JOB_CACHE_PREFIX}{job_id}'
+
+
+def get_job(job_id):
+    job = cache.get(_job_key(job_id))
+    if job and _timed_out(job):
+        job = _finish(job, 'failed', 'انتهت مهلة توليد التقرير.')
+    return job
+
+
+def _save_job(job):
+    cache.set(_job_key(job['id']), job, JOB_TTL)
+    return job
+
+
+def _new_job(patient, digest, status):
+    return {
+        'id': uuid.uuid4().hex,
+        'patient_id': patient.pk,
+        'digest': digest,
+        'status': status,   # pending / done / failed
+        'error': '',
+        'created_at': timezone.now().isoformat(),
+        'started_at': timezone.now().isoformat() if status == 'pending' else None,
+        'finished_at': None if status == 'pending' else timezone.now().isoformat(),
+    }
+
+
+def _timed_out(job):
+    if job['status'] != 'pending' or not job.get('started_at'):
+        return False
+    started_at = datetime.fromisoformat(job['started_at'])
+    return timezone.now() - started_at > timedelta(seconds=_render_timeout())
+
+
+def _finish(job, status, error=''):
+    job = dict(job, status=status, error=error, finished_at=timezone.now().isoformat())
+    _save_job(job)
+    # مهمة أحدث لنفس المحتوى قد تكون أُضيفت بعد انتهاء المهلة
+    digest_key = f"{DIGEST_CACHE_PREFIX}{job['digest']}"
+    if cache.get(digest_key) == job['id']:
+        cache.delete(digest_key)
+    return job
+
+
+def _on_rendered(job, future):
+    """يعمل في خيط داخل عملية الويب بعد انتهاء التوليد: حفظ الملف وتحديث حالة المهمة"""
+    try:
+        store_pdf(job['patient_id'], job['digest'], future.result())
+    except Exception as exc:  # noqa: BLE001
+        logger.exception('report job %s failed', job['id'])
+        _finish(job, 'failed', str(exc))
+    else:
+        _finish(job, 'done')
+
+
+def enqueue_report(patient, base_url=None, report=None):
+    """إضافة توليد تقرير المريض إلى الطابور وإرجاع بيانات المهمة
+
+    إذا كان نفس المحتوى موجوداً في الكاش تنتهي المهمة فوراً، وإذا كان قيد التوليد
+    تُعاد نفس المهمة بدل توليده مرة ثانية.
+    """
+    if report is None:
+        report = ReportBuilder().build(patient)
+    digest = report_digest(patient, report)
+
+    if read_cached_pdf(patient.pk, digest) is not None:
+        return _save_job(_new_job(patient, digest, 'done'))
+
+    # get_job يُنهي المهمة المعلقة بعد REPORT_RENDER_TIMEOUT فتُضاف مهمة جديدة
+    running = get_job(cache.get(f'{DIGEST_CACHE_PREFIX}{digest}') or '')
+    if running and running['status'] == 'pending':
+        return running
+
+    job = _save_job(_new_job(patient, digest, 'pending'))
+    cache.set(f'{DIGEST_CACHE_PREFIX}{digest}', job['id'], JOB_TTL)
+
+    # HTML يُجهَّز هنا (قاعدة البيانات والقوالب)، والـ PDF في عملية منفصلة
+    html_string = render_report_html(patient, report)
+    try:
+        future = submit(render_pdf, html_string, base_url)
+    except BrokenProcessPool as exc:
+        logger.exception('report job %s could not be submitted', job['id'])
+        return _finish(job, 'failed', str(exc) or 'تعذر تشغيل عمليات توليد PDF.')
+    future.add_done_callback(lambda done: _on_rendered(job, done))
+    return job
+
@@ -0,0 +1,127 @@
+"""توليد PDF تقرير المريض مع كاش على القرص حسب المحتوى
+
+مفتاح الكاش (digest) = hash لبيانات التقرير (النتائج، القيم الطبيعية، بيانات المريض)
++ hash لقالب الطباعة وكل القوالب التي يحملها ({% extends %} و {% include %}) مع
+REPORT_TEMPLATE_VERSION من الإعدادات (لتغييرات خارج القوالب مثل الخطوط والصور،
+تُزاد عند النشر). إذا لم يتغير شيء يُعاد نفس الملف بدون تشغيل WeasyPrint،
+وأي تعديل على النتائج أو القوالب يعطي مفتاحاً جديداً تلقائياً.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.template.loader import get_template, render_to_string
+from django.template.loader_tags import ExtendsNode, IncludeNode
+from django.utils import timezone
+
+from .report_builder import ReportBuilder
+
+REPORT_TEMPLATE = 'lab/patient_report_print.html'
+PAGE_CSS = '@page { size: A4; margin: 2cm 1.5cm; }'
+
+# بيانات المريض التي تظهر في رأس التقرير
+_PATIENT_FIELDS = ('full_name', 'age', 'gender', 'barcode', 'phone_number')
+
+
+def cache_dir():
+    return Path(settings.REPORT_PDF_CACHE_DIR)
+
+
+def _template_sources(name, seen):
+    """مصدر القالب ومصادر القوالب التي يحملها (أسماء ثابتة فقط)، كل قالب مرة واحدة"""
+    if name in seen:
+        return
+    seen.add(name)
+    template = get_template(name).template
+    yield template.source
+    for node in template.nodelist.get_nodes_by_type((ExtendsNode, IncludeNode)):
+        expression = node.parent_name if isinstance(node, ExtendsNode) else node.template
+        # اسم ثابت ('base.html') تكون قيمته نصاً، أما الاسم من متغير فلا يُعرف قبل العرض
+        if isinstance(expression.var, str) and not expression.filters:
+            yield from _template_sources(expression.var, seen)
+
+
+@lru_cache(maxsize=None)
+def template_version():
+    """hash لمصادر قوالب الطباعة (يتغير عند تعديل أي منها وإعادة تشغيل الخادم)"""
+    digest = hashlib.sha256()
+    for source in _template_sources(REPORT_TEMPLATE, set()):
+        digest.update(source.encode('utf-8'))
+    digest.update(PAGE_CSS.encode('utf-8'))
+    digest.update(str(getattr(settings, 'REPORT_TEMPLATE_VERSION', '')).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def report_digest(patient, report):
+    """مفتاح المحتوى لتقرير المريض"""
+    payload = {
+        'patient': [getattr(patient, field) for field in _PATIENT_FIELDS],
+        'groups': report['groups'],
+        'template': template_version(),
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def _cache_path(patient_id, digest):
+    return cache_dir() / f'{patient_id}-{digest}.pdf'
+
+
+def render_report_html(patient, report):
+    return render_to_string(REPORT_TEMPLATE, {
+        'patient': patient,
+        'results_by_group': report['groups'],
+        'report_date': timezone.now(),
+    })
+
+
+def render_pdf(html_string, base_url=None):
+    """تحويل HTML إلى PDF في الذاكرة (bytes) بدون ملفات مؤقتة"""
+    from weasyprint import HTML, CSS
+
+    return HTML(string=html_string, base_url=base_url).write_pdf(stylesheets=[CSS(string=PAGE_CSS)])
+
+
+def read_cached_pdf(patient_id, digest):
+    try:
+        return _cache_path(patient_id, digest).read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def store_pdf(patient_id, digest, pdf_data):
+    """حفظ الملف في الكاش (كتابة ذرية) وحذف النسخ القديمة لنفس المريض"""
+    directory = cache_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    path = _cache_path(patient_id, digest)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            output.write(pdf_data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    for old in directory.glob(f'{patient_id}-*.pdf'):
+        if old != path:
+            old.unlink(missing_ok=True)
+    return path
+
+
+def get_report_pdf(patient, base_url=None, report=None):
+    """إرجاع (digest, pdf_data) من الكاش أو بعد توليده"""
+    if report is None:
+        report = ReportBuilder().build(patient)
+    digest = report_digest(patient, report)
+
+    pdf_data = read_cached_pdf(patient.pk, digest)
+    if pdf_data is None:
+        pdf_data = render_pdf(render_report_html(patient, report), base_url)
+        store_pdf(patient.pk, digest, pdf_data)
+    return digest, pdf_data
@@ -0,0 +1,252 @@
+"""جداول الملخص اليومي لصفحة التقارير والتحليلات (حسب يوم الطلب بالتوقيت المحلي)
+
+- DailyTestStat: عدد النتائج وقيمتها (سعر التحليل المسجل في النتيجة) لكل (يوم، تحليل)
+- DailyDepartmentStat: عدد النتائج وقيمتها لكل (يوم، قسم)
+- DailyStatusStat: عدد الطلبات وإيرادها (total_price) لكل (يوم، حالة)
+- DailyUserStat: طلبات كل مستخدم (created_by) ونتائجه (entered_by) لكل يوم
+
+عدادات النتائج تُزاد وتُنقص مباشرة (UPDATE ... F() + n) من signals ومن مسارات
+الحفظ الجماعي (bulk_create لا يرسل post_save). وكذلك أرقام الطلبات: إنشاء طلب
+أو تغيير حالته أو سعره أو حذفه ينقل عدده وإيراده من خانته القديمة (يوم، حالة،
+مستخدم) إلى الجديدة بدون إعادة حساب اليوم.
+
+أمر rebuild_daily_stats يعيد بناء الأيام من الجداول الأصلية، ويمكن تشغيله كل
+ليلة (--days 2) لتصحيح أي فرق من التعديلات عن طريق update().
+"""
+from collections import Counter
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Case, Count, F, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import analytics
+from .models import (
+    DailyDepartmentStat, DailyStatusStat, DailyTestStat, DailyUserStat, IndividualTest, IndividualTestResult,
+    TestRequest,
+)
+
+ZERO = Decimal('0')
+
+
+def day_of(moment):
+    """يوم الطلب بالتوقيت المحلي"""
+    return timezone.localdate(moment)
+
+
+def day_bounds(day):
+    """بداية اليوم وبداية اليوم التالي (aware) للفلترة على request_date بالفهرس"""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+    return start, end
+
+
+def _increment(model, key, **deltas):
+    """زيادة/إنقاص أعمدة صف الملخص (بدون النزول تحت الصفر)، وإنشاء الصف إذا لم يوجد"""
+    updated = model.objects.filter(**key).update(**{
+        field: Case(
+            When(**{f'{field}__lt': -delta}, then=Value(0)),
+            default=F(field) + delta,
+            output_field=model._meta.get_field(field),
+        )
+        for field, delta in deltas.items()
+    })
+    if updated or any(delta < 0 for delta in deltas.values()) or not any(deltas.values()):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **deltas)
+    except IntegrityError:
+        # أنشأه طلب آخر في نفس اللحظة
+        model.objects.filter(**key).update(**{field: F(field) + delta for field, delta in deltas.items()})
+
+
+def record_results(results, delta=1):
+    """تسجيل نتائج أُضيفت (delta=1) أو حُذفت (delta=-1)
+
+    results: نتائج IndividualTestResult (محفوظة)؛ القيمة من سعرها المسجل (price) وقت
+    الإدخال، والمستخدم من entered_by.
+    استعلامان للأيام والأقسام ثم UPDATE واحد لكل (يوم، تحليل) و(يوم، قسم) و(يوم، مستخدم).
+    """
+    results = list(results)
+    request_days = {}
+    for result in results:
+        if IndividualTestResult.test_request.is_cached(result) and result.test_request.request_date:
+            request_days[result.test_request_id] = day_of(result.test_request.request_date)
+    missing = {result.test_request_id for result in results} - set(request_days)
+    if missing:
+        for request_id, request_date in TestRequest.objects.filter(pk__in=missing).values_list('id', 'request_date'):
+            request_days[request_id] = day_of(request_date)
+
+    by_test, test_revenue, by_user = Counter(), Counter(), Counter()
+    for result in results:
+        day = request_days.get(result.test_request_id)
+        if day is None:
+            continue
+        by_test[day, result.individual_test_id] += 1
+        test_revenue[day, result.individual_test_id] += result.price or ZERO
+        if result.entered_by_id:
+            by_user[day, result.entered_by_id] += 1
+    if not by_test:
+        return
+
+    departments = dict(
+        IndividualTest.objects.filter(pk__in={test_id for _, test_id in by_test}).values_list('id', 'description')
+    )
+    by_department, department_revenue = Counter(), Counter()
+    for (day, test_id), count in by_test.items():
+        revenue = test_revenue[day, test_id]
+        _increment(DailyTestStat, {'day': day, 'test_id': test_id}, results=count * delta, revenue=revenue * delta)
+        department = departments.get(test_id)
+        if department:
+            by_department[day, department] += count
+            department_revenue[day, department] += revenue
+    for (day, department), count in by_department.items():
+        _increment(
+            DailyDepartmentStat, {'day': day, 'department': department},
+            results=count * delta, revenue=department_revenue[day, department] * delta,
+        )
+    for (day, user_id), count in by_user.items():
+        _increment(DailyUserStat, {'day': day, 'user_id': user_id}, results=count * delta)
+    analytics.invalidate_days({day for day, _ in by_test})
+
+
+def _upsert(model, objs, unique_fields, update_fields):
+    # MySQL (ON DUPLICATE KEY UPDATE) لا يقبل تحديد unique_fields
+    if not connection.features.supports_update_conflicts_with_target:
+        unique_fields = None
+    model.objects.bulk_create(objs, update_conflicts=True, unique_fields=unique_fields, update_fields=update_fields)
+
+
+# أعمدة الطلب التي تحدد خانته في DailyStatusStat و DailyUserStat
+REQUEST_FIELDS = frozenset({'request_date', 'status', 'created_by', 'total_price'})
+
+
+def request_bucket(test_request):
+    """(يوم، حالة، مستخدم، سعر) الطلب كما هو في الذاكرة"""
+    return (
+        day_of(test_request.request_date), test_request.status,
+        test_request.created_by_id, test_request.total_price or ZERO,
+    )
+
+
+def stored_request_bucket(request_id):
+    """(يوم، حالة، مستخدم، سعر) الطلب كما هو محفوظ في قاعدة البيانات (أو None)"""
+    row = TestRequest.objects.filter(pk=request_id).values_list('request_date', 'status', 'created_by', 'total_price').first()
+    if row is None:
+        return None
+    request_date, status, user_id, price = row
+    return day_of(request_date), status, user_id, price or ZERO
+
+
+def move_request(before, after):
+    """نقل طلب بين خانات الملخص (before/after من request_bucket، أو None عند الإنشاء/الحذف)
+
+    الخانات التي لم يتغير صافيها لا تُحدَّث، فتغيير الحالة = UPDATE لخانتي الحالة فقط.
+    """
+    if before == after:
+        return
+    by_status, by_user = {}, {}
+    for bucket, delta in ((before, -1), (after, 1)):
+        if bucket is None:
+            continue
+        day, status, user_id, price = bucket
+        for changes, key in ((by_status, (day, status)), (by_user, (day, user_id))):
+            count, revenue = changes.get(key, (0, ZERO))
+            changes[key] = (count + delta, revenue + price * delta)
+
+    for (day, status), (count, revenue) in by_status.items():
+        if count or revenue:
+            _increment(DailyStatusStat, {'day': day, 'status': status}, requests=count, revenue=revenue)
+    for (day, user_id), (count, revenue) in by_user.items():
+        if user_id and (count or revenue):
+            _increment(DailyUserStat, {'day': day, 'user_id': user_id}, requests=count, revenue=revenue)
+    analytics.invalidate_days({day for day, _ in by_status})
+
+
+def refresh_requests(day):
+    """إعادة حساب عدد الطلبات وإيرادها ليوم واحد (حسب الحالة وحسب المستخدم)"""
+    start, end = day_bounds(day)
+    requests = TestRequest.objects.filter(request_date__gte=start, request_date__lt=end).order_by()
+    totals = dict(count=Count('id'), revenue=Coalesce(Sum('total_price'), ZERO))
+
+    by_status = {row['status']: row for row in requests.values('status').annotate(**totals)}
+    by_user = [row for row in requests.values('created_by').annotate(**totals) if row['created_by']]
+    with transaction.atomic():
+        _upsert(
+            DailyStatusStat,
+            [
+                DailyStatusStat(
+                    day=day, status=status,
+                    requests=by_status.get(status, {}).get('count', 0),
+                    revenue=by_status.get(status, {}).get('revenue', ZERO),
+                )
+                for status, _ in TestRequest.STATUS_CHOICES
+            ],
+            unique_fields=['day', 'status'], update_fields=['requests', 'revenue'],
+        )
+        # أعمدة الطلبات فقط، عمود النتائج يُحدَّث من record_results
+        DailyUserStat.objects.filter(day=day).update(requests=0, revenue=ZERO)
+        _upsert(
+            DailyUserStat,
+            [DailyUserStat(day=day, user_id=row['created_by'], requests=row['count'], revenue=row['revenue']) for row in by_user],
+            unique_fields=['day', 'user'], update_fields=['requests', 'revenue'],
+        )
+    analytics.invalidate_days({day})
+
+
+def rebuild_day(day, departments=None):
+    """إعادة بناء كل جداول الملخص ليوم واحد من الجداول الأصلية"""
+    if departments is None:
+        departments = dict(IndividualTest.objects.values_list('id', 'description'))
+    start, end = day_bounds(day)
+    results = IndividualTestResult.objects.filter(
+        test_request__request_date__gte=start, test_request__request_date__lt=end,
+    ).order_by()
+
+    test_rows = []
+    by_department, department_revenue = Counter(), Counter()
+    for test_id, count, revenue in (
+        results.values_list('individual_test').annotate(c=Count('id'), r=Coalesce(Sum('price'), ZERO))
+        .values_list('individual_test', 'c', 'r')
+    ):
+        test_rows.append(DailyTestStat(day=day, test_id=test_id, results=count, revenue=revenue))
+        department = departments.get(test_id)
+        if department:
+            by_department[department] += count
+            department_revenue[department] += revenue
+    by_user = results.filter(entered_by__isnull=False).values_list('entered_by').annotate(c=Count('id')).values_list('entered_by', 'c')
+
+    with transaction.atomic():
+        DailyTestStat.objects.filter(day=day).delete()
+        DailyDepartmentStat.objects.filter(day=day).delete()
+        DailyUserStat.objects.filter(day=day).delete()
+        DailyTestStat.objects.bulk_create(test_rows)
+        DailyDepartmentStat.objects.bulk_create(
+            DailyDepartmentStat(day=day, department=department, results=count, revenue=department_revenue[department])
+            for department, count in by_department.items()
+        )
+        DailyUserStat.objects.bulk_create(DailyUserStat(day=day, user_id=user_id, results=count) for user_id, count in by_user)
+        refresh_requests(day)
+
+
+def rebuild(start=None, end=None, progress=None):
+    """إعادة بناء الأيام من start إلى end (افتراضياً من أول طلب حتى اليوم)"""
+    if start is None:
+        first = TestRequest.objects.order_by('request_date').values_list('request_date', flat=True).first()
+        if first is None:
+            return 0
+        start = day_of(first)
+    end = end or timezone.localdate()
+    departments = dict(IndividualTest.objects.values_list('id', 'description'))
+    day = start
+    done = 0
+    while day <= end:
+        rebuild_day(day, departments)
+        done += 1
+        if progress:
+            progress(day)
+        day += timedelta(days=1)
+    return done
@@ -0,0 +1,176 @@
+"""بحث المرضى بدون فحص الجدول كاملاً (بدلاً من full_name__icontains)
+
+كل مريض له عمود search_name (الاسم بعد التوحيد: حذف التشكيل، أ/إ/آ → ا،
+ى → ي، ة → ه، الأرقام العربية → أرقام لاتينية) و search_phone (أرقام الهاتف
+فقط)، وجدول PatientSearchGram فيه كل مقطع ثلاثي (trigram) من كلمات الاسم.
+
+ترتيب البحث:
+1. أرقام فقط: باركود مطابق تماماً، أو بداية الباركود/الهاتف (فهرس عادي).
+2. بداية الاسم: search_name__istartswith (فهرس عادي).
+3. جزء من الاسم: المرضى الذين لديهم كل مقاطع الاستعلام في PatientSearchGram
+   ثم تأكيد النتيجة بـ search_name__icontains على هذه الصفوف فقط.
+"""
+import re
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from .models import Patient, PatientSearchGram
+
+GRAM_SIZE = 3
+
+# التشكيل، الألف الخنجرية، التطويل
+_DIACRITICS = re.compile('[\u064b-\u065f\u0670\u0640]')
+_FOLD = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ئ': 'ي',
+    'ؤ': 'و',
+    'ة': 'ه',
+    **{chr(0x0660 + i): str(i) for i in range(10)},  # ٠-٩
+    **{chr(0x06F0 + i): str(i) for i in range(10)},  # ۰-۹ (فارسي)
+})
+_NON_DIGITS = re.compile(r'\D')
+_NUMBER = re.compile(r'[\d\s+\-]+')
+
+
+def normalize_text(value):
+    """توحيد النص للبحث: نفس الاسم بكتابات مختلفة يعطي نفس الناتج"""
+    if not value:
+        return ''
+    value = _DIACRITICS.sub('', value).translate(_FOLD).lower()
+    return ' '.join(value.split())
+
+
+def normalize_phone(value):
+    """أرقام الهاتف فقط (بعد تحويل الأرقام العربية)"""
+    if not value:
+        return ''
+    return _NON_DIGITS.sub('', value.translate(_FOLD))
+
+
+def is_number(query):
+    """الاستعلام أرقام فقط (باركود أو هاتف)"""
+    return bool(_NUMBER.fullmatch(query))
+
+
+def trigrams(normalized):
+    """المقاطع الثلاثية لكل كلمة (الكلمات الأقصر من 3 أحرف ليس لها مقاطع)"""
+    grams = set()
+    for word in normalized.split():
+        grams.update(word[i:i + GRAM_SIZE] for i in range(len(word) - GRAM_SIZE + 1))
+    return grams
+
+
+# ------------------------------------------------------------------ الفهرس
+
+
+def index_patient(patient):
+    """تحديث مقاطع المريض في PatientSearchGram (الفرق فقط)"""
+    wanted = trigrams(patient.search_name)
+    existing = set(PatientSearchGram.objects.filter(patient=patient).values_list('gram', flat=True))
+    if wanted == existing:
+        return
+    with transaction.atomic():
+        PatientSearchGram.objects.filter(patient=patient, gram__in=existing - wanted).delete()
+        PatientSearchGram.objects.bulk_create(
+            [PatientSearchGram(patient=patient, gram=gram) for gram in wanted - existing],
+            ignore_conflicts=True,
+        )
+
+
+def rebuild_index(batch_size=1000, progress=None):
+    """إعادة بناء أعمدة البحث وجدول المقاطع لكل المرضى على دفعات"""
+    PatientSearchGram.objects.all().delete()
+    last_id = 0
+    done = 0
+    while True:
+        batch = list(
+            Patient.objects.filter(id__gt=last_id).order_by('id')
+            .only('id', 'full_name', 'phone_number')[:batch_size]
+        )
+        if not batch:
+            break
+        grams = []
+        for patient in batch:
+            patient.search_name = normalize_text(patient.full_name)
+            patient.search_phone = normalize_phone(patient.phone_number)
+            grams.extend(PatientSearchGram(patient_id=patient.id, gram=gram) for gram in trigrams(patient.search_name))
+        with transaction.atomic():
+            Patient.objects.bulk_update(batch, ['search_name', 'search_phone'])
+            PatientSearchGram.objects.bulk_create(grams, batch_size=5000)
+        last_id = batch[-1].id
+        done += len(batch)
+        if progress:
+            progress(done)
+    return done
+
+
+# ------------------------------------------------------------------ البحث
+
+
+# ملاحظة: istartswith وليس startswith، لأن Django يحول startswith في MySQL إلى
+# LIKE BINARY الذي لا يستخدم الفهرس. الأعمدة موحدة مسبقاً فلا فرق في النتيجة.
+
+
+def _digits_query(queryset, digits):
+    if not digits:
+        return queryset.none()
+    exact = queryset.filter(barcode=digits)
+    if exact.exists():
+        return exact
+    return queryset.filter(barcode__istartswith=digits) | queryset.filter(search_phone__istartswith=digits)
+
+
+def _gram_query(queryset, normalized, driving_join=False):
+    """المرضى الذين يحتوي اسمهم الموحد على normalized (عن طريق المقاطع الثلاثية)
+
+    driving_join: المقطع الأول كـ JOIN يقود الاستعلام فيتوقف عند الـ LIMIT
+    (للإكمال التلقائي). بدونه يكون IN (subquery) مناسباً للعد والصفحات.
+    """
+    grams = sorted(trigrams(normalized))
+    if not grams:
+        # كلمات قصيرة فقط: لا يوجد مقاطع، فالبحث ببداية الاسم
+        return queryset.filter(search_name__istartswith=normalized)
+
+    outer = OuterRef('id' if driving_join else 'patient_id')
+    others = [Exists(PatientSearchGram.objects.filter(gram=gram, patient_id=outer)) for gram in grams[1:]]
+    if driving_join:
+        queryset = queryset.filter(search_grams__gram=grams[0], *others)
+    else:
+        candidates = PatientSearchGram.objects.filter(*others, gram=grams[0]).values('patient_id')
+        queryset = queryset.filter(id__in=candidates)
+    return queryset.filter(search_name__icontains=normalized)
+
+
+def search_patients(query, queryset=None):
+    """المرضى المطابقون للاستعلام (اسم، جزء من الاسم، باركود، أو بداية رقم الهاتف)"""
+    queryset = Patient.objects.all() if queryset is None else queryset
+    query = (query or '').strip()
+    if not query:
+        return queryset
+
+    if is_number(query):
+        return _digits_query(queryset, normalize_phone(query))
+    # بداية الاسم جزء من "يحتوي" فلا حاجة لاستعلام منفصل لها
+    return _gram_query(queryset, normalize_text(query))
+
+
+def typeahead(query, limit=10):
+    """نتائج سريعة للإكمال التلقائي: بداية الاسم أولاً، ثم المقاطع إذا لم تكفِ"""
+    query = (query or '').strip()
+    if not query:
+        return []
+
+    fields = ('id', 'full_name', 'barcode')
+    if is_number(query):
+        return list(_digits_query(Patient.objects.only(*fields), normalize_phone(query)).order_by()[:limit])
+
+    normalized = normalize_text(query)
+    patients = list(Patient.objects.only(*fields).filter(search_name__istartswith=normalized).order_by('search_name')[:limit])
+    if len(patients) < limit:
+        seen = [patient.id for patient in patients]
+        patients += list(
+            _gram_query(Patient.objects.only(*fields), normalized, driving_join=True)
+            .exclude(id__in=seen).order_by()[:limit - len(patients)]
+        )
+    return patients
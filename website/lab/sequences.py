@@ -0,0 +1,115 @@
+"""تسلسل باركود المرضى: yymmdd + رقم تسلسلي يومي بدون تكرار
+
+كل عملية تحجز مجموعة أرقام (block) دفعة واحدة من BarcodeSequence داخل
+select_for_update، ثم توزعها من الذاكرة، فلا تحتاج قاعدة البيانات لكل مريض
+ولا يحدث تصادم مع unique كما في الرقم العشوائي السابق. الأرقام غير المستخدمة
+في block (عند إعادة تشغيل العملية) تبقى فجوات فقط.
+
+الحجز يتم على اتصال منفصل بقاعدة البيانات في معاملة خاصة به تُحفظ فوراً:
+لو كان حفظ المريض داخل atomic خارجي ثم تراجع، لا يتراجع العداد بينما الأرقام
+ما زالت في ذاكرة العملية (فتحجزها عملية أخرى مرة ثانية)، ولا يبقى قفل الصف
+حتى نهاية معاملة المستدعي. قواعد البيانات بدون أقفال صفوف (SQLite) تسمح
+بكاتب واحد فقط، فيُحجز هناك على اتصال المستدعي، وداخل معاملة مفتوحة يُحجز رقم
+واحد بدون block في الذاكرة (يتراجع مع المعاملة نفسها).
+"""
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connection, connections, transaction
+from django.utils import timezone
+
+from .models import BarcodeSequence, Patient
+
+# عدد الأرقام الأدنى بعد التاريخ (مثل الصيغة القديمة yymmdd + 4 أرقام)
+SUFFIX_DIGITS = 4
+
+_blocks = {}   # day -> [next_value, last_value]
+_lock = threading.Lock()
+
+
+def _block_size():
+    return getattr(settings, 'PATIENT_BARCODE_BLOCK_SIZE', 20)
+
+
+def format_barcode(day, value):
+    return f"{day:%y%m%d}{value:0{SUFFIX_DIGITS}d}"
+
+
+def _existing_max(day, using=DEFAULT_DB_ALIAS):
+    """أكبر رقم مستخدم لهذا اليوم في باركودات المرضى الحالية (لبدء العداد بعده)"""
+    prefix = f"{day:%y%m%d}"
+    suffixes = Patient.objects.using(using).filter(barcode__startswith=prefix).values_list('barcode', flat=True)
+    return max((int(code[len(prefix):]) for code in suffixes if code[len(prefix):].isdigit()), default=0)
+
+
+# اسم مؤقت للاتصال المنفصل (غير موجود في DATABASES)
+SEQUENCE_DB_ALIAS = 'barcode_sequence'
+
+
+@contextmanager
+def _own_connection():
+    """اتصال جديد بنفس إعدادات default، خارج أي معاملة مفتوحة في هذا الـ thread"""
+    wrapper = connections.create_connection(DEFAULT_DB_ALIAS)
+    connections[SEQUENCE_DB_ALIAS] = wrapper
+    try:
+        yield SEQUENCE_DB_ALIAS
+    finally:
+        wrapper.close()
+        del connections[SEQUENCE_DB_ALIAS]
+
+
+def _shares_transaction():
+    # اتصال ثانٍ في SQLite ينتظر قفل الكتابة الذي يملكه المستدعي نفسه
+    return not connection.features.has_select_for_update
+
+
+def _reserve(day, size, using):
+    with transaction.atomic(using=using):
+        sequences = BarcodeSequence.objects.using(using).select_for_update()
+        sequence = sequences.filter(day=day).first()
+        if sequence is None:
+            try:
+                with transaction.atomic(using=using):
+                    sequence = BarcodeSequence.objects.using(using).create(day=day, last_value=_existing_max(day, using))
+            except IntegrityError:
+                # عملية أخرى أنشأت عداد اليوم في نفس اللحظة
+                sequence = sequences.get(day=day)
+
+        first = sequence.last_value + 1
+        sequence.last_value += size
+        sequence.save(using=using, update_fields=['last_value'])
+    return first, sequence.last_value
+
+
+def reserve_block(day, size):
+    """حجز size رقم لليوم بشكل ذري (معاملة مستقلة تُحفظ فوراً) وإرجاع (أول رقم، آخر رقم)"""
+    if _shares_transaction():
+        return _reserve(day, size, DEFAULT_DB_ALIAS)
+    with _own_connection() as using:
+        return _reserve(day, size, using)
+
+
+def allocate_barcode(day=None):
+    """باركود جديد لمريض (من block محجوز مسبقاً في الذاكرة)"""
+    day = day or timezone.localdate()
+    if _shares_transaction() and connection.in_atomic_block:
+        # الحجز يتراجع مع معاملة المستدعي، فلا نحتفظ بأرقام في الذاكرة
+        first, _ = reserve_block(day, 1)
+        return format_barcode(day, first)
+    with _lock:
+        block = _blocks.get(day)
+        if block is None or block[0] > block[1]:
+            # أيام سابقة لم تعد مطلوبة
+            _blocks.clear()
+            block = _blocks[day] = list(reserve_block(day, _block_size()))
+        value = block[0]
+        block[0] += 1
+    return format_barcode(day, value)
+
+
+def preallocate_range(count, day=None):
+    """حجز مجال أرقام لأنابيب/ملصقات مطبوعة مسبقاً وإرجاع قائمة الباركودات"""
+    day = day or timezone.localdate()
+    first, last = reserve_block(day, count)
+    return [format_barcode(day, value) for value in range(first, last + 1)]
@@ -0,0 +1,123 @@
+"""تحديث عدادات اكتمال الطلبات وذاكرة القيم الطبيعية وكاش الباركود وفهرس البحث وإحصائيات الرئيسية والملخص اليومي عند تغيير البيانات"""
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import barcodes, dashboard, reference_ranges, rollups, search, typeahead
+from .completion import record_entered_results
+from .models import (
+    IndividualTest, IndividualTestResult, Patient, ReferenceInterval, TestGroup, TestGroupResult, TestRequest,
+)
+
+
+@receiver(post_save, sender=IndividualTestResult)
+@receiver(post_save, sender=TestGroupResult)
+def result_created(sender, instance, created, **kwargs):
+    """نتيجة جديدة: زيادة عدد النتائج المدخلة للطلب"""
+    if created and not kwargs.get('raw'):
+        record_entered_results(instance.test_request_id, 1)
+        if sender is IndividualTestResult:
+            rollups.record_results([instance])
+
+
+@receiver(post_delete, sender=IndividualTestResult)
+@receiver(post_delete, sender=TestGroupResult)
+def result_deleted(sender, instance, **kwargs):
+    """حذف نتيجة: إنقاص عدد النتائج المدخلة للطلب"""
+    record_entered_results(instance.test_request_id, -1)
+    if sender is IndividualTestResult:
+        rollups.record_results([instance], -1)
+
+
+@receiver(m2m_changed, sender=TestRequest.individual_tests.through)
+@receiver(m2m_changed, sender=TestRequest.test_groups.through)
+def request_tests_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """إضافة/حذف تحاليل أو مجموعات من الطلب: إعادة حساب عدد النتائج المطلوبة وسعر الطلب وإيراد يومه"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    requests = [instance] if not reverse else TestRequest.objects.filter(pk__in=pk_set or [])
+    for test_request in requests:
+        test_request.refresh_completion_counters()
+        before = rollups.stored_request_bucket(test_request.pk)
+        test_request.refresh_total_price()
+        rollups.move_request(before, rollups.request_bucket(test_request))
+
+
+@receiver(m2m_changed, sender=TestGroup.tests.through)
+def group_tests_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """تعديل تحاليل مجموعة: تحديث الطلبات التي تحتوي هذه المجموعة"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        requests = TestRequest.objects.filter(test_groups__in=pk_set or [])
+    else:
+        requests = TestRequest.objects.filter(test_groups=instance)
+    for test_request in requests.distinct():
+        test_request.refresh_completion_counters()
+
+
+@receiver(post_save, sender=IndividualTest)
+@receiver(post_delete, sender=IndividualTest)
+def individual_test_changed(sender, instance, **kwargs):
+    """تعديل القيم الطبيعية للتحليل: حذفه من ذاكرة محرك القيم الطبيعية"""
+    reference_ranges.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=ReferenceInterval)
+@receiver(post_delete, sender=ReferenceInterval)
+def reference_interval_changed(sender, instance, **kwargs):
+    """تعديل الفئات العمرية: تحديث updated_at للتحليل حتى تُعاد قراءته في كل العمليات"""
+    IndividualTest.objects.filter(pk=instance.test_id).update(updated_at=timezone.now())
+    reference_ranges.invalidate(instance.test_id)
+
+
+@receiver(post_save, sender=Patient)
+def patient_changed(sender, instance, created, raw=False, **kwargs):
+    """تعديل اسم المريض أو هاتفه: تحديث مقاطع البحث وحذف صور QR القديمة من كاش الباركود"""
+    if raw:
+        return
+    search.index_patient(instance)
+    if created:
+        dashboard.adjust(patients=1)
+    else:
+        barcodes.invalidate_patient(instance)
+    typeahead.patient_saved(instance)
+
+
+@receiver(post_delete, sender=Patient)
+def patient_deleted(sender, instance, **kwargs):
+    typeahead.patient_deleted(instance.id)
+    dashboard.adjust(patients=-1)
+
+
+@receiver(pre_save, sender=TestRequest)
+def test_request_saving(sender, instance, update_fields=None, raw=False, **kwargs):
+    """قراءة خانة الطلب في الملخص اليومي قبل تعديل حالته أو تاريخه أو منشئه أو سعره"""
+    instance._rollup_before = None
+    if raw or instance._state.adding:
+        return
+    if update_fields is not None and not rollups.REQUEST_FIELDS & set(update_fields):
+        return
+    instance._rollup_before = rollups.stored_request_bucket(instance.pk)
+
+
+@receiver(post_save, sender=TestRequest)
+def test_request_saved(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    """طلب جديد يُضاف لإحصائيات الرئيسية، وتغيير الحالة يعيد حسابها وينقل الطلب بين خانات ملخص يومه"""
+    if raw:
+        return
+    if created:
+        dashboard.adjust(status=instance.status, requests=1)
+        rollups.move_request(None, rollups.request_bucket(instance))
+        return
+    if update_fields is None or 'status' in update_fields:
+        dashboard.invalidate()
+    before = getattr(instance, '_rollup_before', None)
+    if before is not None:
+        rollups.move_request(before, rollups.request_bucket(instance))
+
+
+@receiver(post_delete, sender=TestRequest)
+def test_request_deleted(sender, instance, **kwargs):
+    dashboard.adjust(status=instance.status, requests=-1)
+    rollups.move_request(rollups.request_bucket(instance), None)
@@ -1,3 +1,1048 @@
-from django.test import TestCase
+import os
+import time
+import zipfile
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.http import QueryDict
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    analytics, barcodes, completion, dashboard, pagination, reference_ranges, report_export, report_jobs, report_pdf,
+    rollups, search, sequences, turnaround, typeahead,
+)
+from .device_sync import merge_device_results
+from .forms import BulkIndividualTestResultForm
+from .report_builder import ReportBuilder
+from .models import (
+    BarcodeSequence, DailyDepartmentStat, DailyStatusStat, DailyTestStat, DailyTurnaround, DailyUserStat, DeviceResult, IndividualTest,
+    IndividualTestResult, Patient, PrintedReport, ReferenceInterval, TestGroup, TestGroupResult,
+    TestRequest, TurnaroundSample,
+)
+
+
+class ListQueryCountTests(TestCase):
+    """عدد الاستعلامات في قائمة الطلبات وتفاصيل المريض ثابت مهما كان عدد الصفوف"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='lab', password='lab')
+        tests = [IndividualTest.objects.create(name=f'Test {i}', app_name=f'T{i}', unit='mg/dL', price=1000 + i) for i in range(3)]
+        group = TestGroup.objects.create(name='Panel', app_name='P', total_price=5000)
+        group.tests.set(tests[:2])
+
+        cls.patient = Patient.objects.create(full_name='مريض تجريبي', gender='M', age=40)
+        for _ in range(25):
+            test_request = TestRequest.objects.create(patient=cls.patient, created_by=cls.user)
+            test_request.individual_tests.set(tests)
+            test_request.test_groups.set([group])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def _count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_request_list_does_not_grow_with_page_size(self):
+        url = reverse('test_request_list')
+        small = self._count_queries(f'{url}?per_page=5')
+        large = self._count_queries(f'{url}?per_page=25')
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, 8)
+
+    def test_patient_detail_does_not_grow_with_requests(self):
+        url = reverse('patient_detail', args=[self.patient.id])
+        many = self._count_queries(url)
+        TestRequest.objects.filter(id__in=TestRequest.objects.values('id')[:20]).delete()
+        few = self._count_queries(url)
+        self.assertEqual(many, few)
+        self.assertLessEqual(many, 8)
+
+    def test_with_totals_matches_get_total_price(self):
+        for test_request in TestRequest.objects.with_totals()[:3]:
+            self.assertEqual(test_request.tests_total, test_request.get_total_price())
+
+    def test_total_price_snapshot_ignores_later_price_changes(self):
+        test_request = TestRequest.objects.first()
+        ordered_price = test_request.get_total_price()
+        self.assertEqual(test_request.total_price, ordered_price)
+
+        IndividualTest.objects.update(price=1)
+        test_request.refresh_from_db()
+        self.assertEqual(test_request.total_price, ordered_price)
+        self.assertNotEqual(TestRequest.objects.with_totals().get(pk=test_request.pk).tests_total, ordered_price)
+
+
+class DailyRollupTests(TestCase):
+    """الملخص اليومي المحدَّث من signals يطابق إعادة البناء من الجداول الأصلية"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='lab', password='lab')
+        cls.tests = [
+            IndividualTest.objects.create(name=f'Test {i}', unit='mg/dL', price=1000, description=department)
+            for i, department in enumerate(['hematology', 'chemistry', 'chemistry'])
+        ]
+        cls.patient = Patient.objects.create(full_name='مريض تجريبي', gender='M', age=40)
+
+    def _snapshot(self):
+        return (
+            sorted(DailyTestStat.objects.filter(results__gt=0).values_list('day', 'test_id', 'results', 'revenue')),
+            sorted(DailyStatusStat.objects.filter(requests__gt=0).values_list('day', 'status', 'requests', 'revenue')),
+            sorted(DailyDepartmentStat.objects.filter(results__gt=0).values_list('day', 'department', 'results', 'revenue')),
+            sorted(DailyUserStat.objects.values_list('day', 'user_id', 'requests', 'revenue', 'results')),
+        )
+
+    def test_incremental_updates_match_rebuild(self):
+        requests = []
+        for _ in range(3):
+            test_request = TestRequest.objects.create(patient=self.patient, created_by=self.user)
+            test_request.individual_tests.set(self.tests)
+            for test in self.tests:
+                IndividualTestResult.objects.create(
+                    test_request=test_request, individual_test=test, value='5', entered_by=self.user,
+                )
+            requests.append(test_request)
+        IndividualTestResult.objects.filter(test_request=requests[0], individual_test=self.tests[1]).delete()
+        requests[1].delete()
+        requests[2].status = 'cancelled'
+        requests[2].save(update_fields=['status'])
+
+        incremental = self._snapshot()
+        rollups.rebuild()
+        self.assertEqual(incremental, self._snapshot())
+        self.assertEqual(
+            dict(DailyDepartmentStat.objects.values_list('department', 'results')),
+            {'hematology': 2, 'chemistry': 3},
+        )
+
+        summary = analytics.summary(timezone.localdate() - timedelta(days=60), timezone.localdate())
+        self.assertEqual(summary['totals']['requests'], 2)
+        self.assertEqual(summary['totals']['revenue'], 6000)
+        self.assertEqual(summary['totals']['results'], 5)
+        self.assertEqual([(user['requests'], user['results']) for user in summary['users']], [(2, 5)])
+
+    def test_revenue_uses_price_at_entry(self):
+        test_request = TestRequest.objects.create(patient=self.patient, created_by=self.user)
+        test_request.individual_tests.set(self.tests[:1])
+        IndividualTestResult.objects.create(test_request=test_request, individual_test=self.tests[0], value='5')
+        IndividualTest.objects.filter(pk=self.tests[0].pk).update(price=5000)
+        IndividualTestResult.objects.create(
+            test_request=TestRequest.objects.create(patient=self.patient),
+            individual_test=IndividualTest.objects.get(pk=self.tests[0].pk), value='6',
+        )
+
+        incremental = self._snapshot()
+        rollups.rebuild()
+        self.assertEqual(incremental, self._snapshot())
+        self.assertEqual(list(DailyTestStat.objects.values_list('results', 'revenue')), [(2, 6000)])
+
+    def test_reports_view_reads_rollups(self):
+        test_request = TestRequest.objects.create(patient=self.patient, created_by=self.user)
+        IndividualTestResult.objects.create(test_request=test_request, individual_test=self.tests[0], value='5')
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('reports'))
+        self.assertEqual(response.context['total_requests'], 1)
+        self.assertEqual(response.context['total_patients'], 1)
+        self.assertEqual([test['name'] for test in response.context['popular_tests']], ['Test 0'])
+
+
+class CompletionCounterTests(TestCase):
+    """عدادات الاكتمال المخزنة تتبع تحاليل الطلب ونتائجه بدون إعادة العد"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='lab', password='lab')
+        cls.tests = [IndividualTest.objects.create(name=f'Test {i}', unit='-', price=1000) for i in range(3)]
+        cls.group = TestGroup.objects.create(name='Panel', total_price=2000)
+        cls.group.tests.set(cls.tests[1:])
+        cls.patient = Patient.objects.create(full_name='مريض تجريبي', gender='M', age=40)
+
+    def _counters(self, test_request):
+        test_request.refresh_from_db()
+        return (
+            test_request.expected_results_count, test_request.entered_results_count,
+            test_request.completion_percentage, test_request.status,
+        )
+
+    def test_counters_follow_tests_and_results(self):
+        test_request = TestRequest.objects.create(patient=self.patient, created_by=self.user)
+        test_request.individual_tests.set(self.tests[:1])
+        test_request.test_groups.set([self.group])
+        self.assertEqual(self._counters(test_request), (3, 0, 0, 'pending'))
+
+        result = IndividualTestResult.objects.create(test_request=test_request, individual_test=self.tests[0], value='5')
+        self.assertEqual(self._counters(test_request), (3, 1, 33.3, 'in_progress'))
+
+        for test in self.tests[1:]:
+            IndividualTestResult.objects.create(test_request=test_request, individual_test=test, value='5')
+        self.assertEqual(self._counters(test_request), (3, 3, 100, 'completed'))
+
+        result.delete()
+        self.assertEqual(self._counters(test_request)[:2], (3, 2))
+
+        # تحليل جديد في المجموعة يُحتسب لكل الطلبات التي تحتويها
+        self.group.tests.add(IndividualTest.objects.create(name='Extra', unit='-', price=1000))
+        self.assertEqual(self._counters(test_request)[:2], (4, 2))
+
+    def test_rebuild_restores_counters(self):
+        test_request = TestRequest.objects.create(patient=self.patient, created_by=self.user)
+        test_request.individual_tests.set(self.tests)
+        IndividualTestResult.objects.create(test_request=test_request, individual_test=self.tests[0], value='5')
+        TestRequest.objects.filter(pk=test_request.pk).update(expected_results_count=0, entered_results_count=7)
+
+        with self.assertNumQueries(6):
+            self.assertEqual(completion.rebuild_completion_counters(), 1)
+        self.assertEqual(self._counters(test_request)[:3], (3, 1, 33.3))
+
+
+class DeferredCompletionTests(TestCase):
+    """الحفظ داخل deferred_completion يعيد حساب حالة كل طلب مرة واحدة بعد الـ commit"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='lab', password='lab')
+        cls.tests = [IndividualTest.objects.create(name=f'Test {i}', unit='-', price=1000) for i in range(3)]
+        cls.patient = Patient.objects.create(full_name='مريض تجريبي', gender='M', age=40)
+
+    def test_status_is_recomputed_once_after_commit(self):
+        test_requests = []
+        for _ in range(2):
+            test_request = TestRequest.objects.create(patient=self.patient, created_by=self.user)
+            test_request.individual_tests.set(self.tests)
+            test_requests.append(test_request)
+
+        check = mock.patch.object(TestRequest, 'check_completion_status', autospec=True,
+                                  side_effect=TestRequest.check_completion_status)
+        with check as checked, self.captureOnCommitCallbacks(execute=True):
+            with completion.deferred_completion():
+                for test_request in test_requests:
+                    for test in self.tests:
+                        IndividualTestResult.objects.create(test_request=test_request, individual_test=test, value='5')
+                # العدادات تُطبق عند نهاية وحدة العمل، والحالة بعد الـ commit
+                self.assertEqual(TestRequest.objects.filter(entered_results_count=0).count(), 2)
+                self.assertFalse(checked.called)
+            self.assertFalse(checked.called)
+
+        self.assertEqual(sorted(call.args[0].pk for call in checked.call_args_list), sorted(r.pk for r in test_requests))
+        self.assertEqual(
+            list(TestRequest.objects.filter(pk__in=[r.pk for r in test_requests]).values_list('entered_results_count', 'status')),
+            [(3, 'completed')] * 2,
+        )
+
+    def test_rollback_discards_counters_and_statuses(self):
+        test_request = TestRequest.objects.create(patient=self.patient, created_by=self.user)
+        test_request.individual_tests.set(self.tests)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks, self.assertRaises(ValueError):
+            with completion.deferred_completion():
+                IndividualTestResult.objects.create(test_request=test_request, individual_test=self.tests[0], value='5')
+                raise ValueError
+
+        self.assertEqual(callbacks, [])
+        self.assertIsNone(completion.current_unit_of_work())
+        test_request.refresh_from_db()
+        self.assertEqual((test_request.entered_results_count, test_request.status), (0, 'pending'))
+
+
+class ReferenceRangeTests(TestCase):
+    """تصنيف النتائج من القيم الطبيعية المحوّلة مرة واحدة لكل تحليل"""
+
+    def tearDown(self):
+        reference_ranges.invalidate()
+
+    def test_classify_numeric_and_text_ranges(self):
+        test = IndividualTest.objects.create(
+            name='WBC', unit='-', price=1000, normal_value_m='4-11', normal_value_f='< 5',
+        )
+        cases = [
+            ('M', '3.9', 'low'), ('M', '4', 'normal'), ('M', '11', 'normal'), ('M', '11.5', 'high'),
+            ('F', '4.9', 'normal'), ('F', '5.1', 'high'), ('M', 'hemolyzed', None),
+        ]
+        for gender, value, expected in cases:
+            with self.subTest(gender=gender, value=value):
+                self.assertEqual(reference_ranges.classify(test, gender, value), expected)
+
+        culture = IndividualTest.objects.create(name='Culture', unit='-', price=1000, normal_value_m='Negative')
+        self.assertEqual(reference_ranges.classify(culture, 'M', ' negative '), 'normal')
+        self.assertEqual(reference_ranges.classify(culture, 'M', 'Positive'), 'abnormal')
+        self.assertEqual(reference_ranges.format_range(test, 'M'), '4-11')
+
+    def test_compiled_ranges_are_reused_until_the_test_changes(self):
+        tests = [
+            IndividualTest.objects.create(name=f'Test {i}', unit='-', price=1000, normal_value_min_m=1, normal_value_max_m=5)
+            for i in range(3)
+        ]
+        tests = list(IndividualTest.objects.filter(pk__in=[test.pk for test in tests]))
+        with self.assertNumQueries(1):
+            reference_ranges.prime(tests)
+        with self.assertNumQueries(0):
+            reference_ranges.prime(tests)
+            self.assertEqual([reference_ranges.classify(test, 'M', '6') for test in tests], ['high'] * 3)
+
+        # تعديل التحليل في عملية أخرى: updated_at الجديد يعيد تحويل قيمه
+        IndividualTest.objects.filter(pk=tests[0].pk).update(normal_value_max_m=10, updated_at=timezone.now() + timedelta(seconds=1))
+        changed = IndividualTest.objects.get(pk=tests[0].pk)
+        self.assertEqual(reference_ranges.classify(changed, 'M', '6'), 'normal')
+
+
+class ReferenceIntervalTests(TestCase):
+    """اختيار فئة القيم الطبيعية حسب الجنس والعمر، والقيم الحرجة"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.test = IndividualTest.objects.create(
+            name='HB', unit='g/dL', price=1000,
+            normal_value_min_m=13, normal_value_max_m=17, normal_value_min_f=12, normal_value_max_f=15,
+        )
+        for sex, age_from, age_to, low, high in [
+            ('A', 0, 18, 11, 14),       # أطفال
+            ('M', 18, None, 14, 18),    # رجال بالغون
+            ('A', 65, None, 11, 16),    # كبار السن
+        ]:
+            ReferenceInterval.objects.create(
+                test=cls.test, sex=sex, age_from=age_from, age_to=age_to, low=low, high=high,
+                critical_low=7, critical_high=20,
+            )
+
+    def tearDown(self):
+        reference_ranges.invalidate()
+
+    def _range(self, gender, age):
+        reference = reference_ranges.get_reference_range(self.test, gender, age)
+        return reference.low, reference.high
+
+    def test_band_selection(self):
+        cases = [
+            ('M', 5, (11, 14)),     # فئة عامة للأطفال
+            ('M', 18, (14, 18)),    # age_to غير شامل
+            ('M', 70, (14, 18)),    # فئة الجنس قبل الفئة العامة
+            ('F', 70, (11, 16)),
+            ('F', 30, (12, 15)),    # بدون فئة مطابقة: قيم التحليل
+            ('M', None, (13, 17)),  # عمر غير معروف
+        ]
+        for gender, age, expected in cases:
+            with self.subTest(gender=gender, age=age):
+                self.assertEqual(self._range(gender, age), expected)
+        self.assertEqual(reference_ranges.format_range(self.test, 'M', 30), '14.00 - 18.00')
+
+    def test_critical_flags(self):
+        cases = [('6.9', 'critical_low'), ('7', 'low'), ('16', 'normal'), ('19', 'high'), ('20.1', 'critical_high')]
+        for value, expected in cases:
+            with self.subTest(value=value):
+                self.assertEqual(reference_ranges.classify(self.test, 'M', value, age=30), expected)
+        # خارج الفئات لا توجد قيم حرجة
+        self.assertEqual(reference_ranges.classify(self.test, 'F', '6', age=30), 'low')
+
+
+class ReportBuilderTests(TestCase):
+    """بيانات التقارير تُجمع بعدد ثابت من الاستعلامات مهما كان عدد المرضى"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='lab', password='lab')
+        cls.tests = [
+            IndividualTest.objects.create(name=name, unit='-', price=1000, subclass='CBC', display_order=order)
+            for name, order in [('WBC', 2), ('HB', 1)]
+        ]
+        cls.group = TestGroup.objects.create(name='Lipid', description='Chemistry', total_price=2000)
+        cls.patients = []
+        for i in range(3):
+            patient = Patient.objects.create(full_name=f'مريض {i}', gender='M', age=40)
+            test_request = TestRequest.objects.create(patient=patient, created_by=cls.user)
+            for test in cls.tests:
+                IndividualTestResult.objects.create(test_request=test_request, individual_test=test, value='5')
+            TestGroupResult.objects.create(test_request=test_request, test_group=cls.group)
+            cls.patients.append(patient)
+
+    def tearDown(self):
+        reference_ranges.invalidate()
+
+    def test_query_count_does_not_grow_with_patients(self):
+        for patients in (self.patients[:1], self.patients):
+            reference_ranges.invalidate()
+            with self.subTest(patients=len(patients)), self.assertNumQueries(4):
+                reports = ReportBuilder().build_many(patients)
+            self.assertEqual(len(reports), len(patients))
+
+    def test_results_are_grouped_and_ordered(self):
+        report = ReportBuilder().build(self.patients[0])
+        self.assertEqual((report['requests_count'], report['results_count']), (1, 2))
+        self.assertEqual([row['test_name'] for row in report['groups']['CBC']], ['HB', 'WBC'])
+        self.assertEqual([row['test_name'] for row in report['groups']['Chemistry']], ['Lipid'])
+
+        without_groups = ReportBuilder(include_group_results=False).build(self.patients[0])
+        self.assertEqual(list(without_groups['groups']), ['CBC'])
+
+
+class ReportPdfCacheTests(TestCase):
+    """ملف PDF يُولَّد مرة واحدة لكل محتوى، والمتصفح يحصل على 304 لنفس النسخة"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='lab', password='lab')
+        cls.test = IndividualTest.objects.create(name='CBC', unit='-', price=1000)
+        cls.patient = Patient.objects.create(full_name='مريض تجريبي', gender='M', age=40)
+        test_request = TestRequest.objects.create(patient=cls.patient, created_by=cls.user)
+        cls.result = IndividualTestResult.objects.create(test_request=test_request, individual_test=cls.test, value='5')
+
+    def setUp(self):
+        cache_dir = TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.cache_dir = Path(cache_dir.name)
+        override = self.settings(REPORT_PDF_CACHE_DIR=self.cache_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+        render = mock.patch.object(report_pdf, 'render_pdf', return_value=b'%PDF-1')
+        self.render = render.start()
+        self.addCleanup(render.stop)
+        self.client.force_login(self.user)
+        self.url = reverse('generate_report_pdf', args=[self.patient.pk])
+
+    def test_pdf_is_cached_by_content(self):
+        response = self.client.get(self.url)
+        self.assertEqual((response.status_code, response.content), (200, b'%PDF-1'))
+        etag = response['ETag']
+
+        self.assertEqual(self.client.get(self.url)['ETag'], etag)
+        self.assertEqual(self.render.call_count, 1)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response['ETag']), (304, etag))
+        self.assertEqual(self.render.call_count, 1)
+
+        # نتيجة معدلة: مفتاح جديد، وتُحذف النسخة القديمة للمريض
+        IndividualTestResult.objects.filter(pk=self.result.pk).update(value='6')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.render.call_count, 2)
+        self.assertEqual(len(list(self.cache_dir.glob(f'{self.patient.pk}-*.pdf'))), 1)
+
+    def test_template_version_setting_changes_digest(self):
+        report = ReportBuilder().build(self.patient)
+        self.addCleanup(report_pdf.template_version.cache_clear)
+        digest = report_pdf.report_digest(self.patient, report)
+        with self.settings(REPORT_TEMPLATE_VERSION='2'):
+            report_pdf.template_version.cache_clear()
+            self.assertNotEqual(report_pdf.report_digest(self.patient, report), digest)
+
+
+class ReportJobTests(TestCase):
+    """مهام توليد PDF في الخلفية: إعادة استخدام المهمة، انتهاء المهلة، وتعطل المجمع"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='lab', password='lab')
+        cls.patient = Patient.objects.create(full_name='مريض تجريبي', gender='M', age=40)
+        test_request = TestRequest.objects.create(patient=cls.patient, created_by=cls.user)
+        test = IndividualTest.objects.create(name='CBC', unit='-', price=1000)
+        IndividualTestResult.objects.create(test_request=test_request, individual_test=test, value='5')
+
+    def setUp(self):
+        cache.clear()
+        cache_dir = TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        override = self.settings(REPORT_PDF_CACHE_DIR=Path(cache_dir.name), REPORT_RENDER_TIMEOUT=300)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_pending_job_is_reused_then_finished(self):
+        future = Future()
+        with mock.patch.object(report_jobs, 'submit', return_value=future) as submit:
+            job = report_jobs.enqueue_report(self.patient)
+            self.assertEqual(report_jobs.enqueue_report(self.patient)['id'], job['id'])
+        self.assertEqual((job['status'], submit.call_count), ('pending', 1))
+
+        future.set_result(b'%PDF-1')
+        self.assertEqual(report_jobs.get_job(job['id'])['status'], 'done')
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('report_job_download', args=[job['id']]))
+        self.assertEqual((response.status_code, response.content), (200, b'%PDF-1'))
+
+    def test_stuck_job_expires_and_is_resubmitted(self):
+        with mock.patch.object(report_jobs, 'submit', side_effect=[Future(), Future()]) as submit:
+            job = report_jobs.enqueue_report(self.patient)
+            started_at = (timezone.now() - timedelta(seconds=301)).isoformat()
+            cache.set(report_jobs._job_key(job['id']), dict(job, started_at=started_at))
+
+            expired = report_jobs.get_job(job['id'])
+            self.assertEqual(expired['status'], 'failed')
+            self.assertTrue(expired['error'])
+            retried = report_jobs.enqueue_report(self.patient)
+        self.assertNotEqual(retried['id'], job['id'])
+        self.assertEqual((retried['status'], submit.call_count), ('pending', 2))
+
+    def test_broken_pool_fails_the_job(self):
+        with mock.patch.object(report_jobs, 'submit', side_effect=BrokenProcessPool()), self.assertLogs('lab.report_jobs'):
+            job = report_jobs.enqueue_report(self.patient)
+        self.assertEqual(job['status'], 'failed')
+        self.assertEqual(report_jobs.get_job(job['id'])['status'], 'failed')
+
+
+class BarcodeCacheTests(TestCase):
+    """صور الباركود تُولد مرة واحدة، وملفات الكاش على القرص محدودة العدد"""
+
+    def setUp(self):
+        cache_dir = TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.cache_dir = Path(cache_dir.name)
+        override = self.settings(BARCODE_CACHE_DIR=self.cache_dir, BARCODE_CACHE_MAX_FILES=3)
+        override.enable()
+        self.addCleanup(override.disable)
+        barcodes._memory.clear()
+        self.addCleanup(barcodes._memory.clear)
+        self.render = mock.Mock(side_effect=lambda payload, scale: f'{payload}:{scale}'.encode())
+
+    def _symbol(self, payload):
+        return barcodes.get_symbol(payload, 1, 'svg', 'code128', self.render)
+
+    def test_symbol_is_rendered_once(self):
+        self.assertEqual(self._symbol('A1'), b'A1:1')
+        self.assertEqual(self._symbol('A1'), b'A1:1')
+        barcodes._memory.clear()
+        self.assertEqual(self._symbol('A1'), b'A1:1')    # من القرص
+        self.assertEqual(self.render.call_count, 1)
+
+    def test_prune_removes_oldest_files(self):
+        for age, name in enumerate(['e', 'd', 'c', 'b', 'a']):
+            path = self.cache_dir / f'code128-{name}.svg'
+            path.write_bytes(b'x')
+            mtime = time.time() - age * 60
+            os.utime(path, (mtime, mtime))
+        (self.cache_dir / 'writing.tmp').write_bytes(b'x')
+
+        self.assertEqual(barcodes.prune_cache(), 2)
+        self.assertEqual(sorted(path.name for path in self.cache_dir.iterdir()), [
+            'code128-c.svg', 'code128-d.svg', 'code128-e.svg', 'writing.tmp',
+        ])
+        self.assertEqual(barcodes.prune_cache(), 0)
+
+    def test_new_symbols_trigger_pruning(self):
+        with mock.patch.object(barcodes, 'PRUNE_EVERY', 1):
+            for payload in ['A1', 'A2', 'A3', 'A4', 'A5']:
+                self._symbol(payload)
+        self.assertEqual(len(list(self.cache_dir.glob('code128-*'))), 3)
+
+    def test_code128_rejects_invalid_text(self):
+        for text in ['', 'ب123', 'A\x01', 'A' * (barcodes.CODE128_MAX_LENGTH + 1)]:
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                barcodes.code128_svg(text)
+        self.assertTrue(barcodes.is_code128_text('260101-0001'))
+
+
+class LabelSheetTests(TestCase):
+    """ورقة الملصقات: ملصق لكل أنبوب، وباركود واحد لكل مريض، وعدد ثابت من الاستعلامات"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='lab', password='lab')
+        cls.tests = [
+            IndividualTest.objects.create(name=name, unit='-', price=1000, app_name=app_name)
+            for name, app_name in [('WBC', 'CBC'), ('HB', 'CBC'), ('ALT', 'CHEM')]
+        ]
+        cls.group = TestGroup.objects.create(name='Liver', app_name='LFT', total_price=2000)
+        cls.patient = Patient.objects.create(full_name='مريض تجريبي', gender='M', age=40)
+
+    def _request(self, status='pending'):
+        test_request = TestRequest.objects.create(patient=self.patient, created_by=self.user, status=status)
+        test_request.individual_tests.set(self.tests)
+        test_request.test_groups.set([self.group])
+        return test_request
+
+    def _labels(self, **params):
+        with mock.patch.object(barcodes, 'generate_barcode_128', return_value='<svg/>') as generate:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('test_request_labels_print'), params)
+        self.assertEqual(response.status_code, 200)
+        labels = [(label['request_id'], label['app_name']) for label in response.context['labels']]
+        return labels, generate.call_count, len(queries)
+
+    def test_one_label_per_tube(self):
+        self.client.force_login(self.user)
+        first = self._request()
+        self._request(status='completed')
+        _, _, single_queries = self._labels()
+
+        second = self._request()
+        labels, generated, queries = self._labels()
+        self.assertEqual(labels, [(first.pk, 'CBC'), (first.pk, 'CHEM'), (first.pk, 'LFT'),
+                                  (second.pk, 'CBC'), (second.pk, 'CHEM'), (second.pk, 'LFT')])
+        self.assertEqual(generated, 1)
+        self.assertEqual(queries, single_queries)
+
+        labels, _, _ = self._labels(ids=str(second.pk))
+        self.assertEqual([request_id for request_id, _ in labels], [second.pk] * 3)
+        self.assertEqual(self.client.get(reverse('test_request_labels_print'), {'ids': 'x'}).status_code, 400)
+
+
+class PatientSearchTests(TestCase):
+    """بحث المرضى بالاسم الموحد والمقاطع الثلاثية والباركود والهاتف"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ahmad = Patient.objects.create(full_name='أَحمد علي', gender='M', age=40, phone_number='0770 123 4567')
+        cls.mohammad = Patient.objects.create(full_name='محمد أحمد', gender='M', age=30, phone_number='0780 765 4321')
+        cls.fatima = Patient.objects.create(full_name='فاطمة حسن', gender='F', age=25)
+
+    def _search(self, query):
+        return set(search.search_patients(query))
+
+    def test_normalize_text(self):
+        self.assertEqual(search.normalize_text('  أَحْمَد   إبراهيم '), 'احمد ابراهيم')
+        self.assertEqual(search.normalize_text('فاطمة مصطفى'), 'فاطمه مصطفي')
+        self.assertEqual(search.normalize_phone('٠٧٧٠-١٢٣'), '0770123')
+
+    def test_name_search(self):
+        self.assertEqual(self._search('احمد'), {self.ahmad, self.mohammad})    # بداية الاسم ووسطه، بدون همزة
+        self.assertEqual(self._search('حمد عل'), {self.ahmad})
+        self.assertEqual(self._search('فاطمه'), {self.fatima})
+        self.assertEqual(self._search('مد'), set())                          # أقصر من مقطع: بداية الاسم فقط
+        self.assertEqual(self._search('محمود'), set())
+
+        self.fatima.full_name = 'زينب حسن'
+        self.fatima.save()
+        self.assertEqual(self._search('فاطمه'), set())
+        self.assertEqual(self._search('زينب'), {self.fatima})
+
+    def test_number_search(self):
+        self.assertEqual(self._search(self.ahmad.barcode), {self.ahmad})
+        self.assertEqual(self._search('٠٧٧٠'), {self.ahmad})
+        self.assertEqual(self._search('07'), {self.ahmad, self.mohammad})
+
+    def test_typeahead_prefers_name_prefix(self):
+        self.assertEqual(search.typeahead('احمد'), [self.ahmad, self.mohammad])
+        self.assertEqual(search.typeahead('احمد', limit=1), [self.ahmad])
+
+
+class TypeaheadIndexTests(TestCase):
+    """فهرس الإكمال التلقائي في الذاكرة يعطي نفس نتائج البحث في قاعدة البيانات"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patients = [
+            Patient.objects.create(full_name=name, gender='M', age=30, phone_number=phone)
+            for name, phone in [
+                ('أحمد علي', '07701234567'), ('محمد أحمد', '07807654321'),
+                ('فاطمة حسن', ''), ('أحمد كريم', '07501112222'),
+            ]
+        ]
+
+    def setUp(self):
+        # الفهرس المشترك في العملية يبدأ فارغاً في كل اختبار
+        for name, value in [('_index', None), ('_last_reconcile', time.monotonic())]:
+            patcher = mock.patch.object(typeahead, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _ids(self, results):
+        return [result.id for result in results]
+
+    def test_index_matches_database_search(self):
+        index = typeahead.PatientIndex.build()
+        for query in ['احمد', 'حمد', 'فاطمه', 'كريم', '0770', '07', self.patients[2].barcode, 'زينب', '']:
+            with self.subTest(query=query):
+                self.assertEqual(
+                    sorted(self._ids(index.search(query))), sorted(self._ids(search.typeahead(query))),
+                )
+        self.assertEqual(index.search('احمد', limit=2)[0].full_name, 'أحمد علي')
+
+    def test_index_follows_saves_and_other_processes(self):
+        index = typeahead.PatientIndex.build()
+        typeahead._index = index
+        patient = self.patients[2]
+
+        patient.full_name = 'زينب حسن'
+        patient.save()    # signals في نفس العملية
+        self.assertEqual(self._ids(index.search('زينب')), [patient.pk])
+        self.assertEqual(index.search('فاطمه'), [])
+
+        # تعديل من عملية أخرى يظهر بعد reconcile
+        Patient.objects.filter(pk=patient.pk).update(
+            full_name='مريم حسن', search_name='مريم حسن', updated_at=timezone.now() + timedelta(seconds=1),
+        )
+        index = typeahead.reconcile()    # خانة محذوفة من أصل 4 تتجاوز MAX_DEAD_RATIO فيُعاد البناء
+        self.assertEqual((self._ids(index.search('مريم')), index.dead), ([patient.pk], 0))
+
+        patient.delete()
+        self.assertEqual((index.search('مريم'), index.dead), ([], 1))
+
+    def test_partial_index_falls_back_to_database(self):
+        index = typeahead.PatientIndex.build(max_patients=2)
+        self.assertFalse(index.complete)
+        self.assertEqual(len(index), 2)
+        typeahead._index = index
+        with self.settings(PATIENT_TYPEAHEAD_INDEX=True):
+            # أقدم المرضى خارج الفهرس لكن تظهر من قاعدة البيانات
+            self.assertEqual(sorted(self._ids(typeahead.suggest('علي'))), [self.patients[0].pk])
+            with self.assertNumQueries(0):
+                self.assertEqual(self._ids(typeahead.suggest('كريم', limit=1)), [self.patients[3].pk])
+
+
+class KeysetPaginationTests(TestCase):
+    """المرور على كل الصفحات بالمؤشر (للأمام وللخلف) بدون تكرار أو فقد صفوف عند تساوي أعمدة الترتيب"""
+
+    ordering = ('-created_at', '-id')
+
+    @classmethod
+    def setUpTestData(cls):
+        patients = [Patient.objects.create(full_name=f'مريض {i}', gender='M', age=30) for i in range(7)]
+        # خمسة مرضى بنفس created_at تماماً (أكثر من صفحة): الترتيب بينهم حسب id
+        same_time = timezone.now().replace(microsecond=123456)
+        Patient.objects.filter(pk__in=[patient.pk for patient in patients[1:6]]).update(created_at=same_time)
+        cls.expected = list(Patient.objects.order_by(*cls.ordering).values_list('id', flat=True))
+
+    def _page(self, query=''):
+        request = RequestFactory().get('/patients/', QueryDict(query))
+        page = pagination.keyset_paginate(request, Patient.objects.all(), self.ordering, 3, with_count=False)
+        return page, [patient.pk for patient in page]
+
+    def test_walk_forward_and_back(self):
+        page, ids = self._page()
+        self.assertFalse(page.has_previous)
+        pages = [ids]
+        while page.has_next:
+            page, ids = self._page(page.next_query)
+            pages.append(ids)
+        self.assertEqual([len(ids) for ids in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), self.expected)
+
+        back = [ids]
+        while page.has_previous:
+            page, ids = self._page(page.previous_query)
+            back.append(ids)
+        self.assertEqual(back, pages[::-1])
+
+    def test_cursor_round_trip_and_invalid_cursor(self):
+        moment = timezone.now().replace(microsecond=654321)
+        fields = [Patient._meta.get_field('created_at'), Patient._meta.get_field('id')]
+        self.assertEqual(pagination.decode_cursor(pagination.encode_cursor([moment, 5]), fields), [moment, 5])
+        for cursor in ['not-base64!', pagination.encode_cursor([1]), pagination.encode_cursor(['x', 'y'])]:
+            with self.subTest(cursor=cursor), self.assertRaises(pagination.InvalidCursor):
+                pagination.decode_cursor(cursor, fields)
+
+        page, ids = self._page('after=broken')
+        self.assertEqual((ids, page.has_previous), (self.expected[:3], False))
+
+    def test_page_size_bounds(self):
+        for value, expected in [('2', 5), ('500', 100), ('x', 20), ('30', 30)]:
+            with self.subTest(per_page=value):
+                request = RequestFactory().get('/', {'per_page': value})
+                self.assertEqual(pagination.page_size_from(request, 20), expected)
+
+
+class DashboardStatsTests(TestCase):
+    """إحصائيات الرئيسية من الكاش، تُعدل عند الإضافة والحذف وتُحذف عند تغيير الحالة"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='lab', password='lab')
+        self.patient = Patient.objects.create(full_name='مريض تجريبي', gender='M', age=40)
+
+    def _counts(self):
+        stats = dashboard.get_stats()
+        return stats['total_patients'], stats['total_requests'], stats['by_status']['pending'], stats['by_status']['completed']
+
+    def test_cached_stats_follow_changes(self):
+        with self.assertNumQueries(2):    # لا توجد طلبات بعد: عدد المرضى باستعلام ثانٍ
+            self.assertEqual(self._counts(), (1, 0, 0, 0))
+
+        test_request = TestRequest.objects.create(patient=self.patient, created_by=self.user)
+        Patient.objects.create(full_name='مريض آخر', gender='F', age=30)
+        with self.assertNumQueries(0):
+            self.assertEqual(self._counts(), (2, 1, 1, 0))
+
+        test_request.status = 'completed'
+        test_request.save()
+        self.assertIsNone(cache.get(dashboard.CACHE_KEY))
+        self.assertEqual(self._counts(), (2, 1, 0, 1))
+
+        test_request.delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(self._counts(), (2, 0, 0, 0))
+
+    def test_expired_stats_are_recomputed(self):
+        self._counts()
+        stats = cache.get(dashboard.CACHE_KEY)
+        cache.set(dashboard.CACHE_KEY, dict(stats, expires_at=timezone.now().timestamp() - 1))
+        Patient.objects.create(full_name='مريض آخر', gender='F', age=30)    # adjust بعد انتهاء المدة يحذف الكاش
+        self.assertIsNone(cache.get(dashboard.CACHE_KEY))
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('dashboard_stats'))
+        self.assertEqual(response.json()['total_patients'], 2)
+
+
+class DeviceIngestCommandTests(TestCase):
+    def test_failed_cycle_does_not_stop_worker(self):
+        metrics = {'queue_depth': 1, 'merged_count': 1, 'merge_latency_ms': 1.0}
+        cycles = mock.Mock(side_effect=[OperationalError('gone away'), metrics, KeyboardInterrupt])
+        with mock.patch('lab.management.commands.run_device_ingest.run_ingest_cycle', cycles), \
+                mock.patch('lab.management.commands.run_device_ingest.time.sleep') as sleep, \
+                self.assertLogs('lab.management.commands.run_device_ingest', 'ERROR'):
+            call_command('run_device_ingest', interval=2, stdout=StringIO())
+        self.assertEqual(cycles.call_count, 3)
+        # انتظار أطول بعد الخطأ، ثم الفترة العادية بعد نجاح الدورة التالية
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [4, 2])
+
+
+class BulkResultEntryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='lab', password='lab')
+        cls.other = User.objects.create_user(username='lab2', password='lab')
+        cls.tests = [IndividualTest.objects.create(name=f'Test {i}', unit='-', price=1000) for i in range(2)]
+        cls.patient = Patient.objects.create(full_name='مريض تجريبي', gender='M', age=40)
+
+    def test_stale_form_updates_result_entered_meanwhile(self):
+        test_request = TestRequest.objects.create(patient=self.patient, created_by=self.user)
+        test_request.individual_tests.set(self.tests)
+        data = {f'test_{test.id}_value': '7' for test in self.tests}
+        form = BulkIndividualTestResultForm(test_request, data)
+        self.assertTrue(form.is_valid())
+
+        # مستخدم آخر أدخل نتيجة التحليل الأول بعد فتح النموذج (existing_result=None في النموذج)
+        IndividualTestResult.objects.create(
+            test_request=test_request, individual_test=self.tests[0], value='5', entered_by=self.other,
+        )
+        form.save(self.user)
+
+        results = {result.individual_test_id: result for result in IndividualTestResult.objects.filter(test_request=test_request)}
+        self.assertEqual([results[test.id].value for test in self.tests], ['7', '7'])
+        self.assertEqual(results[self.tests[0].id].entered_by, self.other)
+        self.assertEqual(results[self.tests[0].id].last_modified_by, self.user)
+        test_request.refresh_from_db()
+        self.assertEqual(test_request.entered_results_count, 2)
+        self.assertEqual(sum(DailyTestStat.objects.values_list('results', flat=True)), 2)
+
+
+class DeviceMergeTests(TestCase):
+    """الدمج الجماعي يعطي نفس نتائج الحلقة القديمة (نتيجة لكل جهاز/مريض/تحليل)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='lab', password='lab')
+        cls.tests = [IndividualTest.objects.create(name=f'Test {i}', unit='-', price=1000) for i in range(3)]
+        cls.patient = Patient.objects.create(full_name='مريض تجريبي', gender='M', age=40)
+        cls.test_request = TestRequest.objects.create(patient=cls.patient, created_by=cls.user)
+        cls.test_request.individual_tests.set(cls.tests[:2])
+
+    def _device(self, test, value, minutes_ago, patient=None):
+        row = DeviceResult.objects.create(device_name='XN', barcode=patient or self.patient, test=test, result=value)
+        DeviceResult.objects.filter(pk=row.pk).update(insert_datetime=timezone.now() - timedelta(minutes=minutes_ago))
+        return row
+
+    def _values(self):
+        return dict(IndividualTestResult.objects.filter(test_request=self.test_request).values_list('individual_test_id', 'value'))
+
+    def test_latest_device_value_wins(self):
+        existing = IndividualTestResult.objects.create(test_request=self.test_request, individual_test=self.tests[0], value='1')
+        IndividualTestResult.objects.filter(pk=existing.pk).update(result_date=timezone.now() - timedelta(minutes=30))
+        self._device(self.tests[0], 2, minutes_ago=60)    # أقدم من النتيجة الحالية
+        self._device(self.tests[1], 3, minutes_ago=20)    # تكرار لنفس التحليل في نفس الدورة
+        self._device(self.tests[1], 4, minutes_ago=10)
+
+        self.assertEqual(merge_device_results(self.user), 1)  # الصف الأقدم لا يُحتسب
+        self.assertEqual(self._values(), {self.tests[0].pk: '1', self.tests[1].pk: '4.00'})
+        self.test_request.refresh_from_db()
+        self.assertEqual(self.test_request.entered_results_count, 2)
+        self.assertEqual(sum(DailyTestStat.objects.values_list('results', flat=True)), 2)
+        self.assertFalse(DeviceResult.objects.filter(is_active=True).exists())
+
+        self._device(self.tests[0], 5, minutes_ago=0)     # أحدث من النتيجة الحالية
+        merge_device_results(self.user)
+        self.assertEqual(self._values()[self.tests[0].pk], '5.00')
+
+    def test_rows_without_request_stay_active(self):
+        other = Patient.objects.create(full_name='مريض آخر', gender='F', age=30)
+        orphans = [self._device(self.tests[2], 1, minutes_ago=5), self._device(self.tests[0], 1, minutes_ago=5, patient=other)]
+        self.assertEqual(merge_device_results(self.user), 0)
+        self.assertEqual(set(DeviceResult.objects.filter(is_active=True).values_list('id', flat=True)), {row.pk for row in orphans})
+
+    def test_query_count_does_not_grow_with_rows(self):
+        def merged_queries(rows):
+            TestRequest.objects.filter(pk=self.test_request.pk).update(status='pending')
+            IndividualTestResult.objects.all().delete()
+            for minutes, test in enumerate(self.tests[:2] * rows):
+                self._device(test, minutes, minutes_ago=100 - minutes)
+            with CaptureQueriesContext(connection) as queries:
+                merge_device_results(self.user)
+            return len(queries)
+
+        merged_queries(1)  # تسخين ذاكرة الأنواع ونطاقات المرجع
+        self.assertEqual(merged_queries(1), merged_queries(5))
+
+    def test_result_entered_during_merge_is_updated(self):
+        self._device(self.tests[0], 7, minutes_ago=1)
+        self._device(self.tests[1], 8, minutes_ago=1)
+        evaluate_status = IndividualTestResult.evaluate_status
+
+        def enter_manually_once(result, *args):
+            # نتيجة يدوية لنفس (الطلب، التحليل) بين قراءة النتائج الموجودة والإدخال
+            if not IndividualTestResult.objects.exists():
+                IndividualTestResult.objects.bulk_create([IndividualTestResult(
+                    test_request=self.test_request, individual_test=self.tests[0], value='1', price=1000,
+                )])
+            return evaluate_status(result, *args)
+
+        with mock.patch.object(IndividualTestResult, 'evaluate_status', autospec=True, side_effect=enter_manually_once):
+            self.assertEqual(merge_device_results(self.user), 2)
+        self.assertEqual(self._values(), {self.tests[0].pk: '7.00', self.tests[1].pk: '8.00'})
+        self.assertFalse(DeviceResult.objects.filter(is_active=True).exists())
+        self.test_request.refresh_from_db()
+        self.assertEqual(self.test_request.entered_results_count, 1)
+        self.assertEqual(sum(DailyTestStat.objects.values_list('results', flat=True)), 1)
+
+
+class DataExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='lab', password='lab')
+        patient = Patient.objects.create(full_name='مريض تجريبي', gender='M', age=40)
+        test_request = TestRequest.objects.create(patient=patient, created_by=cls.user)
+        for department in ['hematology', 'chemistry', 'chemistry']:
+            test = IndividualTest.objects.create(name=department, unit='mg/dL', price=1000, description=department)
+            IndividualTestResult.objects.create(test_request=test_request, individual_test=test, value='5')
+
+    def test_results_csv_is_streamed_and_filtered(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('data_export'), {'kind': 'results', 'department': 'chemistry'})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(len(lines), 3)   # العناوين + نتيجتان
+        self.assertTrue(all('chemistry' in line for line in lines[1:]))
+
+
+class ReportExportTests(TestCase):
+    def test_reports_are_limited_to_selected_requests(self):
+        user = User.objects.create_user(username='lab', password='lab')
+        patient = Patient.objects.create(full_name='مريض تجريبي', gender='M', age=40)
+        requests = []
+        for name in ['CBC', 'ALT']:
+            test = IndividualTest.objects.create(name=name, unit='-', price=1000)
+            test_request = TestRequest.objects.create(patient=patient, created_by=user)
+            IndividualTestResult.objects.create(test_request=test_request, individual_test=test, value='5')
+            requests.append(test_request)
+
+        selected = report_export.select_requests(request_ids=[requests[1].pk])
+        self.assertEqual(list(report_export.select_patients(selected)), [patient])
+        report = ReportBuilder().build_many([patient], selected)[patient.pk]
+        self.assertEqual((report['requests_count'], report['results_count']), (1, 1))
+        self.assertEqual([row['test_name'] for rows in report['groups'].values() for row in rows], ['ALT'])
+
+    def test_failed_reports_do_not_truncate_zip(self):
+        user = User.objects.create_user(username='lab', password='lab')
+        test = IndividualTest.objects.create(name='CBC', unit='-', price=1000)
+        patients = []
+        for name in ['أحمد', 'باسم', 'جمال']:
+            patient = Patient.objects.create(full_name=name, gender='M', age=40)
+            test_request = TestRequest.objects.create(patient=patient, created_by=user)
+            IndividualTestResult.objects.create(test_request=test_request, individual_test=test, value='5')
+            patients.append(patient)
+
+        def finished(result=None, error=None):
+            future = Future()
+            if error:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+            return future
+
+        futures = [
+            finished(b'%PDF-1'),
+            finished(error=ValueError('bad template')),
+            finished(error=BrokenProcessPool()),    # يُعاد إرساله مرة واحدة
+            finished(b'%PDF-3'),
+        ]
+        with mock.patch.object(report_export, 'submit', side_effect=futures), self.assertLogs('lab.report_export') as logs:
+            chunks = report_export.stream_zip(patients, requests=TestRequest.objects.all())
+            archive = zipfile.ZipFile(BytesIO(b''.join(chunks)))
+
+        self.assertEqual(sorted(archive.namelist()), sorted([
+            report_export.report_filename(patients[0]),
+            f'report_{patients[1].pk}_error.txt',
+            report_export.report_filename(patients[2]),
+        ]))
+        self.assertEqual(archive.read(report_export.report_filename(patients[2])), b'%PDF-3')
+        self.assertTrue(any('could not be rendered' in line for line in logs.output))
+
+        # تعطل المجمع عند الإرسال يظهر قبل بدء الاستجابة
+        with mock.patch.object(report_export, 'submit', side_effect=BrokenProcessPool()), self.assertLogs('lab.report_export'):
+            with self.assertRaises(report_export.ReportRenderError):
+                report_export.stream_zip(patients, requests=TestRequest.objects.all())
+
+
+class TurnaroundTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='lab', password='lab')
+        cls.test = IndividualTest.objects.create(name='CBC', unit='-', price=1000, description='hematology')
+        cls.patient = Patient.objects.create(full_name='مريض تجريبي', gender='M', age=40)
+
+    def test_pipeline_measures_latencies_and_flags_breaches(self):
+        now = timezone.now()
+        test_request = TestRequest.objects.create(patient=self.patient, created_by=self.user)
+        test_request.individual_tests.set([self.test])
+        TestRequest.objects.filter(pk=test_request.pk).update(request_date=now - timedelta(hours=5))
+        device_result = DeviceResult.objects.create(device_name='XN', barcode=self.patient, test=self.test, result=5)
+        DeviceResult.objects.filter(pk=device_result.pk).update(insert_datetime=now - timedelta(hours=3))
+        IndividualTestResult.objects.create(test_request=test_request, individual_test=self.test, value='5')
+        PrintedReport.objects.create(patient=self.patient, printed_by=self.user)
+
+        open_request = TestRequest.objects.create(patient=self.patient, created_by=self.user)
+        TestRequest.objects.filter(pk=open_request.pk).update(request_date=now - timedelta(hours=6))
+
+        turnaround.process()
+        sample = TurnaroundSample.objects.get()
+        self.assertAlmostEqual(sample.order_to_analyzer, 2 * 3600, delta=60)
+        self.assertAlmostEqual(sample.analyzer_to_verified, 3 * 3600, delta=60)
+        self.assertAlmostEqual(sample.order_to_report, 5 * 3600, delta=60)
+        daily = DailyTurnaround.objects.get(metric='order_to_verified', department='', test__isnull=True)
+        self.assertEqual((daily.samples, daily.p50), (1, sample.order_to_verified))
+
+        self.client.force_login(self.user)
+        with self.settings(TAT_TARGET_MINUTES=240):
+            response = self.client.get(reverse('turnaround'))
+        self.assertEqual([row['request'].pk for row in response.context['breached']], [test_request.pk])
+        self.assertEqual([row['request'].pk for row in response.context['overdue']], [open_request.pk])
+
+
+class BarcodeSequenceTests(TransactionTestCase):
+    """الأرقام الموزعة بعد تراجع معاملة المستدعي لا تتكرر بين العمليات"""
+
+    def tearDown(self):
+        sequences._blocks.clear()
+
+    def test_outer_rollback_does_not_reissue_numbers(self):
+        day = timezone.localdate()
+        sequences._blocks.clear()
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                sequences.allocate_barcode(day)
+                raise RuntimeError
+        kept = {key: list(block) for key, block in sequences._blocks.items()}
+
+        # عملية أخرى بدون block في الذاكرة
+        sequences._blocks.clear()
+        other = [sequences.allocate_barcode(day) for _ in range(sequences._block_size())]
+
+        # العملية الأولى تكمل من الـ block الذي بقي في ذاكرتها
+        sequences._blocks.clear()
+        sequences._blocks.update(kept)
+        mine = [sequences.allocate_barcode(day) for _ in range(3)]
+        self.assertFalse(set(other) & set(mine))
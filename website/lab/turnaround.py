@@ -0,0 +1,230 @@
+"""أزمنة الإنجاز (TAT) لكل نتيجة ونسبها المئوية اليومية (p50/p90/p99)
+
+الأوقات المستخدمة لكل نتيجة فردية:
+- الطلب: TestRequest.request_date
+- الجهاز: أول DeviceResult.insert_datetime للمريض والتحليل بين وقت الطلب ووقت
+  النتيجة (النتائج اليدوية بدون وقت جهاز). لا نستخدم result_date لأن
+  auto_now_add يستبدله بوقت الحفظ.
+- الاعتماد: IndividualTestResult.created_at، أي دخول النتيجة للطلب يدوياً أو من
+  دمج الأجهزة (لا توجد خطوة اعتماد منفصلة في النظام).
+- التقرير: أول PrintedReport للمريض بعد وقت الاعتماد.
+
+process() يعمل دورياً من أمر run_tat_pipeline: يقرأ النتائج الجديدة فقط (رقم
+أكبر من آخر عينة)، ويكمل وقت التقرير للعينات المنتظرة، ثم يعيد حساب النسب
+المئوية للأيام المتأثرة فقط. نتيجة حُفظت في معاملة طويلة برقم أصغر من آخر
+عينة لا تُقرأ، ويصححها run_tat_pipeline --rebuild --days N (مثلاً كل ليلة).
+"""
+import math
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .models import DailyTurnaround, DeviceResult, IndividualTestResult, PrintedReport, TestRequest, TurnaroundSample
+from .rollups import day_bounds, day_of
+
+METRICS = [metric for metric, _ in DailyTurnaround.METRIC_CHOICES]
+PERCENTILES = (50, 90, 99)
+
+_RESULT_FIELDS = (
+    'id', 'test_request_id', 'individual_test_id', 'individual_test__description', 'created_at',
+    'test_request__request_date', 'test_request__patient_id', 'test_request__patient__id',
+)
+
+
+def target_minutes(department=None):
+    """هدف زمن الإنجاز (الطلب ← الاعتماد) بالدقائق، مع هدف خاص لبعض الأقسام"""
+    targets = getattr(settings, 'TAT_DEPARTMENT_TARGET_MINUTES', {})
+    return targets.get(department, getattr(settings, 'TAT_TARGET_MINUTES', 240))
+
+
+def _seconds(start, end):
+    if start is None or end is None:
+        return None
+    return max(int((end - start).total_seconds()), 0)
+
+
+def percentile(values, p):
+    """nearest-rank على قائمة مرتبة"""
+    return values[max(math.ceil(p / 100 * len(values)) - 1, 0)]
+
+
+# ------------------------------------------------------------------ العينات
+
+def _first_at_or_after(times, moment):
+    position = bisect_left(times, moment)
+    return times[position] if position < len(times) else None
+
+
+def build_samples(rows):
+    """عينات TurnaroundSample (غير محفوظة) لصفوف النتائج (_RESULT_FIELDS)
+
+    أوقات الأجهزة والطباعة تُقرأ باستعلام واحد لكل منهما للدفعة كاملة.
+    """
+    if not rows:
+        return []
+    earliest = min(row[5] for row in rows)
+
+    analyzer = defaultdict(list)
+    for barcode, test_id, inserted in (
+        DeviceResult.objects.filter(
+            barcode_id__in={row[6] for row in rows}, test_id__in={row[2] for row in rows},
+            insert_datetime__gte=earliest,
+        ).order_by('insert_datetime').values_list('barcode_id', 'test_id', 'insert_datetime')
+    ):
+        analyzer[barcode, test_id].append(inserted)
+
+    printed = defaultdict(list)
+    for patient_id, printed_at in (
+        PrintedReport.objects.filter(patient_id__in={row[7] for row in rows}, printed_at__gte=earliest)
+        .order_by('printed_at').values_list('patient_id', 'printed_at')
+    ):
+        printed[patient_id].append(printed_at)
+
+    samples = []
+    for result_id, request_id, test_id, department, verified_at, ordered_at, barcode, patient_id in rows:
+        analyzed_at = _first_at_or_after(analyzer.get((barcode, test_id), []), ordered_at)
+        if analyzed_at is not None and analyzed_at > verified_at:
+            analyzed_at = None
+        reported_at = _first_at_or_after(printed.get(patient_id, []), verified_at)
+        samples.append(TurnaroundSample(
+            result_id=result_id, test_request_id=request_id, patient_id=patient_id, test_id=test_id,
+            department=department, day=day_of(ordered_at),
+            ordered_at=ordered_at, analyzed_at=analyzed_at, verified_at=verified_at, reported_at=reported_at,
+            order_to_analyzer=_seconds(ordered_at, analyzed_at),
+            analyzer_to_verified=_seconds(analyzed_at, verified_at),
+            order_to_verified=_seconds(ordered_at, verified_at),
+            order_to_report=_seconds(ordered_at, reported_at),
+        ))
+    return samples
+
+
+def collect_new_results(batch_size=2000):
+    """عينات للنتائج التي أُدخلت بعد آخر عينة، وإرجاع الأيام المتأثرة"""
+    last_id = TurnaroundSample.objects.aggregate(last=Max('result'))['last'] or 0
+    days = set()
+    while True:
+        rows = list(
+            IndividualTestResult.objects.filter(id__gt=last_id).order_by('id').values_list(*_RESULT_FIELDS)[:batch_size]
+        )
+        if not rows:
+            return days
+        samples = build_samples(rows)
+        TurnaroundSample.objects.bulk_create(samples, ignore_conflicts=True)
+        days.update(sample.day for sample in samples)
+        last_id = rows[-1][0]
+
+
+def collect_reports(lookback_days=None):
+    """وقت التقرير للعينات المنتظرة خلال آخر lookback_days يوم"""
+    if lookback_days is None:
+        lookback_days = getattr(settings, 'TAT_REPORT_LOOKBACK_DAYS', 7)
+    waiting = list(
+        TurnaroundSample.objects.filter(
+            reported_at__isnull=True, verified_at__gte=timezone.now() - timedelta(days=lookback_days),
+        ).only('result', 'patient', 'day', 'ordered_at', 'verified_at')
+    )
+    if not waiting:
+        return set()
+
+    printed = defaultdict(list)
+    for patient_id, printed_at in (
+        PrintedReport.objects.filter(
+            patient_id__in={sample.patient_id for sample in waiting},
+            printed_at__gte=min(sample.verified_at for sample in waiting),
+        ).order_by('printed_at').values_list('patient_id', 'printed_at')
+    ):
+        printed[patient_id].append(printed_at)
+
+    reported = []
+    for sample in waiting:
+        sample.reported_at = _first_at_or_after(printed.get(sample.patient_id, []), sample.verified_at)
+        if sample.reported_at is not None:
+            sample.order_to_report = _seconds(sample.ordered_at, sample.reported_at)
+            reported.append(sample)
+    TurnaroundSample.objects.bulk_update(reported, ['reported_at', 'order_to_report'], batch_size=1000)
+    return {sample.day for sample in reported}
+
+
+# ------------------------------------------------------------------ النسب المئوية
+
+def refresh_days(days):
+    """إعادة حساب p50/p90/p99 للأيام: للكل، ولكل قسم، ولكل تحليل"""
+    for day in sorted(days):
+        groups = defaultdict(list)
+        for test_id, department, *values in (
+            TurnaroundSample.objects.filter(day=day).values_list('test_id', 'department', *METRICS)
+        ):
+            for metric, value in zip(METRICS, values):
+                if value is None:
+                    continue
+                groups[metric, '', None].append(value)
+                groups[metric, department, None].append(value)
+                groups[metric, department, test_id].append(value)
+
+        rows = []
+        for (metric, department, test_id), values in groups.items():
+            values.sort()
+            p50, p90, p99 = (percentile(values, p) for p in PERCENTILES)
+            rows.append(DailyTurnaround(
+                day=day, metric=metric, department=department, test_id=test_id,
+                samples=len(values), p50=p50, p90=p90, p99=p99,
+            ))
+        with transaction.atomic():
+            DailyTurnaround.objects.filter(day=day).delete()
+            DailyTurnaround.objects.bulk_create(rows)
+
+
+def process(batch_size=2000):
+    """دورة واحدة: عينات النتائج الجديدة، أوقات التقارير، ثم النسب للأيام المتأثرة"""
+    new_days = collect_new_results(batch_size)
+    report_days = collect_reports()
+    refresh_days(new_days | report_days)
+    return {'days': len(new_days | report_days), 'new_days': sorted(new_days), 'report_days': sorted(report_days)}
+
+
+def rebuild(start, end, batch_size=2000):
+    """إعادة بناء العينات والنسب لطلبات الأيام من start إلى end"""
+    requested = Q(test_request__request_date__gte=day_bounds(start)[0], test_request__request_date__lt=day_bounds(end)[1])
+    TurnaroundSample.objects.filter(day__gte=start, day__lte=end).delete()
+    last_id = 0
+    while True:
+        rows = list(
+            IndividualTestResult.objects.filter(requested, id__gt=last_id).order_by('id')
+            .values_list(*_RESULT_FIELDS)[:batch_size]
+        )
+        if not rows:
+            break
+        TurnaroundSample.objects.bulk_create(build_samples(rows), ignore_conflicts=True)
+        last_id = rows[-1][0]
+
+    days = set()
+    day = start
+    while day <= end:
+        days.add(day)
+        day += timedelta(days=1)
+    refresh_days(days)
+    return len(days)
+
+
+# ------------------------------------------------------------------ تجاوز الهدف
+
+def breached_samples(start, end):
+    """نتائج تجاوز زمن (الطلب ← الاعتماد) فيها هدف قسمها"""
+    overrides = getattr(settings, 'TAT_DEPARTMENT_TARGET_MINUTES', {})
+    condition = Q(order_to_verified__gt=target_minutes() * 60) & ~Q(department__in=list(overrides))
+    for department, minutes in overrides.items():
+        condition |= Q(department=department, order_to_verified__gt=minutes * 60)
+    return TurnaroundSample.objects.filter(condition, day__gte=start, day__lte=end)
+
+
+def overdue_requests(start, end):
+    """طلبات مفتوحة (انتظار / قيد التنفيذ) أقدم من الهدف العام"""
+    deadline = min(timezone.now() - timedelta(minutes=target_minutes()), day_bounds(end)[1])
+    return TestRequest.objects.filter(
+        status__in=('pending', 'in_progress'), request_date__gte=day_bounds(start)[0], request_date__lt=deadline,
+    )
@@ -0,0 +1,295 @@
+"""فهرس بحث المرضى داخل الذاكرة للإكمال التلقائي (اختياري: PATIENT_TYPEAHEAD_INDEX)
+
+الفهرس لا يحفظ كائنات Patient، بل مصفوفات متوازية حسب رقم الخانة (slot):
+رقم المريض في array، والاسم والباركود كنصوص، وقوائم مرتبة للبحث بالبداية
+(الاسم الموحد، والباركود والهاتف) مع bisect، وقاموس المقاطع الثلاثية
+(نصوص interned) إلى array من أرقام الخانات.
+
+- يُبنى في thread عند أول طلب إكمال تلقائي في كل عملية، وحتى انتهائه
+  يجيب lab/search.py من قاعدة البيانات.
+- يتحدث مباشرة من signals (post_save / post_delete) في نفس العملية، وكل
+  PATIENT_TYPEAHEAD_RECONCILE_SECONDS يقرأ المرضى المعدلين من عمليات أخرى
+  (updated_at) ويعيد البناء إذا اختلف العدد (حذف) أو كثرت الخانات المحذوفة.
+- يحتوي أحدث PATIENT_TYPEAHEAD_MAX_PATIENTS مريض فقط؛ إذا كان الجدول أكبر
+  ولم تكفِ نتائج الفهرس، يكمل البحث من قاعدة البيانات.
+"""
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connections
+
+from . import search
+from .models import Patient
+
+Suggestion = namedtuple('Suggestion', 'id full_name barcode')
+
+# نسبة الخانات المحذوفة التي تستدعي إعادة البناء
+MAX_DEAD_RATIO = 0.2
+
+_FIELDS = ('id', 'full_name', 'barcode', 'phone_number', 'search_name', 'updated_at')
+
+
+def enabled():
+    return getattr(settings, 'PATIENT_TYPEAHEAD_INDEX', False)
+
+
+def _max_patients():
+    return getattr(settings, 'PATIENT_TYPEAHEAD_MAX_PATIENTS', 200000)
+
+
+def _reconcile_seconds():
+    return getattr(settings, 'PATIENT_TYPEAHEAD_RECONCILE_SECONDS', 60)
+
+
+class PatientIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.complete = True   # False إذا لم يتسع الفهرس لكل المرضى
+        self.synced_at = None  # أكبر updated_at تمت قراءته
+        self.min_id = 0        # أصغر رقم مريض في الفهرس (لمقارنة العدد مع الجدول)
+        self._ids = array('q')
+        self._names = []
+        self._barcodes = []
+        self._search = []
+        self._phones = []
+        self._slot_of = {}
+        self._dead = 0
+        # قوائم مرتبة للبحث بالبداية: المفاتيح + الخانات بنفس الترتيب
+        self._name_keys, self._name_slots = [], array('l')
+        self._code_keys, self._code_slots = [], array('l')
+        self._grams = {}
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    @property
+    def dead(self):
+        return self._dead
+
+    # -------------------------------------------------------------- البناء
+
+    @classmethod
+    def build(cls, max_patients=None):
+        """بناء الفهرس لأحدث max_patients مريض (ترتيب المفاتيح مرة واحدة في النهاية)"""
+        max_patients = max_patients or _max_patients()
+        index = cls()
+        rows = Patient.objects.order_by('-id').values_list(*_FIELDS)[:max_patients + 1]
+        names, codes = [], []
+        for patient_id, full_name, barcode, phone, search_name, updated_at in rows.iterator(chunk_size=5000):
+            if len(index._ids) == max_patients:
+                index.complete = False
+                break
+            slot = index._append(patient_id, full_name, barcode, phone, search_name)
+            names.append((index._search[slot], slot))
+            codes.extend((code, slot) for code in index._codes(slot))
+            index.min_id = patient_id
+            if index.synced_at is None or updated_at > index.synced_at:
+                index.synced_at = updated_at
+        if index.complete:
+            index.min_id = 0
+
+        names.sort()
+        codes.sort()
+        index._name_keys = [key for key, _ in names]
+        index._name_slots = array('l', (slot for _, slot in names))
+        index._code_keys = [key for key, _ in codes]
+        index._code_slots = array('l', (slot for _, slot in codes))
+        return index
+
+    def _append(self, patient_id, full_name, barcode, phone, search_name):
+        slot = len(self._ids)
+        self._ids.append(patient_id)
+        self._names.append(full_name)
+        self._barcodes.append(sys.intern(barcode) if barcode else None)
+        self._search.append(search_name)
+        self._phones.append(search.normalize_phone(phone) or None)
+        self._slot_of[patient_id] = slot
+        for gram in search.trigrams(search_name):
+            self._grams.setdefault(sys.intern(gram), array('l')).append(slot)
+        return slot
+
+    def _codes(self, slot):
+        """مفاتيح البحث بالأرقام للخانة: الباركود والهاتف"""
+        return {self._barcodes[slot], self._phones[slot]} - {None}
+
+    # -------------------------------------------------------------- التحديث
+
+    @staticmethod
+    def _remove_key(keys, slots, key, slot):
+        position = bisect_left(keys, key)
+        while position < len(keys) and keys[position] == key:
+            if slots[position] == slot:
+                del keys[position]
+                del slots[position]
+                return
+            position += 1
+
+    @staticmethod
+    def _insert_key(keys, slots, key, slot):
+        position = bisect_left(keys, key)
+        keys.insert(position, key)
+        slots.insert(position, slot)
+
+    def remove(self, patient_id):
+        with self.lock:
+            self._remove(patient_id)
+
+    def _remove(self, patient_id):
+        slot = self._slot_of.pop(patient_id, None)
+        if slot is None:
+            return
+        self._remove_key(self._name_keys, self._name_slots, self._search[slot], slot)
+        for code in self._codes(slot):
+            self._remove_key(self._code_keys, self._code_slots, code, slot)
+        # المقاطع تبقى في قوائمها وتُتجاهل لأن الاسم الموحد للخانة أصبح فارغاً
+        self._ids[slot] = 0
+        self._names[slot] = self._barcodes[slot] = self._phones[slot] = None
+        self._search[slot] = ''
+        self._dead += 1
+
+    def upsert(self, patient_id, full_name, barcode, phone, search_name, updated_at=None):
+        with self.lock:
+            slot = self._slot_of.get(patient_id)
+            if slot is None and patient_id < self.min_id:
+                return  # مريض قديم خارج حدود الفهرس
+            unchanged = slot is not None and (
+                self._names[slot], self._barcodes[slot], self._phones[slot], self._search[slot]
+            ) == (full_name, barcode or None, search.normalize_phone(phone) or None, search_name)
+            if not unchanged:
+                self._remove(patient_id)
+                slot = self._append(patient_id, full_name, barcode, phone, search_name)
+                self._insert_key(self._name_keys, self._name_slots, search_name, slot)
+                for code in self._codes(slot):
+                    self._insert_key(self._code_keys, self._code_slots, code, slot)
+            if updated_at is not None and (self.synced_at is None or updated_at > self.synced_at):
+                self.synced_at = updated_at
+
+    # -------------------------------------------------------------- البحث
+
+    def _suggestion(self, slot):
+        return Suggestion(self._ids[slot], self._names[slot], self._barcodes[slot])
+
+    def _prefix(self, keys, slots, prefix, found, limit):
+        position = bisect_left(keys, prefix)
+        while position < len(keys) and len(found) < limit and keys[position].startswith(prefix):
+            found.setdefault(slots[position])
+            position += 1
+
+    def search(self, query, limit=10):
+        """نفس منطق search.typeahead: أرقام → باركود/هاتف، نص → بداية الاسم ثم المقاطع"""
+        query = (query or '').strip()
+        found = {}
+        with self.lock:
+            if search.is_number(query):
+                digits = search.normalize_phone(query)
+                if digits:
+                    self._prefix(self._code_keys, self._code_slots, digits, found, limit)
+            elif query:
+                normalized = search.normalize_text(query)
+                self._prefix(self._name_keys, self._name_slots, normalized, found, limit)
+                grams = search.trigrams(normalized)
+                if len(found) < limit and grams:
+                    postings = [self._grams.get(gram, ()) for gram in grams]
+                    # ⚡️ أقصر قائمة مقاطع فقط، والتأكيد بالبحث داخل الاسم الموحد
+                    for slot in min(postings, key=len):
+                        if normalized in self._search[slot]:
+                            found.setdefault(slot)
+                            if len(found) >= limit:
+                                break
+            return [self._suggestion(slot) for slot in found]
+
+
+# ------------------------------------------------------------------ نسخة العملية
+
+_index = None
+_state_lock = threading.Lock()
+_worker = None
+_last_reconcile = 0.0
+
+
+def _run_in_background(target):
+    global _worker
+    with _state_lock:
+        if _worker is not None and _worker.is_alive():
+            return
+        _worker = threading.Thread(target=target, name='patient-typeahead-index', daemon=True)
+        _worker.start()
+
+
+def _build():
+    global _index, _last_reconcile
+    try:
+        _index = PatientIndex.build()
+        _last_reconcile = time.monotonic()
+    finally:
+        connections.close_all()
+
+
+def reconcile():
+    """قراءة تعديلات العمليات الأخرى، وإعادة البناء عند الحذف أو كثرة الخانات المحذوفة"""
+    global _index
+    index = _index
+    if index is None:
+        return None
+
+    changed = Patient.objects.values_list(*_FIELDS)
+    if index.synced_at is not None:
+        changed = changed.filter(updated_at__gte=index.synced_at)
+    for patient_id, full_name, barcode, phone, search_name, updated_at in changed.iterator(chunk_size=2000):
+        index.upsert(patient_id, full_name, barcode, phone, search_name, updated_at)
+
+    # كل المرضى من min_id فما فوق يجب أن يكونوا في الفهرس، والفرق يعني حذفاً من عملية أخرى
+    deleted = Patient.objects.filter(id__gte=index.min_id).count() != len(index)
+    too_big = len(index) > _max_patients() * 1.1
+    if deleted or too_big or index.dead > len(index) * MAX_DEAD_RATIO:
+        _index = index = PatientIndex.build()
+    return index
+
+
+def _reconcile():
+    global _last_reconcile
+    try:
+        reconcile()
+        _last_reconcile = time.monotonic()
+    finally:
+        connections.close_all()
+
+
+def get_index():
+    """فهرس العملية الحالية أو None (غير مفعّل أو لم يكتمل بناؤه بعد)"""
+    if not enabled():
+        return None
+    if _index is None:
+        _run_in_background(_build)
+        return None
+    if time.monotonic() - _last_reconcile > _reconcile_seconds():
+        _run_in_background(_reconcile)
+    return _index
+
+
+def patient_saved(patient):
+    if _index is not None:
+        _index.upsert(
+            patient.id, patient.full_name, patient.barcode, patient.phone_number,
+            patient.search_name, patient.updated_at,
+        )
+
+
+def patient_deleted(patient_id):
+    if _index is not None:
+        _index.remove(patient_id)
+
+
+def suggest(query, limit=10):
+    """نتائج الإكمال التلقائي من الفهرس إذا كان جاهزاً، وإلا من قاعدة البيانات"""
+    index = get_index()
+    if index is not None:
+        results = index.search(query, limit)
+        if index.complete or len(results) >= limit:
+            return results
+    return search.typeahead(query, limit)
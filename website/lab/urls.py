@@ -36,6 +36,9 @@ urlpatterns = [
     
     # التقارير
     path("reports/", views.reports, name="reports"),
+    path("reports/export/", views.data_export, name="data_export"),
+    path("reports/analytics/", views.analytics_dashboard, name="analytics"),
+    path("reports/turnaround/", views.turnaround_dashboard, name="turnaround"),
     path("patients/<patient_id>/report/", views.patient_report, name="patient_report"),
     path("patients/<patient_id>/report/print/", views.patient_report_print, name="patient_report_print"),
     
@@ -44,6 +47,9 @@ urlpatterns = [
     path("patients/<patient_id>/barcode-label/print/", views.patient_barcode_label_print, name="patient_barcode_label_print"),
     path("requests/<request_id>/barcode-label/", views.test_request_barcode_label, name="test_request_barcode_label"),
     path("requests/<request_id>/barcode-label/print/", views.test_request_barcode_label_print, name="test_request_barcode_label_print"),
+    path("requests/labels/print/", views.test_request_labels_print, name="test_request_labels_print"),
+    path("barcodes/patients/<int:patient_id>/qr.png", views.patient_qr_image, name="patient_qr_image"),
+    path("barcodes/code128/<str:text>.svg", views.code128_image, name="code128_image"),
 
 
     # AJAX
@@ -51,10 +57,16 @@ urlpatterns = [
 
 
     path('update-device-results/', views.update_device_results, name='update_device_results'),
+    path('device-ingest/status/', views.device_ingest_status, name='device_ingest_status'),
+    path('dashboard/stats.json', views.dashboard_stats, name='dashboard_stats'),
      
      #واتساب
       
      path('report/pdf/<patient_id>/', views.generate_report_pdf, name='generate_report_pdf'),
+     path('report/pdf/<patient_id>/jobs/', views.enqueue_report_pdf, name='enqueue_report_pdf'),
+     path('report/jobs/<str:job_id>/', views.report_job_status, name='report_job_status'),
+     path('report/jobs/<str:job_id>/download/', views.report_job_download, name='report_job_download'),
+     path('report/batch-export/', views.batch_report_export, name='batch_report_export'),
      path('report/send-whatsapp/<int:patient_id>/', views.send_report_whatsapp, name='send_report_whatsapp'),
 
     
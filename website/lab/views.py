@@ -2,12 +2,26 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q, Count, Sum
-from django.http import JsonResponse
-from django.core.paginator import Paginator
+from django.db.models import Q, Count, F, Max, Sum, Prefetch
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.conf import settings
 from django.utils import timezone
 from .models import Patient, IndividualTest, TestGroup, TestRequest, IndividualTestResult, TestGroupResult,DeviceResult
+from .models import DailyDepartmentStat, DailyStatusStat, DailyTestStat, DailyTurnaround
 from .forms import PatientForm, TestRequestForm, IndividualTestResultForm, BulkIndividualTestResultForm, BulkTestGroupResultForm
+from .device_sync import run_ingest_cycle, pending_device_results_count, get_ingest_metrics
+from .report_builder import ReportBuilder
+from .barcodes import build_label_sheet, code128_svg, generate_patient_barcode_label_data, patient_qr_png
+from .search import search_patients
+from .typeahead import suggest
+from .pagination import keyset_paginate, page_size_from
+from .dashboard import get_stats as get_dashboard_stats
+from . import rollups, turnaround
+from .analytics import summary as analytics_summary
+from .data_export import EXPORTS, ExportUnavailable, export_filename, export_queryset, stream_csv, write_xlsx
+
+# أقصى عدد طلبات في كل قائمة من قوائم تجاوز هدف TAT
+TAT_BREACH_LIMIT = 200
 
 from datetime import datetime, timedelta
 from django.db.models import Count
@@ -59,20 +73,17 @@ from django.contrib import messages
 
 def home(request):
     """الصفحة الرئيسية"""
-    # إحصائيات سريعة
-    total_patients = Patient.objects.count()
-    total_requests = TestRequest.objects.count()
-    pending_requests = TestRequest.objects.filter(status='pending').count()
-    completed_requests = TestRequest.objects.filter(status='completed').count()
+    # إحصائيات سريعة (استعلام واحد مع كاش قصير، lab/dashboard.py)
+    stats = get_dashboard_stats()
     
     # آخر الطلبات
     recent_requests = TestRequest.objects.select_related('patient').order_by('-request_date')[:5]
     
     context = {
-        'total_patients': total_patients,
-        'total_requests': total_requests,
-        'pending_requests': pending_requests,
-        'completed_requests': completed_requests,
+        'total_patients': stats['total_patients'],
+        'total_requests': stats['total_requests'],
+        'pending_requests': stats['by_status']['pending'],
+        'completed_requests': stats['by_status']['completed'],
         'recent_requests': recent_requests,
     }
     return render(request, 'lab/home.html', context)
@@ -80,19 +91,15 @@ def home(request):
 @login_required
 def patient_list(request):
     """قائمة المرضى"""
-    update_device_results(request)
     search_query = request.GET.get('search', '')
     patients = Patient.objects.all()
     
     if search_query:
-        patients = patients.filter(
-            Q(full_name__icontains=search_query) |
-            Q(barcode__icontains=search_query)
-        )
+        patients = search_patients(search_query, patients)
     
-    paginator = Paginator(patients, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # ⚡️ صفحات بالمؤشر: نفس التكلفة لكل صفحة وبدون COUNT(*) كامل
+    page_size = page_size_from(request, getattr(settings, 'PATIENT_LIST_PAGE_SIZE', 20))
+    page_obj = keyset_paginate(request, patients, ('-created_at', '-id'), page_size)
     
     context = {
         'page_obj': page_obj,
@@ -104,7 +111,15 @@ def patient_list(request):
 def patient_detail(request, patient_id):
     """تفاصيل المريض"""
     patient = get_object_or_404(Patient, id=patient_id)
-    test_requests = TestRequest.objects.filter(patient=patient).order_by('-request_date')
+    # ⚡️ التحاليل والمجموعات بـ prefetch والسعر من total_price المخزن (عدد ثابت من الاستعلامات)
+    test_requests = (
+        TestRequest.objects.filter(patient=patient)
+        .prefetch_related(
+            Prefetch('individual_tests', queryset=IndividualTest.objects.only('id', 'name')),
+            Prefetch('test_groups', queryset=TestGroup.objects.only('id', 'name')),
+        )
+        .order_by('-request_date')
+    )
     
     context = {
         'patient': patient,
@@ -149,7 +164,7 @@ def patient_edit(request, patient_id):
 def test_list(request):
     """قائمة التحاليل"""
     individual_tests = IndividualTest.objects.filter(is_active=True).order_by('name')
-    test_groups = TestGroup.objects.filter(is_active=True).order_by('name')
+    test_groups = TestGroup.objects.filter(is_active=True).with_individual_price_sum().order_by('name')
     
     context = {
         'individual_tests': individual_tests,
@@ -159,32 +174,37 @@ def test_list(request):
 
 @login_required
 def test_request_list(request):
-    update_device_results(request)
     """قائمة طلبات التحاليل"""
     status_filter = request.GET.get('status', '')
     search_query = request.GET.get('search', '')
-    requests = TestRequest.objects.select_related('patient').all()
+    requests = TestRequest.objects.select_related('patient').prefetch_related(
+        Prefetch('individual_tests', queryset=IndividualTest.objects.only('id', 'app_name')),
+        Prefetch('test_groups', queryset=TestGroup.objects.only('id', 'app_name')),
+    )
     
     if status_filter:
         requests = requests.filter(status=status_filter)
     
     if search_query:
-        requests = requests.filter(
-            Q(patient__full_name__icontains=search_query) |
-            Q(patient__barcode__icontains=search_query)
-        )
+        requests = requests.filter(patient_id__in=search_patients(search_query).values('barcode'))
     
-    requests = requests.order_by('-request_date')
+    # الترتيب حسب نسبة الاكتمال المخزنة (بدون استعلامات لكل صف)
+    sort = request.GET.get('sort', '')
+    if sort in ('completion', '-completion'):
+        ordering = (sort.replace('completion', 'completion_percentage'), '-request_date', '-id')
+    else:
+        sort = ''
+        ordering = ('-request_date', '-id')
     
-    paginator = Paginator(requests, 5)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_size = page_size_from(request, getattr(settings, 'TEST_REQUEST_LIST_PAGE_SIZE', 20))
+    page_obj = keyset_paginate(request, requests, ordering, page_size)
     
     context = {
         'page_obj': page_obj,
         'status_filter': status_filter,
         'search_query': search_query,
         'status_choices': TestRequest.STATUS_CHOICES,
+        'sort': sort,
     }
     return render(request, 'lab/test_request_list.html', context)
 
@@ -280,10 +300,8 @@ def search_patients_ajax(request):
     patients = []
     
     if query:
-        patient_objects = Patient.objects.filter(
-            Q(full_name__icontains=query) 
-            # Q(national_id__icontains=query)
-        )[:10]
+        # ⚡️ من فهرس الذاكرة إذا كان مفعلاً (lab/typeahead.py)، وإلا بالفهارس في قاعدة البيانات (lab/search.py)
+        patient_objects = suggest(query, limit=10)
         
         patients = [
             {
@@ -299,51 +317,194 @@ def search_patients_ajax(request):
 
 @login_required
 def reports(request):
-    """صفحة التقارير مع إمكانية التصفية بين تاريخين"""
+    """صفحة التقارير مع إمكانية التصفية بين تاريخين
+
+    ⚡️ الأرقام من جداول الملخص اليومي (lab/rollups.py): صف لكل يوم × حالة/تحليل/قسم
+    بدلاً من عد كل النتائج في الفترة.
+    """
     start_date = request.GET.get('start_date')
     end_date = request.GET.get('end_date')
 
     queryset = TestRequest.objects.all()
+    days = Q()
 
     if start_date and end_date:
         try:
-            # تحويل النصوص إلى datetime
-            start_date_obj = datetime.strptime(start_date, "%Y-%m-%d")
-            end_date_obj = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
-
-            # ✅ تحويلهم إلى timezone-aware
-            start_date_obj = timezone.make_aware(start_date_obj, timezone.get_current_timezone())
-            end_date_obj = timezone.make_aware(end_date_obj, timezone.get_current_timezone())
-
-            queryset = queryset.filter(request_date__range=[start_date_obj, end_date_obj])
+            start_day = datetime.strptime(start_date, "%Y-%m-%d").date()
+            end_day = datetime.strptime(end_date, "%Y-%m-%d").date()
+
+            # ✅ حدود الأيام بالتوقيت المحلي
+            queryset = queryset.filter(
+                request_date__gte=rollups.day_bounds(start_day)[0],
+                request_date__lt=rollups.day_bounds(end_day)[1],
+            )
+            days = Q(day__range=[start_day, end_day])
         except ValueError:
             pass
 
-    # إحصائيات عامة
+    # إحصائيات عامة (عدد المرضى المختلفين لا يُجمع من أيام منفصلة فيُحسب من الطلبات)
     total_patients = queryset.aggregate(count=Count('patient', distinct=True))['count'] or 0
-    total_requests = queryset.count()
 
     # إحصائيات حسب الحالة
-    status_stats = queryset.values('status').annotate(count=Count('id'))
+    status_stats = list(
+        DailyStatusStat.objects.filter(days).order_by().values('status')
+        .annotate(count=Sum('requests')).filter(count__gt=0)
+    )
+    total_requests = sum(stat['count'] for stat in status_stats)
 
     # أكثر التحاليل طلباً
     popular_tests = (
-        IndividualTest.objects.filter(individualtestresult__test_request__in=queryset)
-        .annotate(request_count=Count('individualtestresult'))
-        .order_by('-request_count')[:10]
+        DailyTestStat.objects.filter(days).order_by().values('test', name=F('test__name'), price=F('test__price'))
+        .annotate(request_count=Sum('results')).order_by('-request_count')[:10]
     )
-    
+
+    # النتائج حسب القسم
+    departments = dict(IndividualTest.DEPARTMENT)
+    department_stats = [
+        {'department': departments.get(row['department'], row['department']), 'count': row['count']}
+        for row in DailyDepartmentStat.objects.filter(days).order_by().values('department')
+        .annotate(count=Sum('results')).filter(count__gt=0).order_by('-count')
+    ]
+
     context = {
         'total_patients': total_patients,
         'total_requests': total_requests,
         'status_stats': status_stats,
         'popular_tests': popular_tests,
+        'department_stats': department_stats,
+        'departments': IndividualTest.DEPARTMENT,
+        'result_statuses': IndividualTestResult.STATUS_CHOICES,
+        'request_statuses': TestRequest.STATUS_CHOICES,
         'start_date': start_date,
         'end_date': end_date,
     }
     return render(request, 'lab/reports.html', context)
 
 
+@login_required
+def analytics_dashboard(request):
+    """الإيراد وحجم العمل حسب اليوم والقسم والمستخدم (افتراضياً آخر سنة)، و?format=json للوحات"""
+    today = timezone.localdate()
+    start_date = request.GET.get('start_date')
+    end_date = request.GET.get('end_date')
+    try:
+        end_day = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else today
+        start_day = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else end_day - timedelta(days=364)
+    except ValueError:
+        start_day, end_day = today - timedelta(days=364), today
+    if start_day > end_day:
+        start_day, end_day = end_day, start_day
+
+    data = analytics_summary(start_day, end_day)
+    if request.GET.get('format') == 'json':
+        return JsonResponse(data)
+    return render(request, 'lab/analytics.html', {
+        'summary': data,
+        'start_date': start_day.isoformat(),
+        'end_date': end_day.isoformat(),
+    })
+
+
+@login_required
+def turnaround_dashboard(request):
+    """أزمنة الإنجاز اليومية (p50/p90/p99) والطلبات التي تجاوزت هدف TAT (افتراضياً آخر 7 أيام)"""
+    today = timezone.localdate()
+    start_date = request.GET.get('start_date')
+    end_date = request.GET.get('end_date')
+    try:
+        end_day = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else today
+        start_day = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else end_day - timedelta(days=6)
+    except ValueError:
+        start_day, end_day = today - timedelta(days=6), today
+    if start_day > end_day:
+        start_day, end_day = end_day, start_day
+
+    # النسب اليومية للكل (بدون قسم وتحليل) بالدقائق
+    metrics = DailyTurnaround.METRIC_CHOICES
+    by_day = {}
+    for row in DailyTurnaround.objects.filter(
+        day__gte=start_day, day__lte=end_day, department='', test__isnull=True,
+    ).order_by('day'):
+        by_day.setdefault(row.day, {})[row.metric] = {
+            'samples': row.samples,
+            'p50': round(row.p50 / 60), 'p90': round(row.p90 / 60), 'p99': round(row.p99 / 60),
+        }
+    daily = [
+        {'day': day, 'metrics': [values.get(metric) for metric, _ in metrics]}
+        for day, values in by_day.items()
+    ]
+
+    # طلبات مفتوحة أقدم من الهدف
+    now = timezone.now()
+    overdue = [
+        {'request': test_request, 'minutes': round((now - test_request.request_date).total_seconds() / 60)}
+        for test_request in turnaround.overdue_requests(start_day, end_day)
+        .select_related('patient').order_by('request_date')[:TAT_BREACH_LIMIT]
+    ]
+
+    # طلبات فيها نتائج تجاوزت هدف قسمها
+    late_rows = list(
+        turnaround.breached_samples(start_day, end_day).order_by().values('test_request')
+        .annotate(worst=Max('order_to_verified'), late_results=Count('result')).order_by('-worst')[:TAT_BREACH_LIMIT]
+    )
+    requests = TestRequest.objects.select_related('patient').in_bulk([row['test_request'] for row in late_rows])
+    breached = [
+        {'request': requests[row['test_request']], 'minutes': round(row['worst'] / 60), 'late_results': row['late_results']}
+        for row in late_rows if row['test_request'] in requests
+    ]
+
+    return render(request, 'lab/turnaround.html', {
+        'metrics': metrics,
+        'daily': daily,
+        'overdue': overdue,
+        'breached': breached,
+        'target_minutes': turnaround.target_minutes(),
+        'department_targets': getattr(settings, 'TAT_DEPARTMENT_TARGET_MINUTES', {}),
+        'start_date': start_day.isoformat(),
+        'end_date': end_day.isoformat(),
+    })
+
+
+@login_required
+def data_export(request):
+    """تصدير النتائج أو الطلبات: ?kind=results|requests&format=csv|xlsx
+    مع start_date / end_date / department / status اختيارياً"""
+    export = EXPORTS.get(request.GET.get('kind', 'results'))
+    if export is None:
+        return HttpResponse("نوع التصدير غير معروف.", status=400)
+    try:
+        start_date = request.GET.get('start_date')
+        end_date = request.GET.get('end_date')
+        date_from = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else None
+        date_to = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else None
+    except ValueError:
+        return HttpResponse("صيغة التاريخ غير صحيحة.", status=400)
+
+    department = request.GET.get('department') or None
+    status = request.GET.get('status') or None
+    if department and department not in dict(IndividualTest.DEPARTMENT):
+        return HttpResponse("القسم غير معروف.", status=400)
+    if status and status not in export.statuses:
+        return HttpResponse("الحالة غير معروفة.", status=400)
+
+    queryset = export_queryset(export, date_from, date_to, department, status)
+
+    if request.GET.get('format') == 'xlsx':
+        try:
+            output = write_xlsx(export, queryset)
+        except ExportUnavailable as error:
+            return HttpResponse(str(error), status=501)
+        return FileResponse(
+            output, as_attachment=True, filename=export_filename(export, 'xlsx'),
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+
+    # ⚡️ الملف يُرسل أثناء القراءة على دفعات (ذاكرة ثابتة مهما كان عدد الصفوف)
+    response = StreamingHttpResponse(stream_csv(export, queryset), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(export, "csv")}"'
+    return response
+
+
 @login_required
 def test_request_update(request, request_id):
     """تعديل طلب تحليل"""
@@ -428,105 +589,16 @@ def patient_report(request, patient_id):
     """تقرير نتائج المريض"""
     patient = get_object_or_404(Patient, id=patient_id)
     
-    # جلب جميع طلبات التحاليل للمريض
-    test_requests = TestRequest.objects.filter(patient=patient).order_by('-request_date')
-    
-    # جلب جميع النتائج الفردية للمريض
-    individual_results = IndividualTestResult.objects.filter(
-        test_request__patient=patient
-    ).select_related('individual_test', 'test_request').order_by('-result_date')
-    
-    # جلب جميع نتائج المجموعات للمريض
-    group_results = TestGroupResult.objects.filter(
-        test_request__patient=patient
-    ).select_related('test_group', 'test_request').order_by('-result_date')
-    
-    # تنظيم النتائج حسب الوصف (description)
-    results_by_description = {}
-
-    # إضافة النتائج الفردية
-    for result in individual_results:
-        test = result.individual_test
-
-                # اختيار القيم الطبيعية حسب الجنس
-        if patient.gender == "M":
-            if test.normal_value_min_m and test.normal_value_max_m:
-                normal_min = test.normal_value_min_m
-                normal_max = test.normal_value_max_m
-            else:
-                normal_min = test.normal_value_m
-                normal_max = ''
-        else:  # F
-            if test.normal_value_min_f and test.normal_value_max_f:
-                normal_min = test.normal_value_min_f
-                normal_max = test.normal_value_max_f
-            else:
-                normal_min = ''
-                normal_max = test.normal_value_f
-                
-
-        # تجهيز النطاق الطبيعي بشكل أنيق
-        if normal_min and normal_max:
-            normal_range = f"{normal_min} - {normal_max}"
-        elif normal_min:  # فقط حد أدنى
-            normal_range = str(normal_min)
-        elif normal_max:  # فقط حد أعلى
-            normal_range = str(normal_max)
-        else:
-            normal_range = ""
-
-        # استخدام الوصف كمفتاح التجميع، أو اسم التحليل إذا لم يكن هناك وصف
-        group_key = test.description.strip() if test.description.strip() else test.name
-
-        if group_key not in results_by_description:
-            results_by_description[group_key] = []
-
-        results_by_description[group_key].append({
-            'test_name': test.name,
-            'result_value': result.value,
-            'unit': test.unit,
-            'normal_range': normal_range,
-            'status': result.status,
-            'result_date': result.result_date,
-            'test_request': result.test_request,
-        })
+    # تجميع النتائج حسب الوصف (description)
+    report = ReportBuilder(group_by=ReportBuilder.GROUP_BY_DESCRIPTION, include_group_results=False).build(patient)
 
     context = {
         'patient': patient,
-        'test_requests': test_requests,
-        'group_results': group_results,
-        'results_by_description': results_by_description,
+        'requests_count': report['requests_count'],
+        'results_by_description': report['groups'],
     }
     return render(request, 'lab/patient_report.html', context)
 
-    # إضافة نتائج المجموعات
-    for result in group_results:
-        group_key = result.test_group.description.strip() if result.test_group.description.strip() else result.test_group.name
-
-        if group_key not in results_by_description:
-            results_by_description[group_key] = []
-        # نحتاج إلى جلب النتائج الفردية لهذه المجموعة
-        # لأن TestGroupResult لا يحتوي على نتائج فردية مباشرة
-        # سنعرض معلومات المجموعة فقط
-        results_by_description[group_key].append({
-            'test_name': result.test_group.name,
-            'result_value': 'مجموعة تحاليل',
-            'unit': '',
-            'normal_range': '',
-            'status': result.status,
-            'result_date': result.result_date,
-            'test_request': result.test_request,
-        })
-    
-    context = {
-        'patient': patient,
-        'test_requests': test_requests,
-        'results_by_group': results_by_description,
-        'report_date': timezone.now(),
-    }
-    
-    return render(request, 'lab/patient_report.html', context)
-
 
 @login_required
 def patient_report_print(request, patient_id):
@@ -538,89 +610,12 @@ def patient_report_print(request, patient_id):
     # تسجيل الطباعة
     PrintedReport.objects.create(patient=patient, printed_by=request.user, report_type='patient_report')
 
-    # جلب جميع طلبات التحاليل للمريض
-    test_requests = TestRequest.objects.filter(patient=patient).order_by('-request_date')
-
-    # جلب جميع النتائج الفردية للمريض مع التحاليل المرتبطة
-    individual_results = IndividualTestResult.objects.filter(
-        test_request__patient=patient
-    ).select_related('individual_test', 'test_request').order_by('-result_date')
-
-    # جلب جميع نتائج المجموعات للمريض
-    group_results = TestGroupResult.objects.filter(
-        test_request__patient=patient
-    ).select_related('test_group', 'test_request').order_by('-result_date')
-
-    # تنظيم النتائج حسب الوصف أو subclass
-    results_by_description = {}
-
-    # إضافة النتائج الفردية
-    for result in individual_results:
-        test = result.individual_test
-        group_key = (
-            test.subclass.strip()
-            if test.subclass and test.subclass.strip()
-            else test.description.strip()
-            if test.description and test.description.strip()
-            else test.name
-        )
-
-        # اختيار القيم الطبيعية حسب الجنس
-        if patient.gender == "M":
-            if test.normal_value_min_m and test.normal_value_max_m:
-                normal_min = test.normal_value_min_m
-                normal_max = test.normal_value_max_m
-            else:
-                normal_min = test.normal_value_m
-                normal_max = ''
-        else:  # F
-            if test.normal_value_min_f and test.normal_value_max_f:
-                normal_min = test.normal_value_min_f
-                normal_max = test.normal_value_max_f
-            else:
-                normal_min = ''
-                normal_max = test.normal_value_f
-                
-
-        if group_key not in results_by_description:
-            results_by_description[group_key] = []
-
-        results_by_description[group_key].append({
-            'test_name': test.name,
-            'result_value': result.value,
-            'unit': test.unit,
-            'normal_range': f"{normal_min or ''} - {normal_max or ''}".strip(' -'),
-            'status': result.status,
-            'result_date': result.result_date,
-            'test_request': result.test_request,
-            'display_order': getattr(test, 'display_order', 0),
-        })
-
-    # إضافة نتائج المجموعات
-    for result in group_results:
-        group_key = result.test_group.description.strip() if result.test_group.description.strip() else result.test_group.name
-        if group_key not in results_by_description:
-            results_by_description[group_key] = []
-
-        results_by_description[group_key].append({
-            'test_name': result.test_group.name,
-            'result_value': 'مجموعة تحاليل',
-            'unit': '',
-            'normal_range': '',
-            'status': result.status,
-            'result_date': result.result_date,
-            'test_request': result.test_request,
-            'display_order': 9999,  # دائماً في آخر القائمة
-        })
-
-    # ترتيب كل مجموعة حسب display_order
-    for group_key, results in results_by_description.items():
-        results_by_description[group_key] = sorted(results, key=lambda r: r['display_order'])
+    # تنظيم النتائج حسب subclass أو الوصف مع ترتيب التحاليل حسب display_order
+    report = ReportBuilder().build(patient)
 
     context = {
         'patient': patient,
-        'test_requests': test_requests,
-        'results_by_group': results_by_description,
+        'results_by_group': report['groups'],
         'report_date': timezone.now(),
     }
 
@@ -690,162 +685,87 @@ def test_request_barcode_label_print(request, request_id):
     return render(request, 'lab/patient_barcode_label_print.html', context)
 
 
-# -------------------------------------qr
-# في ملف utils.py أو في views.py
+@login_required
+def test_request_labels_print(request):
+    """ورقة ملصقات لكل أنابيب العينات: الطلبات المحددة (?ids=1,2) أو كل الطلبات قيد الانتظار"""
+    test_requests = TestRequest.objects.select_related('patient').prefetch_related(
+        Prefetch('individual_tests', queryset=IndividualTest.objects.only('id', 'app_name')),
+        Prefetch('test_groups', queryset=TestGroup.objects.only('id', 'app_name')),
+    ).order_by('request_date')
 
-def generate_patient_qr_code(patient_data):
-    """توليد QR Code للمريض"""
-    # print('----------',patient_data)
-    qr_data = {
-        'patient_id': str(patient_data['id']),
-        'name': patient_data['full_name'],
-        'barcode': patient_data['barcode'],
-        'phone': patient_data['phone_number'],
-        'type': 'PATIENT'
+    try:
+        request_ids = [int(value) for value in request.GET.get('ids', '').split(',') if value.strip()]
+    except ValueError:
+        return HttpResponse("أرقام الطلبات غير صحيحة.", status=400)
+    if request_ids:
+        test_requests = test_requests.filter(id__in=request_ids)
+    else:
+        test_requests = test_requests.filter(status='pending')
+
+    context = {
+        'labels': build_label_sheet(test_requests),
+        'generated_at': timezone.now(),
     }
-    
-    qr_content = json.dumps(qr_data, ensure_ascii=False)
-    
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(qr_content)
-    qr.make(fit=True)
-    
-    qr_image = qr.make_image(fill_color="black", back_color="white")
-    
-    buffer = BytesIO()
-    qr_image.save(buffer, format='PNG')
-    qr_base64 = base64.b64encode(buffer.getvalue()).decode()
-    
-    return qr_base64
+    return render(request, 'lab/test_request_labels_print.html', context)
 
 
-def generate_barcode_128(text, scale=2):
-    """توليد باركود خطي Code128 بدون نص أسفل"""
+@login_required
+def patient_qr_image(request, patient_id):
+    """صورة QR للمريض من الكاش (?v= يتغير عند تعديل الاسم أو الهاتف)"""
+    patient = get_object_or_404(Patient, id=patient_id)
+    response = HttpResponse(patient_qr_png(patient, _symbol_scale(request, 1)), content_type='image/png')
+    response['Cache-Control'] = 'private, max-age=31536000, immutable' if request.GET.get('v') else 'private, no-cache'
+    return response
+
+
+@login_required
+def code128_image(request, text):
+    """صورة باركود Code128 (SVG) من الكاش، المحتوى ثابت لنفس النص"""
     try:
-        # code128 = barcode.get_barcode_class('code128')
-        # code = code128(text, writer=ImageWriter())
-        # buffer = BytesIO()
-        # code.write(buffer, options={"write_text": False})  # 🚀 تعطيل النص
-        # barcode_base64 = base64.b64encode(buffer.getvalue()).decode("utf-8")
-        """توليد باركود Code128 بصيغة SVG عالية الوضوح"""
-        code128 = barcode.get("code128", text, writer=SVGWriter())
-
-    # إعدادات الكتابة
-        options = {
-            "module_width": 0.3 * scale,    # عرض كل خط
-            "module_height": 13 * scale,    # ارتفاع الباركود
-            "font_size": 14 * scale,        # حجم النص أسفل الباركود
-            "text_distance": 3 * scale,     # المسافة بين الباركود والنص
-            "quiet_zone": 2 * scale,        # الهامش حول الباركود
-            "write_text": False  # أهم شيء: إزالة النص أسفل الباركود
-        }
+        svg = code128_svg(text, _symbol_scale(request, 2))
+    except Exception:
+        return HttpResponse("قيمة باركود غير صالحة.", status=400)
+    response = HttpResponse(svg, content_type='image/svg+xml')
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
 
-        buffer = BytesIO()
-        code128.write(buffer, options)
-        barcode_base64 = buffer.getvalue().decode("utf-8")
-        return barcode_base64
-
-    except Exception as e:
-        print(f"خطأ في توليد الباركود: {e}")
-        return None
-
-def generate_patient_barcode_label_data(patient, test_request=None):
-    """تحضير بيانات ملصق الباركود"""
-    patient_data = {
-        'id': patient.id,
-        'full_name': patient.full_name,
-        'barcode': patient.barcode,
-        'phone_number': patient.phone_number,
-        'age': patient.age,
-        'gender_display': patient.get_gender_display(),
-        'created_at': patient.created_at.strftime('%Y-%m-%d')
-    }
-    
-    qr_code = generate_patient_qr_code(patient_data)
-    linear_barcode = generate_barcode_128(patient.barcode)
-    
-    test_info = None
-    if test_request:
-        individual_tests = list(test_request.individual_tests.values_list('app_name', flat=True))
-        test_groups = list(test_request.test_groups.values_list('app_name', flat=True))
-        test_info = {
-            'request_id': str(test_request.id),
-            'request_date': test_request.request_date.strftime('%Y-%m-%d %H:%M'),
-            'status': test_request.get_status_display(),
-            'individual_tests': individual_tests,
-            'test_groups': test_groups,
-            'notes': test_request.notes or ''
-        }
-    
-    return {
-        'patient': patient_data,
-        'qr_code': qr_code,
-        'linear_barcode': linear_barcode,
-        'test_info': test_info,
-        'generated_at': timezone.now().strftime('%Y-%m-%d %H:%M:%S')
-    }
 
+def _symbol_scale(request, default):
+    try:
+        return min(max(int(request.GET.get('scale', default)), 1), 4)
+    except ValueError:
+        return default
 
 
 
 
 def update_device_results(request):
-    # print('run this method update_device_results-------')
     """
-    دالة تحديث نتائج الأجهزة إلى IndividualTestResult
+    تشغيل دورة دمج نتائج الأجهزة يدوياً (زر "تحديث النتائج")
+    الدمج الدوري يتولاه عامل الاستيراد: python manage.py run_device_ingest
     """
-    # جلب جميع النتائج النشطة
-    active_results = DeviceResult.objects.filter(is_active=True).order_by('insert_datetime')
-    updated_count = 0
-
-    for device_result in active_results:
-        # print('device_result', device_result.barcode)
-        # ✅ إيجاد أحدث طلب تحليل يحتوي على هذا التحليل للمريض
-        test_request = TestRequest.objects.filter(patient=device_result.barcode, individual_tests=device_result.test
-                                                            ).order_by('-request_date').first()
-
-        # ✅ إذا لم يوجد في individual_tests، نبحث في test_groups
-        if not test_request:
-            test_request = TestRequest.objects.filter(patient=device_result.barcode,test_groups__tests=device_result.test
-                                                             ).order_by('-request_date').first()
-
-
-        if not test_request:
-            continue  # إذا لا يوجد طلب تحليل، تخطي
-
-        # ✅ التحقق من وجود نتيجة سابقة لنفس التحليل في الطلب
-        latest_result = IndividualTestResult.objects.filter(test_request=test_request,individual_test=device_result.test
-                                                                 ).order_by('-result_date').first()
-
-        if latest_result:
-            # تحديث فقط إذا كانت النتيجة الجديدة أحدث
-            if latest_result.result_date <= device_result.insert_datetime:
-                latest_result.value = device_result.result
-                latest_result.result_date = device_result.insert_datetime
-                latest_result.entered_by = request.user if request.user.is_authenticated else None
-                latest_result.save()
-                updated_count += 1
-        else:
-            # إدخال نتيجة جديدة
-            IndividualTestResult.objects.create(test_request=test_request,individual_test=device_result.test,value=device_result.result,
-                result_date=device_result.insert_datetime,entered_by=request.user if request.user.is_authenticated else None
-                )
-            updated_count += 1
-
-        # ✅ تعطيل النتيجة في DeviceResult
-        device_result.is_active = False
-        device_result.save(update_fields=['is_active'])
-
-    # رسالة نجاح
-    # messages.success(request, f"{updated_count} نتيجة تم تحديثها بنجاح.")
+    user = request.user if request.user.is_authenticated else None
+    run_ingest_cycle(user)
     return redirect(request.META.get('HTTP_REFERER', '/'))
 
 
+def dashboard_stats(request):
+    """إحصائيات الرئيسية كـ JSON لشاشات العرض (نفس الكاش)"""
+    stats = get_dashboard_stats()
+    response = JsonResponse({key: value for key, value in stats.items() if key != 'expires_at'})
+    response['Cache-Control'] = f"public, max-age={getattr(settings, 'DASHBOARD_STATS_TTL', 30)}"
+    return response
+
+
+@login_required
+def device_ingest_status(request):
+    """قياسات عامل استيراد نتائج الأجهزة (عمق الطابور وزمن آخر دمج)"""
+    return JsonResponse({
+        'queue_depth': pending_device_results_count(),
+        'last_cycle': get_ingest_metrics(),
+    })
+
+
 
 
 def delete_individual_test(request, patient_id, request_id, test_id):
@@ -965,116 +885,123 @@ from django.utils import timezone
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import get_object_or_404
 
+from django.http import HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_POST
+
 from .models import Patient, TestRequest, IndividualTestResult, TestGroupResult
+from .report_pdf import get_report_pdf, read_cached_pdf, report_digest
+from .report_jobs import enqueue_report, get_job as get_report_job
+from .report_export import ReportRenderError, merged_pdf, select_patients, select_requests, stream_zip
 
 @login_required
 def generate_report_pdf(request, patient_id):
     """توليد تقرير PDF لنتائج المريض"""
     patient = get_object_or_404(Patient, id=patient_id)
 
-    # جلب جميع طلبات التحاليل
-    test_requests = TestRequest.objects.filter(patient=patient).order_by('-request_date')
+    # تنظيم النتائج حسب subclass أو description
+    report = ReportBuilder().build(patient)
 
-    if not test_requests.exists():
+    if not report['requests_count']:
         return HttpResponse("لا يوجد طلبات فحص لهذا المريض.", status=404)
 
-    # جلب جميع النتائج الفردية
-    individual_results = IndividualTestResult.objects.filter(
-        test_request__patient=patient
-    ).select_related('individual_test', 'test_request').order_by('-result_date')
-
-    # جلب جميع نتائج المجموعات
-    group_results = TestGroupResult.objects.filter(
-        test_request__patient=patient
-    ).select_related('test_group', 'test_request').order_by('-result_date')
-
-    # تنظيم النتائج حسب subclass أو description
-    results_by_group = {}
-
-    for result in individual_results:
-        test = result.individual_test
-
-        # اختيار التصنيف المناسب للتجميع
-        group_key = (
-            test.subclass.strip()
-            if test.subclass and test.subclass.strip()
-            else test.description.strip()
-            if test.description and test.description.strip()
-            else test.name
-        )
-
-        # تحديد القيم الطبيعية حسب الجنس
-        if patient.gender == "M":
-            normal_min = test.normal_value_min_m or test.normal_value_m or ''
-            normal_max = test.normal_value_max_m or ''
-        else:
-            normal_min = test.normal_value_min_f or ''
-            normal_max = test.normal_value_max_f or test.normal_value_f or ''
-
-        # إعداد النطاق الطبيعي
-        if normal_min and normal_max:
-            normal_range = f"{normal_min} - {normal_max}"
-        elif normal_min:
-            normal_range = str(normal_min)
-        elif normal_max:
-            normal_range = str(normal_max)
-        else:
-            normal_range = ""
-
-        if group_key not in results_by_group:
-            results_by_group[group_key] = []
-
-        results_by_group[group_key].append({
-            'test_name': test.name,
-            'result_value': result.value,
-            'unit': test.unit,
-            'normal_range': normal_range,
-            'status': result.status,
-            'result_date': result.result_date,
-            'display_order': getattr(test, 'display_order', 0),
-        })
-
-    # إضافة نتائج المجموعات
-    for result in group_results:
-        group_key = result.test_group.description.strip() if result.test_group.description.strip() else result.test_group.name
-
-        if group_key not in results_by_group:
-            results_by_group[group_key] = []
-
-        results_by_group[group_key].append({
-            'test_name': result.test_group.name,
-            'result_value': 'مجموعة تحاليل',
-            'unit': '',
-            'normal_range': '',
-            'status': result.status,
-            'result_date': result.result_date,
-            'display_order': 9999,  # دائماً في الأخير
-        })
-
-    # ترتيب كل مجموعة حسب display_order
-    for group_key, items in results_by_group.items():
-        results_by_group[group_key] = sorted(items, key=lambda x: x['display_order'])
-
-    # إنشاء HTML من القالب
-    html_string = render_to_string('lab/patient_report_print.html', {
-        "patient": patient,
-        "results_by_group": results_by_group,
-        "report_date": timezone.now()
-    })
+    # ⚡️ إذا لم تتغير النتائج ولا القالب: المتصفح يملك نفس النسخة (ETag) أو نعيدها من الكاش
+    digest = report_digest(patient, report)
+    etag = f'"{digest}"'
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
 
-    # إنشاء PDF
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as output:
-        HTML(string=html_string, base_url=request.build_absolute_uri()).write_pdf(
-            output.name,
-            stylesheets=[CSS(string='@page { size: A4; margin: 2cm 1.5cm; }')]
-        )
-        output.seek(0)
-        pdf_data = output.read()
+    # إنشاء PDF في الذاكرة (أو قراءته من الكاش)
+    digest, pdf_data = get_report_pdf(patient, base_url=request.build_absolute_uri(), report=report)
 
     filename = f"report_{slugify(patient.full_name)}.pdf"
     #/patients/26/report/print/
     response = HttpResponse(pdf_data, content_type='application/pdf')
     response['Content-Disposition'] = f'inline; filename="{filename}"'
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _report_job_payload(job):
+    payload = dict(job)
+    payload['status_url'] = reverse('report_job_status', args=[job['id']])
+    if job['status'] == 'done':
+        payload['download_url'] = reverse('report_job_download', args=[job['id']])
+    return payload
+
+
+@login_required
+@require_POST
+def enqueue_report_pdf(request, patient_id):
+    """إضافة توليد PDF تقرير المريض إلى طابور الخلفية وإرجاع رقم المهمة"""
+    patient = get_object_or_404(Patient, id=patient_id)
+    report = ReportBuilder().build(patient)
+    if not report['requests_count']:
+        return JsonResponse({'error': 'لا يوجد طلبات فحص لهذا المريض.'}, status=404)
+
+    job = enqueue_report(patient, base_url=request.build_absolute_uri(), report=report)
+    return JsonResponse(_report_job_payload(job), status=202 if job['status'] == 'pending' else 200)
+
+
+@login_required
+def report_job_status(request, job_id):
+    """حالة مهمة توليد التقرير (pending / done / failed)"""
+    job = get_report_job(job_id)
+    if job is None:
+        return JsonResponse({'error': 'المهمة غير موجودة أو انتهت صلاحيتها.'}, status=404)
+    return JsonResponse(_report_job_payload(job))
+
+
+@login_required
+def report_job_download(request, job_id):
+    """تحميل ملف PDF الناتج عن مهمة منتهية"""
+    job = get_report_job(job_id)
+    pdf_data = read_cached_pdf(job['patient_id'], job['digest']) if job and job['status'] == 'done' else None
+    if pdf_data is None:
+        return HttpResponse("الملف غير جاهز أو تم تحديث التقرير، أعد طلب التوليد.", status=404)
+
+    response = HttpResponse(pdf_data, content_type='application/pdf')
+    response['Content-Disposition'] = f'inline; filename="report_{job["patient_id"]}.pdf"'
+    response['ETag'] = f'"{job["digest"]}"'
+    return response
+
+
+@login_required
+def batch_report_export(request):
+    """تصدير تقارير عدة مرضى: ?start_date=&end_date= أو ?request_ids=1,2,3 و format=zip|pdf"""
+    try:
+        start_date = request.GET.get('start_date')
+        end_date = request.GET.get('end_date')
+        date_from = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else None
+        date_to = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else None
+        request_ids = [int(value) for value in request.GET.get('request_ids', '').split(',') if value.strip()]
+    except ValueError:
+        return HttpResponse("صيغة التاريخ أو أرقام الطلبات غير صحيحة.", status=400)
+
+    if not (date_from or date_to or request_ids):
+        return HttpResponse("حدد فترة زمنية أو أرقام طلبات.", status=400)
+
+    requests = select_requests(date_from, date_to, request_ids)
+    patients = list(select_patients(requests))
+    if not patients:
+        return HttpResponse("لا يوجد طلبات فحص ضمن التحديد.", status=404)
+
+    base_url = request.build_absolute_uri('/')
+    try:
+        if request.GET.get('format') == 'pdf':
+            response = HttpResponse(merged_pdf(patients, base_url, requests), content_type='application/pdf')
+            response['Content-Disposition'] = 'inline; filename="reports.pdf"'
+            return response
+        chunks = stream_zip(patients, base_url, requests)
+    except ReportRenderError as error:
+        return HttpResponse(str(error), status=503)
+
+    # ⚡️ الأرشيف يُرسل أثناء التوليد (كل تقرير فور انتهائه)
+    response = StreamingHttpResponse(chunks, content_type='application/zip')
+    response['Content-Disposition'] = 'attachment; filename="reports.zip"'
     return response
 
 
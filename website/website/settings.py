@@ -181,3 +181,58 @@ LOGOUT_REDIRECT_URL = 'login'
 # LOGIN_URL = '/admin/login/'
 # LOGIN_REDIRECT_URL = '/'
 # LOGOUT_REDIRECT_URL = '/'
+
+
+# مجلد ملفات الكاش (تحتوي بيانات مرضى): خارج مجلد المشروع، ويمكن تغييره بـ LAB_CACHE_ROOT
+CACHE_ROOT = Path(os.environ.get('LAB_CACHE_ROOT') or Path.home() / '.cache' / 'lab')
+
+# Cache (ملفات مشتركة بين عمليات الويب وعامل استيراد نتائج الأجهزة)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': CACHE_ROOT / 'cache',
+    }
+}
+
+# عامل استيراد نتائج الأجهزة: python manage.py run_device_ingest
+DEVICE_INGEST_POLL_INTERVAL = 5  # ثواني
+
+# كاش ملفات PDF لتقارير المرضى (حسب المحتوى)
+REPORT_PDF_CACHE_DIR = CACHE_ROOT / 'report_cache'
+# تُزاد عند تغيير ما يظهر في التقرير من خارج القوالب (خطوط، صور، CSS ثابت) لتجاهل الكاش القديم
+REPORT_TEMPLATE_VERSION = '1'
+
+# عدد عمليات توليد PDF في الخلفية (افتراضياً عدد أنوية المعالج)
+REPORT_RENDER_WORKERS = None
+
+# مهمة توليد PDF معلقة أكثر من هذه المدة (ثواني) تُعتبر فاشلة وتُعاد عند الطلب التالي
+REPORT_RENDER_TIMEOUT = 300
+
+# كاش صور الباركود و QR للملصقات
+BARCODE_CACHE_DIR = CACHE_ROOT / 'barcode_cache'
+BARCODE_CACHE_MAX_FILES = 20000  # تُحذف الأقدم عند تجاوز العدد
+
+# باركود المرضى: عدد الأرقام التي تحجزها كل عملية من العداد اليومي دفعة واحدة
+PATIENT_BARCODE_BLOCK_SIZE = 20
+
+# فهرس بحث المرضى في ذاكرة كل عملية للإكمال التلقائي (بدون استعلام لكل حرف)
+PATIENT_TYPEAHEAD_INDEX = False
+PATIENT_TYPEAHEAD_MAX_PATIENTS = 200000  # حد الذاكرة (حوالي 80MB لكل عملية): أحدث المرضى فقط
+PATIENT_TYPEAHEAD_RECONCILE_SECONDS = 60  # مزامنة تعديلات العمليات الأخرى
+
+# قوائم المرضى والطلبات: عدد الصفوف في الصفحة (يمكن تغييره بـ ?per_page=) وعرض عدد تقريبي
+PATIENT_LIST_PAGE_SIZE = 20
+TEST_REQUEST_LIST_PAGE_SIZE = 20
+LIST_APPROXIMATE_COUNT = True
+
+# إحصائيات الصفحة الرئيسية (و dashboard/stats.json): مدة الكاش بالثواني
+DASHBOARD_STATS_TTL = 30
+
+# تحليلات الإيراد وحجم العمل: مدة كاش الأشهر المنتهية بالثواني
+ANALYTICS_CLOSED_PERIOD_TTL = 7 * 24 * 3600
+
+# أزمنة الإنجاز (TAT): الهدف من الطلب حتى اعتماد النتيجة بالدقائق (مع هدف خاص لبعض الأقسام)
+TAT_TARGET_MINUTES = 240
+TAT_DEPARTMENT_TARGET_MINUTES = {}  # مثلاً {'hematology': 60}
+TAT_PIPELINE_INTERVAL = 60  # run_tat_pipeline: الفترة بين الدورات بالثواني
+TAT_REPORT_LOOKBACK_DAYS = 7  # مدة انتظار طباعة التقرير للنتيجة